@@ -0,0 +1,25 @@
+"""Benchmarks and load tests for the engine, run entirely on this machine.
+
+A paramiko SSH/SFTP server (fakecluster.py) stands in for the login node; its
+sbatch/squeue/sinfo/sacct (fakeslurm.py) simulate thousands of jobs with a
+configurable per-command latency, and synthetic output trees feed the transfers.
+For packed submissions sbatch and srun really run the batch script, with a stub
+matlab (fakematlab.py) speaking the packed worker's protocol.
+Scenarios:
+    ssh       exec round trips through the SSHClientEnhanced pool
+    submit    HPCEngine.submit (bundle upload, sbatch file, sbatch)
+    watcher   job watcher cycle time vs. job count, idle and with every job finishing
+    pack      HPCEngine.submit_pack run to the end: task throughput and packing efficiency
+    transfer  HPCEngine.sync MB/s for small and large files, tar and SFTP, and a re-sync from the result cache
+    db        job inserts, status updates and power samples per second, history pages
+    gui       Qt event loop stalls while the dashboard follows a busy cluster; exits 1 when
+              a stall exceeds 250 ms or the p99 exceeds 50 ms (--gui-stall-max-ms/-p99-ms)
+
+Run from PythonApp/ (needs paramiko; the gui scenario also PyQt5 and matplotlib):
+    python -m bench                          all scenarios, saved to bench/results/
+    python -m bench --only watcher --jobs 100 1000 --latency 0.2
+    python -m bench --compare results/A.json results/B.json
+    python -m bench --compare results/A.json  a fresh run against A
+The engine runs with HOME and the working directory in a scratch folder, so the
+real ~/.hpc_dashboard.db and config are never touched.
+"""
@@ -0,0 +1,205 @@
+"""A Slurm cluster stand-in on localhost: a paramiko SSH/SFTP server whose commands run
+in a scratch directory with fake sbatch/squeue/sinfo/sacct/srun (see fakeslurm.py) and
+a stub matlab (fakematlab.py) first on PATH. Every login is accepted; paths are real
+local paths, so the remote base and the shared folder are directories under the
+cluster's root.
+"""
+import json, logging, os, random, shutil, socket, stat, subprocess, sys, threading, time
+from pathlib import Path
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_OK
+
+from .fakeslurm import COMMANDS, DEFAULTS, job_line
+
+BENCH_DIR = Path(__file__).resolve().parent
+SERVER_LOG = 'bench.fakesshd'            # clients hanging up mid-session are normal here; keep it quiet
+logging.getLogger(SERVER_LOG).setLevel(logging.CRITICAL)
+# `ssh NODE CMD` from the telemetry probe just runs CMD here
+FAKE_SSH = '''#!/bin/sh
+while [ $# -gt 0 ]; do case "$1" in -o) shift 2;; -*) shift;; *) break;; esac; done
+shift; exec sh -c "$*"
+'''
+
+# ---------- SFTP ----------
+def _sftp_errors(fn):
+    def wrapper(*args):
+        try: return fn(*args)
+        except OSError as e: return SFTPServer.convert_errno(e.errno)
+    return wrapper
+
+class _Handle(SFTPHandle):
+    def stat(self):
+        try: return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e: return SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+class _SFTP(SFTPServerInterface):
+    """Relative paths are relative to the cluster's home, as on a real login node."""
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs); self.home = str(server.cluster.home)
+
+    def _path(self, path):
+        return os.path.join(self.home, path)
+
+    @_sftp_errors
+    def list_folder(self, path):
+        path = self._path(path)
+        out = []
+        for name in os.listdir(path):
+            a = SFTPAttributes.from_stat(os.lstat(os.path.join(path, name))); a.filename = name; out.append(a)
+        return out
+
+    @_sftp_errors
+    def stat(self, path): return SFTPAttributes.from_stat(os.stat(self._path(path)))
+
+    @_sftp_errors
+    def lstat(self, path): return SFTPAttributes.from_stat(os.lstat(self._path(path)))
+
+    @_sftp_errors
+    def open(self, path, flags, attr):
+        path = self._path(path); fd = os.open(path, flags, 0o644)
+        if flags & os.O_WRONLY: mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR: mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else: mode = 'rb'
+        h = _Handle(flags); h.filename = path; h.readfile = h.writefile = os.fdopen(fd, mode)
+        return h
+
+    @_sftp_errors
+    def remove(self, path): os.remove(self._path(path)); return SFTP_OK
+
+    @_sftp_errors
+    def rename(self, old, new): os.rename(self._path(old), self._path(new)); return SFTP_OK
+    posix_rename = rename
+
+    @_sftp_errors
+    def mkdir(self, path, attr): os.mkdir(self._path(path)); return SFTP_OK
+
+    @_sftp_errors
+    def rmdir(self, path): os.rmdir(self._path(path)); return SFTP_OK
+
+    @_sftp_errors
+    def chattr(self, path, attr):
+        if attr.st_mtime is not None: os.utime(self._path(path), (attr.st_atime or attr.st_mtime, attr.st_mtime))
+        return SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.abspath(self._path(path or '.'))
+
+# ---------- SSH ----------
+class _Server(paramiko.ServerInterface):
+    def __init__(self, cluster): self.cluster = cluster
+    def check_channel_request(self, kind, chanid): return paramiko.OPEN_SUCCEEDED
+    def check_auth_password(self, username, password): return paramiko.AUTH_SUCCESSFUL
+    def check_auth_publickey(self, username, key): return paramiko.AUTH_SUCCESSFUL
+    def check_auth_none(self, username): return paramiko.AUTH_SUCCESSFUL
+    def get_allowed_auths(self, username): return 'none,password,publickey'
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self.cluster._run, args=(channel, command.decode()), daemon=True).start()
+        return True
+
+class FakeCluster:
+    """Start with start(); `port` is then the SSH port. remote_base and shared are the
+    paths to hand to the engine; jobs are added by sbatch or seed_jobs()."""
+    def __init__(self, root, **slurm):
+        self.root = Path(root).resolve(); self.bin = self.root / 'bin'; self.home = self.root / 'home'
+        self.remote_base = str(self.home); self.shared = str(self.root / 'shared')
+        self.slurm_dir = self.root / 'slurm'; self.port = None
+        self._sock = None; self._transports = []; self._stopped = threading.Event()
+        self.host_key = paramiko.RSAKey.generate(2048)
+        for d in (self.bin, self.home, self.slurm_dir, Path(self.shared) / 'outputs'): d.mkdir(parents=True, exist_ok=True)
+        for name in COMMANDS:
+            self._script(name, f'#!/bin/sh\nexec "{sys.executable}" "{BENCH_DIR / "fakeslurm.py"}" {name} "$@"\n')
+        self._script('matlab', f'#!/bin/sh\nexec "{sys.executable}" "{BENCH_DIR / "fakematlab.py"}" "$@"\n')
+        self._script('ssh', FAKE_SSH)
+        self.configure(**slurm)
+        self.env = dict(os.environ, PATH=f"{self.bin}{os.pathsep}{os.environ.get('PATH', '')}", HOME=str(self.home),
+                        FAKE_SLURM_DIR=str(self.slurm_dir))
+
+    def _script(self, name, text):
+        p = self.bin / name; p.write_text(text); p.chmod(p.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    def configure(self, **slurm):
+        """Change fakeslurm settings (latency, nodes, cpus_per_node, pending, runtime, fail_rate,
+        execute, task_seconds, task_fail_rate)."""
+        path = self.slurm_dir / 'config.json'
+        cfg = json.loads(path.read_text()) if path.exists() else {}
+        unknown = set(slurm) - set(DEFAULTS)
+        if unknown: raise ValueError(f"unknown fake Slurm settings: {sorted(unknown)}")
+        cfg.update(slurm); path.write_text(json.dumps(cfg))
+
+    def reset_jobs(self):
+        (self.slurm_dir / 'jobs.txt').unlink(missing_ok=True)
+
+    def seed_jobs(self, count, pending=3600.0, runtime=3600.0, name='bench', rng=None):
+        """Add count jobs submitted now (by default queued for the next hour). Returns their ids."""
+        rng = rng or random.Random(count); path = self.slurm_dir / 'jobs.txt'
+        first = DEFAULTS['first_jobid'] + (sum(1 for _ in path.open()) if path.exists() else 0)
+        ids = [str(first + i) for i in range(count)]; now = time.time()
+        with path.open('a') as f:
+            f.writelines(job_line(j, now, pending, runtime, 'COMPLETED', 4, rng.randint(100_000, 4_000_000), name) for j in ids)
+        return ids
+
+    def make_output_tree(self, files, size, depth=2, fanout=4, name='outputs', seed=0):
+        """Fill <shared>/<name> with `files` files of about `size` bytes (text-like, so it
+        compresses like job output) spread over `depth` levels of `fanout` folders.
+        Returns the total bytes written."""
+        root = Path(self.shared) / name; shutil.rmtree(root, ignore_errors=True)
+        rng = random.Random(seed); total = 0
+        words = [f"{w} " for w in ('iter', 'loss', 'alpha', 'beta', 'gamma', 'done', 'epoch', 'value')]
+        for i in range(files):
+            parts = [f"d{(i // fanout ** k) % fanout}" for k in range(depth, 0, -1)]
+            p = root.joinpath(*parts, f"result_{i:05d}.txt"); p.parent.mkdir(parents=True, exist_ok=True)
+            chunk = ''.join(f"{rng.choice(words)}{rng.random():.6f}\n" for _ in range(64)).encode()
+            data = (chunk * (size // len(chunk) + 1))[:size]
+            p.write_bytes(data); total += len(data)
+        return total
+
+    # --- server ---
+    def start(self):
+        self._sock = socket.socket(); self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('127.0.0.1', 0)); self._sock.listen(100); self.port = self._sock.getsockname()[1]
+        threading.Thread(target=self._accept, name='fake-sshd', daemon=True).start()
+        return self
+
+    def _accept(self):
+        while not self._stopped.is_set():
+            try: sock, _ = self._sock.accept()
+            except OSError: return
+            t = paramiko.Transport(sock); t.set_log_channel(SERVER_LOG); t.add_server_key(self.host_key)
+            t.set_subsystem_handler('sftp', SFTPServer, _SFTP)
+            self._transports.append(t)
+            try: t.start_server(server=_Server(self))
+            except (paramiko.SSHException, EOFError, OSError): pass
+
+    def _run(self, channel, command):
+        p = subprocess.Popen(['/bin/sh', '-c', command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             env=self.env, cwd=self.home)
+        def feed():
+            try:
+                for data in iter(lambda: channel.recv(65536), b''): p.stdin.write(data); p.stdin.flush()
+            except (OSError, EOFError, paramiko.SSHException): pass
+            try: p.stdin.close()
+            except OSError: pass
+        def errors():
+            for data in iter(lambda: p.stderr.read1(65536), b''): channel.sendall_stderr(data)
+        threading.Thread(target=feed, daemon=True).start()
+        err = threading.Thread(target=errors, daemon=True); err.start()
+        try:
+            for data in iter(lambda: p.stdout.read1(65536), b''): channel.sendall(data)
+        except (OSError, EOFError, paramiko.SSHException): p.kill()
+        rc = p.wait(); err.join(2)
+        try: channel.send_exit_status(rc if rc >= 0 else 128 - rc); channel.shutdown_write(); channel.close()
+        except (OSError, EOFError, paramiko.SSHException): pass
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock: self._sock.close()
+        for t in self._transports: t.close()
+        self._transports = []
+
+    def __enter__(self): return self.start()
+    def __exit__(self, *exc): self.stop()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Stand-in for `matlab -nodisplay -r "..."` on the fake cluster.
+
+A call of the packed-task worker (hpc_pack_worker, PACK_WORKER_M in hpc_engine.py) is
+carried out with the worker's own protocol: chunks of tasks claimed by mkdir in locks/,
+task_<i>.mat and task_<i>.done in outputs/, and one tab-separated line per task
+state in outputs/progress_<worker>.log. Each task sleeps task_seconds and fails at
+task_fail_rate (fake Slurm config.json). Any other -r command is printed and succeeds.
+"""
+import math, os, random, re, sys, time
+
+from fakeslurm import config
+
+MATLAB_STRING = r"'(?:[^']|'')*'"
+WORKER_CALL_RE = re.compile(rf"hpc_pack_worker\(((?:{MATLAB_STRING}|[^')])*)\)")
+MATLAB_ARG_RE = re.compile(rf"({MATLAB_STRING})|([\d.]+)")
+
+def matlab_args(text):
+    """Char literals and numbers of a MATLAB argument list."""
+    return [s[1:-1].replace("''", "'") if s else int(n) if n.isdigit() else float(n) for s, n in MATLAB_ARG_RE.findall(text)]
+
+def write_line(path, line, mode):
+    with open(path, mode) as f: f.write(line + '\n')
+
+def pack_worker(fn, inputs, locks, outputs, chunk, cfg):
+    worker = int(os.environ.get('SLURM_PROCID', '0')); nworkers = max(1, int(os.environ.get('SLURM_NTASKS', '1')))
+    with open(os.path.join(inputs, 'tasks.txt')) as f: lines = f.read().splitlines()
+    ntasks = len(lines); nchunks = math.ceil(ntasks / chunk)
+    progress = os.path.join(outputs, f"progress_{worker}.log")
+    first = worker * nchunks // nworkers
+    for k in range(nchunks):
+        c = (first + k) % nchunks
+        try: os.mkdir(os.path.join(locks, f"chunk_{c}"))
+        except FileExistsError: continue
+        for task in range(c * chunk, min(ntasks, (c + 1) * chunk)):
+            write_line(progress, f"{task}\tRUNNING\t{worker}\t\t", 'a')
+            t0 = time.time(); time.sleep(float(cfg['task_seconds']))
+            if random.Random(f"{outputs}:{task}").random() < float(cfg['task_fail_rate']):
+                status, err = 'FAILED', f"stub failure in {fn}({lines[task]})"
+            else:
+                status, err = 'COMPLETED', ''
+                write_line(os.path.join(outputs, f"task_{task}.mat"), f"{fn}({lines[task]})", 'w')
+            line = f"{task}\t{status}\t{worker}\t{time.time() - t0:.3f}\t{err}"
+            write_line(os.path.join(outputs, f"task_{task}.done"), line, 'w')
+            write_line(progress, line, 'a')
+
+if __name__ == '__main__':
+    argv = sys.argv[1:]
+    command = argv[argv.index('-r') + 1] if '-r' in argv else ''
+    m = WORKER_CALL_RE.search(command)
+    if m: pack_worker(*matlab_args(m.group(1)), config())
+    else: print(f"fake matlab: {command}")
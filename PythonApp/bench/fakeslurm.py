@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Stand-ins for sbatch, squeue, sinfo and sacct, run by the fake SSH server.
+
+Invoked as `fakeslurm.py COMMAND ARGS...` through the wrappers FakeCluster installs.
+Jobs live in <root>/jobs.txt, one line each: jobid submit_ts pending_s runtime_s
+final_state cpus max_rss_kb name. A job's state is a function of the clock:
+PENDING for pending_s, RUNNING for runtime_s, then final_state. squeue only lists
+jobs still queued, so finished jobs are found through sacct as on a real cluster.
+<root>/config.json holds latency (seconds added to every command), nodes,
+cpus_per_node and the pending/runtime/fail_rate used by sbatch.
+
+With `execute` set, sbatch really runs the batch script in the background instead
+(srun starting --ntasks copies of its command); such jobs are RUNNING until the script
+exits and then COMPLETED or FAILED by its exit status, kept in <root>/exit_<jobid>.
+task_seconds and task_fail_rate are read by the stub matlab (fakematlab.py).
+"""
+import fcntl, json, os, random, re, subprocess, sys, time
+
+ROOT = os.environ.get('FAKE_SLURM_DIR') or os.path.dirname(os.path.abspath(__file__))
+JOBS = os.path.join(ROOT, 'jobs.txt')
+DEFAULTS = {'latency': 0.0, 'nodes': 8, 'cpus_per_node': 16, 'pending': 5.0, 'runtime': 30.0, 'fail_rate': 0.1, 'first_jobid': 1000,
+            'execute': False, 'task_seconds': 0.05, 'task_fail_rate': 0.0}
+ACTIVE = ('PENDING', 'RUNNING')
+
+def config():
+    try:
+        with open(os.path.join(ROOT, 'config.json')) as f: return dict(DEFAULTS, **json.load(f))
+    except (OSError, ValueError): return dict(DEFAULTS)
+
+def load_jobs():
+    jobs = []
+    try:
+        with open(JOBS) as f:
+            for line in f:
+                p = line.split()
+                if len(p) >= 8:
+                    jobs.append({'id': p[0], 'submit': float(p[1]), 'pending': float(p[2]), 'runtime': float(p[3]),
+                                 'final': p[4], 'cpus': int(p[5]), 'rss': int(p[6]), 'name': p[7]})
+    except OSError: pass
+    return jobs
+
+def job_line(jobid, submit, pending, runtime, final, cpus, rss, name):
+    return f"{jobid} {submit:.3f} {pending:.3f} {runtime:.3f} {final} {cpus} {rss} {name}\n"
+
+def state(job, now):
+    if job['runtime'] < 0: return executed_state(job, now)
+    t = now - job['submit']
+    if t < job['pending']: return 'PENDING', 0.0
+    if t < job['pending'] + job['runtime']: return 'RUNNING', t - job['pending']
+    return job['final'], job['runtime']
+
+def exit_path(jobid):
+    return os.path.join(ROOT, f"exit_{jobid}")
+
+def executed_state(job, now):
+    try:
+        with open(exit_path(job['id'])) as f: rc = int(f.read().strip() or 1)
+        return ('COMPLETED' if rc == 0 else 'FAILED'), os.path.getmtime(exit_path(job['id'])) - job['submit']
+    except (OSError, ValueError): return 'RUNNING', now - job['submit']
+
+def hms(secs):
+    secs = int(secs); return f"{secs // 3600:02d}:{secs % 3600 // 60:02d}:{secs % 60:02d}"
+
+def options(argv):
+    """{flag: value} of the -x VALUE / --name=VALUE options in argv; lone flags map to True."""
+    opts, i = {}, 0
+    while i < len(argv):
+        a = argv[i]
+        if a.startswith('--') and '=' in a: k, v = a.split('=', 1); opts[k] = v
+        elif a.startswith('-') and i + 1 < len(argv) and not argv[i + 1].startswith('-'): opts[a] = argv[i + 1]; i += 1
+        elif a.startswith('-'): opts[a] = True
+        i += 1
+    return opts
+
+def selected(jobs, opts):
+    ids = opts.get('-j') or opts.get('--jobs')
+    if not ids or ids is True: return jobs
+    want = set(ids.split(','))
+    return [j for j in jobs if j['id'] in want]
+
+# ---------- commands ----------
+def sbatch(argv, cfg):
+    path = argv[-1]
+    with open(path) as f: text = f.read()
+    name = (re.search(r'--job-name=(\S+)', text) or [None, 'job'])[1]
+    output = (re.search(r'--output=(\S+)', text) or [None, ''])[1]
+    cpus = int((re.search(r'--cpus-per-task=(\d+)', text) or [None, '1'])[1])
+    ntasks = int((re.search(r'--ntasks=(\d+)', text) or [None, '1'])[1])
+    with open(JOBS, 'a+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0); jobid = str(int(cfg['first_jobid']) + sum(1 for _ in f))
+        rng = random.Random(jobid)
+        final = 'FAILED' if rng.random() < cfg['fail_rate'] else 'COMPLETED'
+        pending, runtime = (0.0, -1.0) if cfg['execute'] else (rng.uniform(0.5, 1.5) * cfg['pending'], rng.uniform(0.5, 1.5) * cfg['runtime'])
+        f.write(job_line(jobid, time.time(), pending, runtime, final, cpus * ntasks, rng.randint(100_000, 4_000_000), name))
+    if cfg['execute']:
+        out = (output or f"slurm-{jobid}.out").replace('%j', jobid)
+        env = dict(os.environ, SLURM_JOB_ID=jobid, SLURM_NTASKS=str(ntasks), SLURM_CPUS_PER_TASK=str(cpus))
+        subprocess.Popen(['/bin/sh', '-c', 'bash "$1" > "$2" 2>&1; echo $? > "$3"', 'sbatch', path, out, exit_path(jobid)], env=env,
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    elif output:
+        out = output.replace('%j', jobid)
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        with open(out, 'w') as f: f.writelines(f"{name} step {i}\n" for i in range(100))
+    print(f"Submitted batch job {jobid}")
+
+def squeue(argv, cfg):
+    opts = options(argv); fmt = opts.get('-o', '%i|%u|%P|%j|%T|%M|%D|%C|%R'); now = time.time()
+    for j in selected(load_jobs(), opts):
+        st, elapsed = state(j, now)
+        if st not in ACTIVE: continue
+        if fmt.strip() == '%i %T': print(j['id'], st); continue
+        where = '(Priority)' if st == 'PENDING' else f"n{int(j['id']) % cfg['nodes']:03d}"
+        print(f"{j['id']}|bench|batch|{j['name']}|{st}|{hms(elapsed)}|1|{j['cpus']}|{where}")
+
+def sinfo(argv, cfg):
+    now = time.time(); per = int(cfg['cpus_per_node']); nodes = int(cfg['nodes'])
+    busy = [0] * nodes
+    for j in load_jobs():
+        if state(j, now)[0] == 'RUNNING': busy[int(j['id']) % nodes] += j['cpus']
+    for i in range(nodes):
+        alloc = min(busy[i], per); st = 'idle' if not alloc else ('allocated' if alloc == per else 'mixed')
+        print(f"n{i:03d}|batch*|{st}|{alloc}/{per - alloc}/0/{per}|65536|{65536 - alloc * 2048}|{alloc / 4:.2f}|(null)")
+
+def sacct(argv, cfg):
+    opts = options(argv); fields = str(opts.get('-o', 'JobID,State')).split(','); now = time.time()
+    for j in selected(load_jobs(), opts):
+        st, elapsed = state(j, now)
+        run = st != 'PENDING'
+        values = {'JobID': j['id'], 'State': st, 'Elapsed': hms(elapsed), 'TotalCPU': hms(elapsed * j['cpus'] * 0.7),
+                  'AllocCPUS': str(j['cpus']) if run else '0', 'MaxRSS': '', 'ExitCode': '1:0' if st == 'FAILED' else '0:0'}
+        print('|'.join(values.get(f, '') for f in fields))
+        if run and '-X' not in opts:
+            values.update(JobID=j['id'] + '.batch', MaxRSS=f"{j['rss']}K")
+            print('|'.join(values.get(f, '') for f in fields))
+
+def srun(argv, cfg):
+    """Run --ntasks/-n copies of the command (default $SLURM_NTASKS), each with its SLURM_PROCID."""
+    ntasks, i = int(os.environ.get('SLURM_NTASKS', '1')), 0
+    while i < len(argv) and argv[i].startswith('-'):
+        a = argv[i]
+        if a.startswith('--ntasks='): ntasks = int(a.split('=', 1)[1])
+        elif a in ('-n', '-c', '-N'):
+            if a == '-n': ntasks = int(argv[i + 1])
+            i += 1
+        i += 1
+    procs = [subprocess.Popen(argv[i:], env=dict(os.environ, SLURM_PROCID=str(k), SLURM_NTASKS=str(ntasks))) for k in range(ntasks)]
+    sys.exit(max(p.wait() for p in procs))
+
+COMMANDS = {'sbatch': sbatch, 'squeue': squeue, 'sinfo': sinfo, 'sacct': sacct, 'srun': srun}
+
+if __name__ == '__main__':
+    cfg = config()
+    if cfg['latency']: time.sleep(cfg['latency'])
+    COMMANDS[sys.argv[1]](sys.argv[2:], cfg)
@@ -0,0 +1,276 @@
+"""Benchmark scenarios and the results store. See bench/__init__.py for usage."""
+import argparse, json, os, platform, shutil, subprocess, sys, tempfile, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .fakecluster import FakeCluster
+
+APP_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+SCENARIOS = ('ssh', 'submit', 'watcher', 'pack', 'transfer', 'db', 'gui')
+JOB_COUNTS = (10, 100, 1000, 5000)
+CLUSTER = 'bench'
+LOWER_IS_BETTER = ('_s', '_ms')          # metric name suffixes; everything else (rates) is higher-is-better
+GUI_STALL_MAX_MS = 250.0                 # the gui scenario fails when the event loop ever stalls longer,
+GUI_STALL_P99_MS = 50.0                  # or when its 99th percentile stall exceeds this
+
+hpc = None                               # hpc_engine, imported once HOME points at the scratch dir
+
+def _ms(seconds): return round(seconds * 1000.0, 2)
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))] if values else 0.0
+
+def _timed(fn, *args, **kw):
+    t0 = time.perf_counter(); fn(*args, **kw); return time.perf_counter() - t0
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=APP_DIR, capture_output=True, text=True,
+                              timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+class Bench:
+    def __init__(self, work, cluster, args):
+        self.work = Path(work); self.cluster = cluster; self.args = args
+        self.engine = hpc.HPCEngine()
+        self.engine.connect(host='127.0.0.1', user='bench', password='bench', port=cluster.port, cluster=CLUSTER,
+                            watch_jobs=False, poll_cluster=False, use_agent=False)
+        self.engine.save_profile(CLUSTER, remote_base_path=cluster.remote_base, shared_path=cluster.shared)
+        self.conn = self.engine._conn(CLUSTER)
+
+    def close(self):
+        self.engine.shutdown()
+
+    def _clear_active(self):
+        """Close every job the previous scenario left active, here and in fake Slurm."""
+        rows = hpc.list_active_jobs(CLUSTER)
+        if rows: hpc.update_job_statuses([(r[0], 'COMPLETED') for r in rows], CLUSTER)
+        self.cluster.reset_jobs(); self.conn.watcher = hpc.JobStateWatcher(); self.conn.tailer = hpc.OutputTailer()
+
+    def _track(self, jobids, remote_out):
+        hpc.get_storage().transaction(lambda c: c.executemany(
+            hpc.SQL_INSERT_JOB, [(j, None, remote_out, time.strftime('%Y-%m-%dT%H:%M:%S'), 'PENDING', '', CLUSTER, 'bench')
+                                 for j in jobids]))
+
+    # ---------- scenarios ----------
+    def ssh(self):
+        """Round trips through the connection pool, one at a time and from 8 threads."""
+        ssh = self.conn.ssh; n = self.args.repeat * 10
+        serial = [_timed(ssh.exec, 'true') for _ in range(n)]
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(8) as ex: list(ex.map(lambda _: ssh.exec('true'), range(n * 2)))
+        wall = time.perf_counter() - t0
+        return {'exec_p50_ms': _ms(_pct(serial, 50)), 'exec_p95_ms': _ms(_pct(serial, 95)),
+                'exec_parallel_per_s': round(n * 2 / wall, 1), 'pool_waits': ssh.stats()['waits']}
+
+    def submit(self):
+        """engine.submit end to end; the first one also uploads the bundle."""
+        self._clear_active()
+        script = self.work / 'bench_job.m'; script.write_text("function bench_job()\ndisp('bench');\nend\n")
+        times = [_timed(self.engine.submit, str(script), cpus=1, cluster=CLUSTER) for _ in range(self.args.repeat * 4)]
+        return {'first_submit_s': round(times[0], 3), 'submit_p50_ms': _ms(_pct(times[1:], 50)),
+                'submit_p95_ms': _ms(_pct(times[1:], 95))}
+
+    def watcher(self):
+        """One job watcher cycle over N queued jobs (no changes), and over N jobs that all
+        finished since the previous cycle (sacct lookups, output fetch, DB update)."""
+        res = {}
+        for n in self.args.jobs:
+            self._clear_active()
+            ids = self.cluster.seed_jobs(n); self._track(ids, f"{self.cluster.remote_base}/missing_%j.out")
+            cycles = [_timed(self.engine._watch_cycle, self.conn) for _ in range(self.args.repeat)]
+            res[f'cycle_{n}_jobs_s'] = round(min(cycles), 4)
+            self._clear_active()
+            out_dir = Path(self.cluster.remote_base) / 'out'; out_dir.mkdir(exist_ok=True)
+            ids = self.cluster.seed_jobs(n, pending=0.0, runtime=0.0)
+            for j in ids: (out_dir / f"bench_{j}.out").write_text(f"job {j}\n" * 50)
+            self._track(ids, f"{out_dir}/bench_%j.out")
+            res[f'finish_{n}_jobs_s'] = round(_timed(self.engine._watch_cycle, self.conn), 4)
+            left = len(hpc.list_active_jobs(CLUSTER))
+            if left: res[f'finish_{n}_jobs_left'] = left
+        self._clear_active()
+        return res
+
+    def pack(self):
+        """A packed submission run for real by the stub matlab, followed by watcher cycles
+        until every task is recorded. Efficiency is the ideal wall time (tasks x task
+        time / workers) over the measured one, submission included."""
+        self._clear_active()
+        n, workers, task_s = self.args.pack_tasks, self.args.pack_workers, self.args.pack_task_ms / 1000.0
+        script = self.work / 'bench_pack.m'; script.write_text("function y = bench_pack(a)\ny = a;\nend\n")
+        self.cluster.configure(execute=True, task_seconds=task_s, task_fail_rate=0.0)
+        try:
+            t0 = time.perf_counter()
+            res = self.engine.submit_pack(str(script), grid=f"a=1:{n}", workers=workers, cluster=CLUSTER)
+            submitted = time.perf_counter() - t0
+            deadline = time.time() + 60 + 2 * n * task_s / workers
+            while hpc.list_active_jobs(CLUSTER) and time.time() < deadline:
+                self.engine._watch_cycle(self.conn); time.sleep(0.2)
+            wall = time.perf_counter() - t0
+        finally:
+            self.cluster.configure(execute=False)
+        done = self.engine.pack(jobid=res['jobid'], cluster=CLUSTER, limit=1)['counts'].get('COMPLETED', 0)
+        self._clear_active()
+        out = {'submit_s': round(submitted, 3), 'pack_wall_s': round(wall, 3), 'tasks_per_s': round(done / wall, 1),
+               'efficiency': round(n * task_s / workers / wall, 3), 'tasks': n, 'workers': workers}
+        if done < n: out['tasks_not_completed'] = n - done
+        return out
+
+    def transfer(self):
+        """engine.sync of many small and of a few large files, by tar stream and by SFTP; the
+        small ones also into the result cache, then again with every file already held."""
+        res = {}
+        for label, files, size in (('small', self.args.small_files, 16 << 10), ('large', 8, self.args.large_mb << 20)):
+            total = self.cluster.make_output_tree(files, size)
+            for method in ('tar', 'sftp'):
+                dest = Path(tempfile.mkdtemp(prefix=f'{label}-{method}-', dir=self.work))
+                r = self.engine.sync(remote=self.cluster.shared, recursive=True, method=method, local_dir=str(dest), cluster=CLUSTER)
+                if r['bytes'] != total or r['failed']: raise RuntimeError(f"{label}/{method}: incomplete transfer {r}")
+                res[f'{label}_{method}_mbps'] = round(r['mbps'], 2); res[f'{label}_{method}_s'] = round(r['seconds'], 3)
+            if label == 'small':
+                first, again = (self.engine.sync(remote=self.cluster.shared, recursive=True, cluster=CLUSTER) for _ in range(2))
+                if first['failed'] or again['files'] or again['skipped'] != files: raise RuntimeError(f"cached re-sync fetched again: {again}")
+                res['small_cached_s'] = round(first['seconds'], 3); res['small_resync_s'] = round(again['seconds'], 3)
+        res['small_files'] = self.args.small_files; res['large_mb'] = self.args.large_mb
+        return res
+
+    def db(self):
+        """Job inserts (one transaction each, as submissions do), batched status updates,
+        queued power samples and job history pages."""
+        n = self.args.db_rows; storage = hpc.get_storage()
+        ids = [f"db{i}" for i in range(n)]
+        t = _timed(lambda: [hpc.insert_job_record(j, f"/x/{j}_job_1.sh", "/x/%j.out", "ok", cluster='dbbench') for j in ids])
+        u = _timed(hpc.update_job_statuses, [(j, 'COMPLETED') for j in ids], 'dbbench')
+        start = datetime.utcnow()
+        p = _timed(lambda: ([hpc.insert_power(start + timedelta(seconds=i), 100.0, 0.5) for i in range(n)], storage.flush()))
+        pages = [_timed(hpc.list_job_history, cluster='dbbench') for _ in range(self.args.repeat)]
+        after = hpc.list_job_history(cluster='dbbench')['next']
+        deep = [_timed(hpc.list_job_history, cluster='dbbench', after=after) for _ in range(self.args.repeat)]
+        search = [_timed(hpc.list_job_history, text='db1') for _ in range(self.args.repeat)]
+        return {'job_insert_per_s': round(n / t), 'status_update_per_s': round(n / u), 'power_insert_per_s': round(n / p),
+                'history_page_ms': _ms(min(pages)), 'history_next_page_ms': _ms(min(deep)),
+                'history_search_ms': _ms(min(search)), 'rows': n}
+
+    def gui(self):
+        """How long the Qt event loop stalls while the dashboard follows a busy cluster:
+        a 10 ms timer records its lateness while jobs change state and stream events."""
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        try:
+            from PyQt5 import QtCore
+            from PyQt5.QtWidgets import QApplication
+            import hpc_gui
+            from hpc_daemon import LocalClient
+        except ImportError as e:
+            return {'skipped': f"PyQt5/matplotlib not available ({e})"}
+        self._clear_active(); n = self.args.gui_jobs; seconds = self.args.gui_seconds
+        out_dir = Path(self.cluster.remote_base) / 'out'; out_dir.mkdir(exist_ok=True)
+        ids = self.cluster.seed_jobs(n, pending=0.0, runtime=seconds / 2)
+        for j in ids: (out_dir / f"bench_{j}.out").write_text(f"job {j}\n" * 20)
+        self._track(ids, f"{out_dir}/bench_%j.out")
+        app = QApplication.instance() or QApplication([])
+        dash = hpc_gui.HPCDashboard(LocalClient(self.engine)); dash.show()
+        self.engine.disconnect(cluster=CLUSTER)          # reconnect with monitors on, as the dashboard would
+        self.engine.connect(host='127.0.0.1', user='bench', password='bench', port=self.cluster.port, cluster=CLUSTER,
+                            use_agent=False)
+        self.conn = self.engine._conn(CLUSTER)
+        late = []; last = [time.perf_counter()]
+        def tick():
+            now = time.perf_counter(); late.append(max(0.0, now - last[0] - 0.010)); last[0] = now
+        timer = QtCore.QTimer(); timer.setTimerType(QtCore.Qt.PreciseTimer); timer.timeout.connect(tick); timer.start(10)
+        end = time.time() + seconds
+        while time.time() < end: app.processEvents(); time.sleep(0.001)
+        timer.stop(); dash._closing = True; dash.close(); app.processEvents()
+        return {'stall_max_ms': _ms(max(late, default=0.0)), 'stall_p99_ms': _ms(_pct(late, 99)),
+                'stalls_over_50ms': sum(1 for s in late if s > 0.05), 'blocked_s': round(sum(s for s in late if s > 0.05), 3),
+                'jobs': n, 'seconds': seconds}
+
+# ---------- results ----------
+def save_results(result, label=None):
+    RESULTS_DIR.mkdir(exist_ok=True)
+    name = label or f"{result['meta']['revision'] or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}"
+    path = RESULTS_DIR / f"{name}.json"; path.write_text(json.dumps(result, indent=2))
+    return path
+
+def compare(base_path, new_path):
+    """Print every metric of two result files side by side with the relative change;
+    `!` marks changes of more than 10% in the wrong direction."""
+    base, new = (json.loads(Path(p).read_text()) for p in (base_path, new_path))
+    print(f"{'metric':<38} {base['meta']['revision'] or base_path:>16} {new['meta']['revision'] or new_path:>16}   change")
+    for scenario, metrics in new['results'].items():
+        old = base['results'].get(scenario, {})
+        for key, value in metrics.items():
+            prev = old.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(prev, (int, float)):
+                print(f"{scenario + '.' + key:<38} {str(prev):>16} {str(value):>16}"); continue
+            change = (value - prev) / prev * 100.0 if prev else 0.0
+            worse = change > 10 if key.endswith(LOWER_IS_BETTER) else change < -10
+            print(f"{scenario + '.' + key:<38} {prev:>16} {value:>16}   {change:+6.1f}%{' !' if worse else ''}")
+
+def limit_failures(result, args):
+    """Messages for every stated limit a result breaks (the gui stall budget)."""
+    gui = result['results'].get('gui', {}); failures = []
+    if gui.get('stall_max_ms', 0) > args.gui_stall_max_ms:
+        failures.append(f"gui: event loop stalled {gui['stall_max_ms']} ms (limit {args.gui_stall_max_ms} ms)")
+    if gui.get('stall_p99_ms', 0) > args.gui_stall_p99_ms:
+        failures.append(f"gui: p99 stall {gui['stall_p99_ms']} ms (limit {args.gui_stall_p99_ms} ms)")
+    return failures
+
+def print_results(result):
+    for scenario, metrics in result['results'].items():
+        print(f"[{scenario}]")
+        for key, value in metrics.items(): print(f"  {key:<28} {value}")
+
+def run(args):
+    global hpc
+    work = Path(tempfile.mkdtemp(prefix='hpc-bench-'))
+    os.environ['HOME'] = str(work / 'client'); (work / 'client').mkdir()
+    os.chdir(work / 'client')                      # job outputs land under the scratch dir too
+    sys.path.insert(0, str(APP_DIR))
+    import hpc_engine as hpc
+    cluster = FakeCluster(work / 'cluster', latency=args.latency).start()
+    bench = Bench(work, cluster, args)
+    result = {'meta': {'revision': _git_revision(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                       'platform': platform.platform(), 'latency': args.latency, 'argv': sys.argv[1:]}, 'results': {}}
+    try:
+        for name in args.only or SCENARIOS:
+            print(f"running {name} ...", file=sys.stderr, flush=True)
+            result['results'][name] = getattr(bench, name)()
+    finally:
+        bench.close(); cluster.stop()
+        if not args.keep: shutil.rmtree(work, ignore_errors=True)
+    return result
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog='python -m bench', description="Benchmarks against a local fake Slurm cluster.")
+    p.add_argument('--only', nargs='*', choices=SCENARIOS, help="scenarios to run (default: all)")
+    p.add_argument('--jobs', nargs='*', type=int, default=list(JOB_COUNTS), help="job counts for the watcher scenario")
+    p.add_argument('--latency', type=float, default=0.0, help="seconds added to every fake Slurm command")
+    p.add_argument('--repeat', type=int, default=3, help="repetitions per measurement (the best or percentiles are kept)")
+    p.add_argument('--pack-tasks', type=int, default=400); p.add_argument('--pack-workers', type=int, default=8)
+    p.add_argument('--pack-task-ms', type=float, default=50.0, help="run time of each stub MATLAB task in the pack scenario")
+    p.add_argument('--small-files', type=int, default=500); p.add_argument('--large-mb', type=int, default=8)
+    p.add_argument('--db-rows', type=int, default=2000)
+    p.add_argument('--gui-jobs', type=int, default=500); p.add_argument('--gui-seconds', type=float, default=10.0)
+    p.add_argument('--gui-stall-max-ms', type=float, default=GUI_STALL_MAX_MS, help="longest event loop stall the gui scenario accepts")
+    p.add_argument('--gui-stall-p99-ms', type=float, default=GUI_STALL_P99_MS, help="99th percentile stall the gui scenario accepts")
+    p.add_argument('--label', help="results file name (default: git revision and time)")
+    p.add_argument('--keep', action='store_true', help="keep the scratch folder (fake cluster, database, downloads)")
+    p.add_argument('--no-save', action='store_true'); p.add_argument('--json', action='store_true')
+    p.add_argument('--compare', nargs='+', metavar='RESULT', help="compare two result files (or one with a fresh run)")
+    args = p.parse_args(argv)
+    if args.compare and len(args.compare) == 2: compare(*args.compare); return 0
+    result = run(args)
+    if args.json: print(json.dumps(result, indent=2))
+    else: print_results(result)
+    path = None if args.no_save else save_results(result, args.label)
+    if path: print(f"saved {path}", file=sys.stderr)
+    if args.compare: compare(args.compare[0], path or _tmp_result(result))
+    failures = limit_failures(result, args)
+    for f in failures: print(f"FAILED {f}", file=sys.stderr)
+    return 1 if failures else 0
+
+def _tmp_result(result):
+    fd, path = tempfile.mkstemp(suffix='.json'); os.close(fd); Path(path).write_text(json.dumps(result)); return path
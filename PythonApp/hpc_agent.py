@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+hpc_agent.py
+
+Remote monitoring agent. The dashboard uploads this file to the login node and runs
+it once per connection (`python3 -u hpc_agent.py`) on a single SSH channel. The agent
+samples Slurm, the watched job output files and node telemetry itself and writes
+newline-delimited JSON to stdout, only when something changed:
+
+    {"t": "hello", "v": 1, "host": ..., "python": ...}
+    {"t": "cluster", "sinfo": {"add": [...], "del": [...]}, "squeue": {...}}
+    {"t": "jobs", "states": {jobid: raw state, or "" when in neither squeue nor sacct}}
+    {"t": "out", "job": jobid, "off": offset, "data": text, "reset": bool}
+    {"t": "telemetry", "text": probe output}
+    {"t": "gpu", "present": bool}
+    {"t": "hb", "ts": epoch}                    when nothing else was sent for a while
+    {"t": "error", "where": ..., "msg": ...}
+
+Output bytes that are not valid UTF-8 travel as surrogate escapes, so the dashboard
+recovers them exactly with .encode('utf-8', 'surrogateescape').
+
+Commands arrive on stdin, one JSON object per line:
+
+    {"cmd": "config", "interval": s, "cluster_interval": s, "heartbeat": s,
+     "cluster_cmd": ..., "cluster_sep": ..., "max_chunk": bytes}
+    {"cmd": "watch", "jobs": {jobid: [output path, offset]}, "seek": {jobid: offset}}
+    {"cmd": "telemetry", "script": shell command, or "" to stop sampling}
+    {"cmd": "poll"}                             sample everything now
+    {"cmd": "stop"}
+
+The agent exits when stdin closes, i.e. when the dashboard disconnects.
+Standard library only; runs on Python 3.6+.
+"""
+import sys, os, json, time, shutil, socket, platform, threading, subprocess
+
+AGENT_VERSION = 1
+
+def run(cmd, timeout=60):
+    try:
+        p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        return p.stdout.decode('utf-8', 'replace'), p.stderr.decode('utf-8', 'replace')
+    except subprocess.TimeoutExpired:
+        return '', 'timed out: ' + cmd.split()[0]
+
+class Agent:
+    def __init__(self):
+        self.cfg = {'interval': 3.0, 'cluster_interval': 8.0, 'heartbeat': 10.0, 'cluster_cmd': '', 'cluster_sep': '',
+                    'max_chunk': 256 * 1024}
+        self.watch = {}          # jobid -> [output path, offset]
+        self.states = {}         # jobid -> state last reported
+        self.lines = {}          # 'sinfo'/'squeue' -> set of lines last reported
+        self.telemetry_script = ''
+        self.lock = threading.Lock(); self.out_lock = threading.Lock()
+        self.stop = threading.Event(); self.wake_jobs = threading.Event(); self.wake_cluster = threading.Event()
+        self.last_sent = 0.0
+
+    def send(self, **msg):
+        line = json.dumps(msg, separators=(',', ':')) + '\n'
+        with self.out_lock:
+            try: sys.stdout.write(line); sys.stdout.flush()
+            except (OSError, ValueError): self.stop.set()     # dashboard went away
+            self.last_sent = time.time()
+
+    # ---------- commands ----------
+    def read_commands(self):
+        for line in sys.stdin:
+            try: msg = json.loads(line)
+            except ValueError: continue
+            cmd = msg.pop('cmd', None)
+            if cmd == 'stop': break
+            with self.lock:
+                if cmd == 'config': self.cfg.update(msg)
+                elif cmd == 'watch': self._set_watch(msg.get('jobs') or {}, msg.get('seek') or {})
+                elif cmd == 'telemetry': self.telemetry_script = msg.get('script') or ''
+            if cmd in ('config', 'watch', 'poll'): self.wake_jobs.set()
+            if cmd in ('config', 'telemetry', 'poll'): self.wake_cluster.set()
+        self.stop.set(); self.wake_jobs.set(); self.wake_cluster.set()
+
+    def _set_watch(self, jobs, seek):
+        watch = {}
+        for jobid, (path, offset) in jobs.items():
+            cur = self.watch.get(jobid)
+            # we usually are ahead of the dashboard's offset (chunks in flight); seek overrides
+            watch[jobid] = [path, int(offset)] if cur is None or cur[0] != path else cur
+            if jobid in seek: watch[jobid][1] = int(seek[jobid])
+        self.watch = watch
+        self.states = {j: s for j, s in self.states.items() if j in watch}
+
+    # ---------- job states and output ----------
+    def sample_jobs(self):
+        with self.lock: ids = list(self.watch)
+        if not ids: return
+        query = lambda js: ','.join(sorted(set(j.split('_', 1)[0] for j in js)))
+        out, _ = run("squeue -h -r -t all -j %s -o '%%i %%T'" % query(ids))
+        states = dict(l.split(None, 1) for l in out.splitlines() if len(l.split()) >= 2)
+        gone = [j for j in ids if j not in states]
+        if gone:
+            out, _ = run("sacct -n -P -X -j %s -o JobID,State" % query(gone))
+            for l in out.splitlines():
+                f = l.strip().split('|')
+                if len(f) >= 2 and f[0] in gone: states[f[0]] = f[1]
+        report = {}
+        for j in ids:
+            st = states.get(j, '').strip()
+            # missing jobs are repeated every cycle: the dashboard counts them towards its grace period
+            if not st or st != self.states.get(j): report[j] = st
+        with self.lock:
+            self.states.update((j, s) for j, s in report.items() if j in self.watch)
+        if report: self.send(t='jobs', states=report)
+
+    def sample_outputs(self):
+        with self.lock: items = [(j, w) for j, w in self.watch.items() if w[0]]
+        for jobid, w in items:
+            path, offset = w
+            try: size = os.stat(path).st_size
+            except OSError: continue           # not created yet (job pending)
+            reset = size < offset               # rewritten, e.g. a requeued job
+            if reset: offset = 0
+            if size == offset: continue
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset); data = f.read(min(size - offset, int(self.cfg['max_chunk'])))
+            except OSError as e:
+                self.send(t='error', where='output', msg=str(e)); continue
+            self.send(t='out', job=jobid, off=offset, data=data.decode('utf-8', 'surrogateescape'), reset=reset)
+            with self.lock:
+                if self.watch.get(jobid) is w: w[1] = offset + len(data)
+
+    def jobs_loop(self):
+        while not self.stop.is_set():
+            try:
+                self.sample_jobs(); self.sample_outputs()
+            except Exception as e:
+                self.send(t='error', where='jobs', msg=str(e))
+            if time.time() - self.last_sent >= float(self.cfg['heartbeat']): self.send(t='hb', ts=time.time())
+            self.wake_jobs.wait(float(self.cfg['interval'])); self.wake_jobs.clear()
+
+    # ---------- cluster state and telemetry ----------
+    def sample_cluster(self):
+        cmd, sep = self.cfg['cluster_cmd'], self.cfg['cluster_sep']
+        if not cmd: return
+        out, err = run(cmd)
+        if sep not in out:
+            self.send(t='error', where='cluster', msg=err.strip() or 'unexpected sinfo/squeue output'); return
+        msg = {}
+        for key, text in zip(('sinfo', 'squeue'), out.split(sep, 1)):
+            new = [l for l in text.splitlines() if l.strip()]
+            old = self.lines.get(key); new_set = set(new)
+            if old is None or old != new_set:
+                old = old or set()
+                msg[key] = {'add': [l for l in new if l not in old], 'del': [l for l in old if l not in new_set]}
+            self.lines[key] = new_set
+        if msg: self.send(t='cluster', **msg)
+
+    def sample_telemetry(self):
+        with self.lock: script = self.telemetry_script
+        if script:
+            out, _ = run(script)
+            self.send(t='telemetry', text=out)
+
+    def cluster_loop(self):
+        while not self.stop.is_set():
+            interval = float(self.cfg['cluster_interval'])
+            if interval > 0:
+                try:
+                    self.sample_cluster(); self.sample_telemetry()
+                except Exception as e:
+                    self.send(t='error', where='cluster', msg=str(e))
+            self.wake_cluster.wait(interval if interval > 0 else None); self.wake_cluster.clear()
+
+    def main(self):
+        self.send(t='hello', v=AGENT_VERSION, host=socket.gethostname(), python=platform.python_version())
+        self.send(t='gpu', present=bool(shutil.which('nvidia-smi')))
+        for target in (self.jobs_loop, self.cluster_loop):
+            threading.Thread(target=target, daemon=True).start()
+        self.read_commands()
+
+if __name__ == '__main__':
+    Agent().main()
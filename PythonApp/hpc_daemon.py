@@ -0,0 +1,236 @@
+"""
+hpc_daemon.py
+
+Local JSON API in front of an HPCEngine, and the clients that talk to it.
+
+Every engine method listed in HPCEngine.API is exposed as `POST /api/<method>` with
+its keyword arguments as a JSON object and `Content-Type: application/json`; the
+read-only ones (READ_ONLY_CALLS) also answer GET with query parameters for quick
+`curl` checks. Both rules keep web pages from driving the engine through a browser:
+they can neither send a JSON POST across origins without a preflight the daemon
+never grants, nor reach a mutating method with a plain GET. Replies are `{"ok": true, "result": ...}` or
+`{"ok": false, "error": "...", "kind": "..."}`. `events` long-polls, so clients get
+job transitions, output and telemetry as they happen. `GET /metrics` serves the
+engine's metrics in the Prometheus text format for scraping.
+
+By default the daemon listens on a Unix socket only the current user can open;
+`host:port` listens on TCP instead. There is no authentication, so a TCP address
+must be a loopback one unless the daemon is started with allow_remote
+(`--allow-remote`).
+"""
+from __future__ import annotations
+import os, sys, json, socket, signal, threading, ipaddress
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingUnixStreamServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl
+
+from hpc_engine import METRICS, PROFILER, HPCEngine, EngineError
+
+DEFAULT_API_ADDRESS = (str(Path.home() / '.hpc_dashboard.sock') if hasattr(socket, 'AF_UNIX') else '127.0.0.1:8765')
+UNMEASURED_CALLS = ('events', 'metrics', 'set_metrics', 'profile')
+READ_ONLY_CALLS = ('status', 'profiles', 'jobs', 'history', 'job', 'pack', 'job_output', 'results', 'cluster', 'power_range',
+                   'metrics', 'events')      # the methods GET may call
+API_TIMEOUT = 600.0             # client-side limit; long syncs and submissions block the request
+
+def parse_address(address):
+    """'unix:/path' or a path -> ('unix', path); 'host:port' -> ('tcp', (host, port))."""
+    address = address or DEFAULT_API_ADDRESS
+    if address.startswith('unix:'): return 'unix', address[5:]
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address: return 'tcp', (host or '127.0.0.1', int(port))
+    return 'unix', address
+
+def is_loopback(host):
+    """True when every address host resolves to is a loopback one."""
+    try: return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError): return False
+
+def _measured(engine, name):
+    """engine.<name>, timed as an api_call and profiled while profiling runs; `events`
+    (a long poll) and the diagnostics calls themselves are left alone."""
+    fn = getattr(engine, name)
+    if name in UNMEASURED_CALLS: return fn
+    def call(**kwargs):
+        with METRICS.timer('api_call', method=name): return PROFILER.profiled(fn, **kwargs)
+    return call
+
+def _coerce(value):
+    try: return json.loads(value)
+    except ValueError: return value
+
+def _json_default(obj):
+    if hasattr(obj, '_asdict'): return list(obj)
+    if isinstance(obj, (set, frozenset, tuple)): return list(obj)
+    return str(obj)
+
+# ---------- server ----------
+class _ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'hpc-dashboard'
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, code, payload, content_type='application/json'):
+        body = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload, default=_json_default).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type); self.send_header('Content-Length', str(len(body)))
+        self.end_headers(); self.wfile.write(body)
+
+    def _dispatch(self, kwargs, read_only=False):
+        url = urlsplit(self.path)
+        name = url.path[len('/api/'):] if url.path.startswith('/api/') else ''
+        if name not in HPCEngine.API:
+            self._reply(404, {'ok': False, 'error': f"unknown method {name!r}", 'kind': 'not_found'}); return
+        if read_only and name not in READ_ONLY_CALLS:
+            self._reply(405, {'ok': False, 'error': f"{name} changes state: use POST", 'kind': 'method_not_allowed'}); return
+        kwargs.update((k, _coerce(v)) for k, v in parse_qsl(url.query))
+        try:
+            result = _measured(self.server.engine, name)(**kwargs)
+            self._reply(200, {'ok': True, 'result': result})
+        except EngineError as e:
+            self._reply(400, {'ok': False, 'error': str(e), 'kind': e.kind})
+        except TypeError as e:
+            self._reply(400, {'ok': False, 'error': str(e), 'kind': 'bad_request'})
+        except Exception as e:
+            self._reply(500, {'ok': False, 'error': str(e), 'kind': 'error'})
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/metrics':
+            self._reply(200, METRICS.prometheus(), 'text/plain; version=0.0.4'); return
+        self._dispatch({}, read_only=True)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0); body = self.rfile.read(length)
+        if self.headers.get_content_type() != 'application/json':
+            self._reply(415, {'ok': False, 'error': 'Content-Type must be application/json', 'kind': 'bad_request'}); return
+        try: kwargs = json.loads(body or b'{}')
+        except ValueError: kwargs = None
+        if not isinstance(kwargs, dict):
+            self._reply(400, {'ok': False, 'error': 'body must be a JSON object', 'kind': 'bad_request'}); return
+        self._dispatch(kwargs)
+
+class _UnixHTTPServer(ThreadingUnixStreamServer):
+    daemon_threads = True
+    def server_bind(self):
+        super().server_bind(); os.chmod(self.server_address, 0o600)
+        self.server_name, self.server_port = 'localhost', 0
+
+class EngineServer:
+    """Serves one engine on a Unix socket or a TCP address from a background thread. TCP
+    addresses other than loopback ones are refused unless allow_remote is set."""
+    def __init__(self, engine, address=None, allow_remote=False):
+        self.engine = engine; self.kind, self.address = parse_address(address)
+        if self.kind == 'tcp' and not allow_remote and not is_loopback(self.address[0]):
+            raise EngineError(f"refusing to listen on {self.address[0]}: the API has no authentication, so it only listens on "
+                              f"loopback addresses unless remote access is allowed explicitly", 'bad_request')
+        if self.kind == 'unix':
+            if os.path.exists(self.address):
+                if ping(f"unix:{self.address}"): raise EngineError(f"a daemon is already listening on {self.address}", 'busy')
+                os.unlink(self.address)                    # stale socket from a crashed daemon
+            self.httpd = _UnixHTTPServer(self.address, _ApiHandler)
+        else:
+            self.httpd = ThreadingHTTPServer(self.address, _ApiHandler); self.httpd.daemon_threads = True
+        self.httpd.engine = engine
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"unix:{self.address}" if self.kind == 'unix' else f"{self.httpd.server_address[0]}:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='api-server', daemon=True)
+        self._thread.start(); return self
+
+    def stop(self):
+        self.httpd.shutdown(); self.httpd.server_close()
+        if self.kind == 'unix':
+            try: os.unlink(self.address)
+            except OSError: pass
+
+# ---------- clients ----------
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout); self.unix_path = path
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout); self.sock.connect(self.unix_path)
+
+class ApiClient:
+    """Calls engine methods through a daemon: client.submit(script=...) etc. Errors come
+    back as EngineError with the daemon's `kind`."""
+    def __init__(self, address=None, timeout=API_TIMEOUT):
+        self.kind, self.address = parse_address(address); self.timeout = timeout
+        self._local = threading.local()      # one keep-alive connection per calling thread
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = (_UnixHTTPConnection(self.address, self.timeout) if self.kind == 'unix'
+                    else http.client.HTTPConnection(*self.address, timeout=self.timeout))
+            self._local.conn = conn
+        return conn
+
+    def call(self, method, **kwargs):
+        body = json.dumps(kwargs, default=_json_default).encode('utf-8')
+        for attempt in (0, 1):
+            conn = self._connection()
+            try:
+                conn.request('POST', f"/api/{method}", body, {'Content-Type': 'application/json'})
+                resp = conn.getresponse(); payload = json.loads(resp.read() or b'{}')
+                break
+            except (http.client.HTTPException, ConnectionError, socket.timeout) as e:
+                conn.close(); self._local.conn = None          # stale keep-alive: retry once on a new connection
+                if attempt: raise EngineError(f"daemon unreachable: {e}", 'unreachable')
+            except OSError as e:
+                conn.close(); self._local.conn = None
+                raise EngineError(f"daemon unreachable: {e}", 'unreachable')
+        if not payload.get('ok'): raise EngineError(payload.get('error', 'request failed'), payload.get('kind', 'error'))
+        return payload.get('result')
+
+    def __getattr__(self, name):
+        if name not in HPCEngine.API: raise AttributeError(name)
+        return lambda **kwargs: self.call(name, **kwargs)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn: conn.close()
+
+class LocalClient:
+    """Same interface as ApiClient, calling an in-process engine directly."""
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __getattr__(self, name):
+        if name not in HPCEngine.API: raise AttributeError(name)
+        return _measured(self.engine, name)
+
+    def close(self):
+        self.engine.shutdown()
+
+def ping(address=None):
+    """True when a daemon answers on address."""
+    kind, addr = parse_address(address)
+    if kind == 'unix' and not os.path.exists(addr): return False
+    try: ApiClient(address, timeout=2.0).status(); return True
+    except EngineError: return False
+
+def run_daemon(address=None, connect=True, use_agent=None, allow_remote=False):
+    """Serve an engine until SIGINT/SIGTERM. Connects every saved cluster profile when asked."""
+    engine = HPCEngine()
+    try: server = EngineServer(engine, address, allow_remote).start()
+    except BaseException: engine.shutdown(); raise
+    print(f"hpc-dashboard daemon listening on {server.url}", flush=True)
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM): signal.signal(sig, lambda *a: stop.set())
+    engine.log(f"Daemon listening on {server.url}")
+    if connect:
+        for name, err in engine.connect_all(use_agent=use_agent).items():
+            if err: print(f"connect {name} failed: {err['error']}", file=sys.stderr)
+    while not stop.wait(1.0): pass
+    server.stop(); engine.shutdown()
@@ -0,0 +1,3238 @@
+"""
+hpc_engine.py
+
+Headless core of the HPC dashboard: SSH connection pool, job database, Slurm job
+watcher, output tailing, submission (single jobs, sweeps and packed tasks), output sync, cluster
+state and telemetry, the client side of the remote monitoring agent (hpc_agent.py), the
+local result cache, and latency metrics and profiling of all of these. No Qt or matplotlib imports, so the CLI and
+the daemon start quickly and run without a display.
+
+Dependencies:
+    pip install paramiko numpy
+"""
+from __future__ import annotations
+import os, posixpath, json, time, random, re, sqlite3, stat, shlex, hashlib, csv, math, itertools, tarfile, fnmatch, socket
+import bisect, codecs, cProfile, decimal, functools, io, pstats
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+
+import numpy as np
+import paramiko
+from paramiko.agent import Agent
+from paramiko.ssh_exception import PasswordRequiredException
+
+# ---------------- constants ----------------
+POLL_INTERVAL = 8.0              # cluster snapshot interval while jobs are queued (see PollPlan)
+DB_PATH = Path.home() / '.hpc_dashboard.db'
+CONFIG_PATH = Path.home() / '.hpc_dashboard_conf.json'
+RESULTS_DIR = Path.home() / 'hpc_results'       # local result cache (config 'results_dir'), see ResultCache
+
+# ---------- metrics ----------
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+METRICS_MAX_SERIES = 500         # label combinations kept per process; later ones are folded into command='other'
+PROFILE_REPORT_LINES = 40
+COMMAND_KIND_RE = re.compile(r'^\s*(?:exec\s+)?([\w./+-]+)(?=[\s;|&]|$)')
+
+def command_kind(cmd):
+    """Label for a remote command: its program name (`squeue`, `sacct`, `tar`, ...), or
+    'shell' for scripts (the telemetry probe and the like)."""
+    m = COMMAND_KIND_RE.match(cmd or '')
+    return posixpath.basename(m.group(1)) if m else 'shell'
+
+class Histogram:
+    """Latency histogram over METRIC_BUCKETS (seconds); quantiles interpolate inside a bucket."""
+    __slots__ = ('counts', 'count', 'sum', 'max')
+    def __init__(self):
+        self.counts = [0] * (len(METRIC_BUCKETS) + 1); self.count = 0; self.sum = 0.0; self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+        self.count += 1; self.sum += seconds
+        if seconds > self.max: self.max = seconds
+
+    def quantile(self, q):
+        if not self.count: return 0.0
+        rank = q * self.count; seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = METRIC_BUCKETS[i - 1] if i else 0.0
+                hi = METRIC_BUCKETS[i] if i < len(METRIC_BUCKETS) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 't0')
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics; self.name = name; self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter(); return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.t0, **self.labels)
+        if exc_type is not None: self.metrics.add('errors', 1, metric=self.name, **self.labels)
+
+class _NoTimer:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): pass
+
+_NO_TIMER = _NoTimer()
+
+class Metrics:
+    """Process-wide latency histograms and counters keyed by name and labels. Disabled,
+    timer() hands out a shared no-op and observe()/add() return at once, so the hot
+    paths pay one attribute check."""
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock(); self._hist = {}; self._counters = {}; self.since = time.time()
+
+    def _key(self, table, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in table and len(table) >= METRICS_MAX_SERIES:
+            key = (name, tuple(sorted(dict(labels, command='other').items())))
+        return key
+
+    def timer(self, name, **labels):
+        return _Timer(self, name, labels) if self.enabled else _NO_TIMER
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled: return
+        with self._lock:
+            key = self._key(self._hist, name, labels)
+            h = self._hist.get(key)
+            if h is None: h = self._hist[key] = Histogram()
+            h.observe(seconds)
+
+    def add(self, name, n=1, **labels):
+        if not self.enabled or not n: return
+        with self._lock:
+            key = self._key(self._counters, name, labels)
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def reset(self):
+        with self._lock: self._hist.clear(); self._counters.clear(); self.since = time.time()
+
+    def snapshot(self):
+        """{'enabled', 'since', 'latency': [{name, labels, count, sum, max, p50, p95, p99}],
+        'counters': [{name, labels, value}]} (seconds), busiest series first."""
+        with self._lock:
+            hist = [(k, h.count, h.sum, h.max, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99)) for k, h in self._hist.items()]
+            counters = list(self._counters.items())
+        latency = [{'name': n, 'labels': dict(l), 'count': c, 'sum': s, 'max': mx, 'p50': p50, 'p95': p95, 'p99': p99}
+                   for (n, l), c, s, mx, p50, p95, p99 in hist]
+        latency.sort(key=lambda r: -r['sum'])
+        return {'enabled': self.enabled, 'since': self.since,
+                'latency': latency, 'counters': sorted(({'name': n, 'labels': dict(l), 'value': v} for (n, l), v in counters),
+                                                       key=lambda r: (r['name'], -r['value']))}
+
+    def prometheus(self, prefix='hpc'):
+        """Prometheus text exposition: one histogram family per latency name
+        (<prefix>_<name>_seconds) and one counter family per counter (<prefix>_<name>_total)."""
+        def labels(pairs, extra=()):
+            items = list(pairs) + list(extra)
+            if not items: return ''
+            esc = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in items) + '}'
+        with self._lock:
+            hist = sorted((k, list(h.counts), h.count, h.sum) for k, h in self._hist.items())
+            counters = sorted(self._counters.items())
+        lines = []; seen = set()
+        for (name, pairs), counts, count, total in hist:
+            family = f"{prefix}_{name}_seconds"
+            if family not in seen: seen.add(family); lines.append(f"# TYPE {family} histogram")
+            cumulative = 0
+            for le, n in zip(METRIC_BUCKETS + (float('inf'),), counts):
+                cumulative += n
+                lines.append(f"{family}_bucket{labels(pairs, [('le', '+Inf' if le == float('inf') else repr(le))])} {cumulative}")
+            lines.append(f"{family}_sum{labels(pairs)} {total:.6f}"); lines.append(f"{family}_count{labels(pairs)} {count}")
+        for (name, pairs), value in counters:
+            family = f"{prefix}_{name}_total"
+            if family not in seen: seen.add(family); lines.append(f"# TYPE {family} counter")
+            lines.append(f"{family}{labels(pairs)} {value}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+SQL_TABLE_RE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+(\w+)', re.I)
+
+@functools.lru_cache(maxsize=256)
+def sql_labels(sql):
+    """(verb, table) labels of a statement, e.g. ('select', 'jobs')."""
+    m = SQL_TABLE_RE.search(sql)
+    return sql.split(None, 1)[0].lower(), m.group(1) if m else ''
+
+class Profiler:
+    """cProfile over the engine's work while active. Each thread that runs work through
+    profiled() (API calls, monitor cycles, agent messages) gets a Profile of its own;
+    the report merges them. Inactive, profiled() is a plain call."""
+    def __init__(self):
+        self.active = False; self.since = None
+        self._lock = threading.Lock(); self._profiles = []; self._local = threading.local(); self._generation = 0
+
+    def start(self):
+        with self._lock:
+            self._profiles = []; self._generation += 1; self.since = time.time(); self.active = True
+
+    def stop(self):
+        self.active = False
+
+    def profiled(self, fn, *args, **kwargs):
+        if not self.active or getattr(self._local, 'depth', 0): return fn(*args, **kwargs)
+        local = self._local
+        if getattr(local, 'generation', None) != self._generation:
+            local.profile = cProfile.Profile(); local.generation = self._generation
+            with self._lock: self._profiles.append(local.profile)
+        local.depth = 1; local.profile.enable()
+        try: return fn(*args, **kwargs)
+        finally: local.profile.disable(); local.depth = 0
+
+    def report(self, sort='cumulative', limit=PROFILE_REPORT_LINES):
+        with self._lock: profiles = list(self._profiles)
+        profiles = [p for p in profiles if p.getstats()]
+        if not profiles: return ''
+        out = io.StringIO(); stats = pstats.Stats(profiles[0], stream=out)
+        for p in profiles[1:]: stats.add(p)
+        stats.strip_dirs().sort_stats(sort).print_stats(int(limit))
+        return out.getvalue()
+
+PROFILER = Profiler()
+
+# ---------- DB helpers ----------
+POWER_FLUSH_BATCH = 256            # queued power samples that trigger an early flush
+POWER_FLUSH_INTERVAL = 5.0         # seconds between background flushes of the power queue
+POWER_RAW_RETENTION_DAYS = 7       # raw samples older than this are rolled up ...
+POWER_ROLLUP_SECONDS = 300         # ... into buckets of this width
+POWER_ROLLUP_RETENTION_DAYS = 365  # and rollups older than this are dropped
+POWER_RETENTION_EVERY = 3600.0     # seconds between retention passes
+HISTORY_PAGE = 200                 # job history rows per page
+
+SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        jobid TEXT,
+        remote_sbatch TEXT,
+        remote_out TEXT,
+        submitted_at TEXT,
+        status TEXT,
+        sbatch_output TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS power_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT,
+        power REAL,
+        util REAL,
+        est_flops REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS power_history_rollup (
+        bucket_ts TEXT PRIMARY KEY,
+        power REAL,
+        util REAL,
+        est_flops REAL,
+        samples INTEGER
+    )''',
+    '''CREATE TABLE IF NOT EXISTS transfer_stats (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts TEXT,
+        method TEXT,
+        files INTEGER,
+        bytes INTEGER,
+        seconds REAL,
+        mbps REAL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS results (
+        path TEXT PRIMARY KEY,
+        cluster TEXT,
+        jobid TEXT,
+        remote_path TEXT,
+        size INTEGER,
+        sha256 TEXT,
+        remote_mtime INTEGER,
+        fetched_at TEXT,
+        last_access REAL,
+        pinned INTEGER DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS result_pins (
+        cluster TEXT,
+        jobid TEXT,
+        PRIMARY KEY (cluster, jobid)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS pack_tasks (
+        pack_id INTEGER,
+        task INTEGER,
+        args TEXT,
+        status TEXT,
+        worker INTEGER,
+        elapsed_s REAL,
+        finished_at TEXT,
+        error TEXT,
+        PRIMARY KEY (pack_id, task)
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_jobid ON jobs(jobid)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_array_parent ON jobs(array_parent)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_cluster ON jobs(cluster, jobid)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_script ON jobs(script, id)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_submitted ON jobs(submitted_at)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_acct ON jobs(cluster, acct)',
+    'CREATE INDEX IF NOT EXISTS idx_jobs_pack ON jobs(cluster) WHERE pack_dir IS NOT NULL',
+    'CREATE INDEX IF NOT EXISTS idx_power_ts ON power_history(ts)',
+    'CREATE INDEX IF NOT EXISTS idx_results_remote ON results(cluster, remote_path)',
+    'CREATE INDEX IF NOT EXISTS idx_results_job ON results(cluster, jobid)',
+    'CREATE INDEX IF NOT EXISTS idx_results_lru ON results(last_access) WHERE pinned=0',
+)
+
+# Columns added after the first release; created on open when missing.
+MIGRATIONS = (
+    ('jobs', 'array_parent', 'TEXT'),     # parent job id of an array task
+    ('jobs', 'array_task', 'INTEGER'),    # task index within the array
+    ('jobs', 'array_size', 'INTEGER'),    # set on the parent row of an array job
+    ('jobs', 'cluster', 'TEXT'),          # profile name of the cluster the job was submitted to
+    ('jobs', 'script', 'TEXT'),           # MATLAB script name (backfilled from remote_sbatch)
+    ('jobs', 'elapsed_s', 'INTEGER'),     # accounting, from sacct once the job is final ...
+    ('jobs', 'max_rss_kb', 'INTEGER'),
+    ('jobs', 'cpu_eff', 'REAL'),          # TotalCPU / (Elapsed * AllocCPUS)
+    ('jobs', 'exit_code', 'TEXT'),
+    ('jobs', 'acct', 'INTEGER'),          # ... 1 once recorded, -1 when sacct does not know the job
+    ('jobs', 'pack_dir', 'TEXT'),         # packed submission: remote folder of its task results ...
+    ('jobs', 'pack_workers', 'INTEGER'),  # ... and its number of MATLAB workers (tasks are in pack_tasks)
+    ('power_history_rollup', 'power_samples', 'INTEGER'),   # non-NULL samples behind each average; NULL on
+    ('power_history_rollup', 'util_samples', 'INTEGER'),    # rows rolled up earlier, which use `samples`
+    ('power_history_rollup', 'flops_samples', 'INTEGER'),
+)
+
+# Full-text index over the descriptive job columns; kept in step by triggers. Optional:
+# without FTS5 in the sqlite3 build, text search falls back to LIKE.
+FTS_COLUMNS = 'jobid, script, cluster, remote_sbatch, sbatch_output'
+FTS_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5({FTS_COLUMNS}, content='jobs', content_rowid='id')",
+    f"""CREATE TRIGGER IF NOT EXISTS jobs_fts_ai AFTER INSERT ON jobs BEGIN
+        INSERT INTO jobs_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, new.jobid, new.script, new.cluster, new.remote_sbatch, new.sbatch_output);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS jobs_fts_ad AFTER DELETE ON jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, old.jobid, old.script, old.cluster, old.remote_sbatch, old.sbatch_output);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS jobs_fts_au AFTER UPDATE OF {FTS_COLUMNS} ON jobs BEGIN
+        INSERT INTO jobs_fts(jobs_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, old.jobid, old.script, old.cluster, old.remote_sbatch, old.sbatch_output);
+        INSERT INTO jobs_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, new.jobid, new.script, new.cluster, new.remote_sbatch, new.sbatch_output);
+    END""",
+)
+
+# Statements are kept as constants so sqlite3's per-connection statement cache
+# compiles each of them once and reuses the prepared statement afterwards.
+SQL_INSERT_JOB = ('INSERT INTO jobs (jobid, remote_sbatch, remote_out, submitted_at, status, sbatch_output, cluster, script) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_UPDATE_STATUS = 'UPDATE jobs SET status=? WHERE jobid=? AND cluster IS ?'
+SQL_CLOSE_UNSUBMITTED = "UPDATE jobs SET status='SUBMIT_FAILED' WHERE status='SUBMITTED' AND (jobid IS NULL OR jobid IN ('', 'None'))"
+SQL_LIST_JOBS = 'SELECT jobid, remote_sbatch, remote_out, submitted_at, status, cluster FROM jobs ORDER BY id DESC LIMIT ?'
+SQL_INSERT_ARRAY_PARENT = ('INSERT INTO jobs (jobid, remote_sbatch, remote_out, submitted_at, status, sbatch_output, array_size, cluster, script) '
+                           'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_INSERT_ARRAY_TASK = ('INSERT INTO jobs (jobid, remote_sbatch, remote_out, submitted_at, status, sbatch_output, array_parent, array_task, cluster, script) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_INSERT_PACK = ('INSERT INTO jobs (jobid, remote_sbatch, remote_out, submitted_at, status, sbatch_output, cluster, script, pack_dir, pack_workers) '
+                   'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_INSERT_PACK_TASK = "INSERT INTO pack_tasks (pack_id, task, args, status) VALUES (?, ?, ?, 'QUEUED')"
+SQL_OPEN_PACKS = ("SELECT jobid, id, pack_dir, pack_workers FROM jobs WHERE cluster IS ? AND pack_dir IS NOT NULL "
+                  "AND EXISTS (SELECT 1 FROM pack_tasks WHERE pack_id=jobs.id AND status IN ('QUEUED', 'RUNNING'))")
+# a RUNNING line read again (e.g. after a restart) must not reopen a finished task
+SQL_UPDATE_PACK_TASK = ("UPDATE pack_tasks SET status=?1, worker=?2, elapsed_s=?3, error=?4, finished_at=?5 "
+                        "WHERE pack_id=?6 AND task=?7 AND (?1 != 'RUNNING' OR status = 'QUEUED')")
+SQL_PACK_COUNTS = 'SELECT status, COUNT(*) FROM pack_tasks WHERE pack_id=? GROUP BY status'
+SQL_GET_PACK = ('SELECT id, status, pack_dir, pack_workers, cluster FROM jobs '
+                'WHERE jobid=?1 AND (?2 IS NULL OR cluster=?2) AND pack_dir IS NOT NULL ORDER BY id DESC LIMIT 1')
+# a file of a pinned job (or of a task of a pinned array job) is pinned as it arrives;
+# a pin set on the file itself survives re-fetching
+SQL_UPSERT_RESULT = ('INSERT INTO results (path, cluster, jobid, remote_path, size, sha256, remote_mtime, fetched_at, last_access, pinned) '
+                     "VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?8, ?9, EXISTS (SELECT 1 FROM result_pins WHERE cluster=?2 "
+                     "AND (jobid=?3 OR ?3 LIKE jobid || '\\_%' ESCAPE '\\'))) "
+                     'ON CONFLICT(path) DO UPDATE SET cluster=excluded.cluster, jobid=excluded.jobid, remote_path=excluded.remote_path, '
+                     'size=excluded.size, sha256=excluded.sha256, remote_mtime=excluded.remote_mtime, fetched_at=excluded.fetched_at, '
+                     'last_access=excluded.last_access, pinned=MAX(pinned, excluded.pinned)')
+SQL_HELD_RESULTS = 'SELECT remote_path, size, remote_mtime FROM results WHERE cluster=? AND remote_path > ? AND remote_path < ?'
+SQL_TOUCH_RESULT = 'UPDATE results SET last_access=? WHERE path=?'
+SQL_RESULTS_USAGE = 'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(CASE WHEN pinned THEN size END), 0) FROM results'
+SQL_EVICTION_ORDER = 'SELECT path, size, last_access FROM results WHERE pinned=0 ORDER BY last_access'
+SQL_FORGET_RESULT = 'DELETE FROM results WHERE path=? AND last_access=?'
+SQL_PACK_DIRS = 'SELECT pack_dir, jobid FROM jobs WHERE cluster IS ? AND pack_dir IS NOT NULL'
+SQL_ASSIGN_CLUSTER = 'UPDATE jobs SET cluster=? WHERE cluster IS NULL'
+SQL_UNACCOUNTED = ('SELECT DISTINCT jobid FROM jobs WHERE cluster IS ? AND acct IS NULL AND array_size IS NULL AND jobid IS NOT NULL '
+                   'AND status IN ({}) ORDER BY id DESC LIMIT ?')
+SQL_SET_ACCOUNTING = 'UPDATE jobs SET elapsed_s=?, max_rss_kb=?, cpu_eff=?, exit_code=?, acct=1 WHERE jobid=? AND cluster IS ?'
+SQL_NO_ACCOUNTING = 'UPDATE jobs SET acct=-1 WHERE jobid=? AND cluster IS ? AND acct IS NULL'
+SQL_INSERT_TRANSFER = 'INSERT INTO transfer_stats (ts, method, files, bytes, seconds, mbps) VALUES (?, ?, ?, ?, ?, ?)'
+SQL_TRANSFER_RATES = '''
+    SELECT method, AVG(mbps), COUNT(*) FROM
+        (SELECT method, mbps, ROW_NUMBER() OVER (PARTITION BY method ORDER BY id DESC) AS n FROM transfer_stats
+         WHERE bytes > 0 AND bytes >= files * ? AND bytes <= files * ?)
+    WHERE n <= ? GROUP BY method'''
+SQL_GET_JOB = ('SELECT jobid, remote_sbatch, remote_out, submitted_at, status, cluster FROM jobs '
+               'WHERE jobid=?1 AND (?2 IS NULL OR cluster=?2) ORDER BY id DESC LIMIT 1')
+SQL_INSERT_POWER = 'INSERT INTO power_history (ts, power, util, est_flops) VALUES (?, ?, ?, ?)'
+SQL_POWER_RANGE = 'SELECT ts, power, util, est_flops FROM power_history WHERE ts >= ? AND ts < ? ORDER BY ts'
+SQL_ROLLUP_RANGE = 'SELECT bucket_ts, power, util, est_flops FROM power_history_rollup WHERE bucket_ts >= ? AND bucket_ts < ? ORDER BY bucket_ts'
+def _rollup_merge(col, n):
+    """SET clause merging a rolled-up average with a new one, each weighted by its count of
+    non-NULL samples, so a bucket with missing samples keeps the average of the others."""
+    old = f"(CASE WHEN {col} IS NULL THEN 0 ELSE COALESCE({n}, samples) END)"
+    return (f"{col}=CASE WHEN {old} + excluded.{n} = 0 THEN NULL ELSE "
+            f"(COALESCE({col}, 0.0)*{old} + COALESCE(excluded.{col}, 0.0)*excluded.{n}) / ({old} + excluded.{n}) END, "
+            f"{n}={old} + excluded.{n}")
+
+SQL_ROLLUP_POWER = f'''
+    INSERT INTO power_history_rollup (bucket_ts, power, util, est_flops, samples, power_samples, util_samples, flops_samples)
+    SELECT strftime('%Y-%m-%dT%H:%M:%S', (CAST(strftime('%s', ts) AS INTEGER) / :width) * :width, 'unixepoch'),
+           AVG(power), AVG(util), AVG(est_flops), COUNT(*), COUNT(power), COUNT(util), COUNT(est_flops)
+    FROM power_history WHERE ts < :cutoff GROUP BY 1
+    ON CONFLICT(bucket_ts) DO UPDATE SET
+        {_rollup_merge('power', 'power_samples')},
+        {_rollup_merge('util', 'util_samples')},
+        {_rollup_merge('est_flops', 'flops_samples')},
+        samples=samples + excluded.samples
+'''
+
+class Storage:
+    """Thread-safe access to the dashboard database.
+
+    A single long-lived connection in WAL mode is shared by all threads and guarded
+    by a lock. Power samples are queued and written in batches by a background
+    flusher, which also applies the power_history retention policy.
+    """
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False, cached_statements=256)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        with self._conn:
+            tables = [st for st in SCHEMA if st.startswith('CREATE TABLE')]   # tables, then migrations, then indexes
+            for stmt in tables: self._conn.execute(stmt)
+            for table, column, decl in MIGRATIONS:
+                cols = {r[1] for r in self._conn.execute(f'PRAGMA table_info({table})')}
+                if column not in cols: self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+            for stmt in SCHEMA:
+                if stmt not in tables: self._conn.execute(stmt)
+            rows = self._conn.execute('SELECT id, remote_sbatch FROM jobs WHERE script IS NULL AND remote_sbatch IS NOT NULL').fetchall()
+            self._conn.executemany('UPDATE jobs SET script=? WHERE id=?', [(script_name(sb), i) for i, sb in rows])
+        self.fts = self._create_fts()
+        self._power_queue = []
+        self._wake = threading.Event()
+        self._closed = False
+        self._last_retention = 0.0
+        self._flusher = threading.Thread(target=self._flush_loop, name='db-flusher', daemon=True)
+        self._flusher.start()
+
+    def _create_fts(self):
+        fresh = not self._conn.execute("SELECT 1 FROM sqlite_master WHERE name='jobs_fts'").fetchone()
+        try:
+            with self._conn:
+                for stmt in FTS_SCHEMA: self._conn.execute(stmt)
+                if fresh: self._conn.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")    # index existing rows
+            return True
+        except sqlite3.OperationalError:
+            return False                   # sqlite3 built without FTS5
+
+    def _locked(self):
+        # time spent waiting for the connection lock is SQLite contention as the GUI feels it
+        return self._timed_lock() if METRICS.enabled else self._lock
+
+    @contextmanager
+    def _timed_lock(self):
+        t0 = time.perf_counter()
+        with self._lock:
+            METRICS.observe('db_lock_wait', time.perf_counter() - t0)
+            yield
+
+    def execute(self, sql, params=()):
+        op, table = sql_labels(sql)
+        with self._locked(), METRICS.timer('db', op=op, table=table):
+            return self._conn.execute(sql, params).fetchall()
+
+    def transaction(self, fn):
+        """Run fn(conn) inside one transaction and return its result."""
+        with self._locked(), METRICS.timer('db', op='transaction', table=''), self._conn:
+            return fn(self._conn)
+
+    def insert_job(self, jobid, remote_sbatch, remote_out, sbatch_output, status='SUBMITTED', cluster=None):
+        row = (str(jobid) if jobid else None, remote_sbatch, remote_out, datetime.utcnow().isoformat(), status, sbatch_output, cluster,
+               script_name(remote_sbatch))
+        self.transaction(lambda c: c.execute(SQL_INSERT_JOB, row))
+
+    def update_statuses(self, changes, cluster=None):
+        rows = [(st, str(j), cluster) for j, st in changes]
+        if rows: self.transaction(lambda c: c.executemany(SQL_UPDATE_STATUS, rows))
+
+    def active_jobs(self, cluster=None):
+        """(jobid, status, remote_out) of active jobs on cluster, or (..., cluster) on all clusters."""
+        marks = ','.join('?' * len(ACTIVE_JOB_STATES))
+        sql = f'SELECT jobid, status, remote_out{", cluster" if cluster is None else ""} FROM jobs WHERE status IN ({marks}) AND array_size IS NULL'
+        def run(c):
+            c.execute(SQL_CLOSE_UNSUBMITTED)
+            if cluster is None: return c.execute(sql, ACTIVE_JOB_STATES).fetchall()
+            return c.execute(sql + ' AND cluster IS ?', ACTIVE_JOB_STATES + (cluster,)).fetchall()
+        return self.transaction(run)
+
+    def assign_cluster(self, name):
+        """Attribute jobs recorded before clusters had names to `name`."""
+        return self.transaction(lambda c: c.execute(SQL_ASSIGN_CLUSTER, (name,)).rowcount)
+
+    def insert_array_job(self, parent, remote_sbatch, out_pattern, sbatch_output, size, cluster=None):
+        """Parent row plus one SUBMITTED row per task (jobid `<parent>_<i>`), in one transaction."""
+        now = datetime.utcnow().isoformat()
+        script = script_name(remote_sbatch)
+        tasks = [(f"{parent}_{i}", remote_sbatch, out_pattern.replace('%A', parent).replace('%a', str(i)), now, 'SUBMITTED', None, parent, i,
+                  cluster, script) for i in range(size)]
+        def run(c):
+            c.execute(SQL_INSERT_ARRAY_PARENT, (parent, remote_sbatch, out_pattern, now, 'PENDING', sbatch_output, size, cluster, script))
+            c.executemany(SQL_INSERT_ARRAY_TASK, tasks)
+        self.transaction(run)
+
+    def refresh_array_parents(self, parents, cluster=None):
+        """Roll task states up into each parent row: RUNNING/PENDING while tasks are
+        active, then COMPLETED or FAILED once every task is final."""
+        def run(c):
+            for parent in set(parents):
+                counts = dict(c.execute('SELECT status, COUNT(*) FROM jobs WHERE array_parent=? AND cluster IS ? GROUP BY status',
+                                        (parent, cluster)).fetchall())
+                if not counts: continue
+                active = sum(n for st, n in counts.items() if st in ACTIVE_JOB_STATES)
+                if counts.get('RUNNING'): status = 'RUNNING'
+                elif active: status = 'PENDING'
+                else: status = 'COMPLETED' if set(counts) == {'COMPLETED'} else 'FAILED'
+                c.execute('UPDATE jobs SET status=? WHERE jobid=? AND cluster IS ? AND array_size IS NOT NULL', (status, parent, cluster))
+        self.transaction(run)
+
+    # --- packed submissions ---
+    def insert_pack_job(self, jobid, remote_sbatch, remote_out, sbatch_output, pack_dir, workers, arg_sets, cluster=None):
+        """Job row of a pack plus one QUEUED pack_tasks row per argument set, in one transaction."""
+        row = (str(jobid), remote_sbatch, remote_out, datetime.utcnow().isoformat(), 'SUBMITTED', sbatch_output, cluster,
+               script_name(remote_sbatch), pack_dir, workers)
+        def run(c):
+            pack_id = c.execute(SQL_INSERT_PACK, row).lastrowid
+            c.executemany(SQL_INSERT_PACK_TASK, [(pack_id, i, args) for i, args in enumerate(arg_sets)])
+        self.transaction(run)
+
+    def open_packs(self, cluster):
+        """{jobid: (pack id, pack dir, workers)} of cluster's packs with tasks still queued or running."""
+        return {jobid: (pack_id, pack_dir, workers) for jobid, pack_id, pack_dir, workers in self.execute(SQL_OPEN_PACKS, (cluster,))}
+
+    def record_pack_progress(self, pack_id, updates):
+        """updates: [(task, status, worker, elapsed_s, error)] read from the workers' progress logs."""
+        now = datetime.utcnow().isoformat()
+        rows = [(st, worker, elapsed, error or None, None if st == 'RUNNING' else now, pack_id, task) for task, st, worker, elapsed, error in updates]
+        if rows: self.transaction(lambda c: c.executemany(SQL_UPDATE_PACK_TASK, rows))
+
+    def close_pack(self, pack_id):
+        """The pack's allocation ended: tasks still running were cut off, queued ones never ran."""
+        def run(c):
+            c.execute("UPDATE pack_tasks SET status='FAILED', error='allocation ended', finished_at=? WHERE pack_id=? AND status='RUNNING'",
+                      (datetime.utcnow().isoformat(), pack_id))
+            c.execute("UPDATE pack_tasks SET status='NOT_RUN' WHERE pack_id=? AND status='QUEUED'", (pack_id,))
+        self.transaction(run)
+
+    def pack_counts(self, pack_id):
+        """{task status: count} of a pack."""
+        return dict(self.execute(SQL_PACK_COUNTS, (pack_id,)))
+
+    def pack_tasks(self, pack_id, status=None, after=-1, limit=HISTORY_PAGE):
+        """Rows (task, args, status, worker, elapsed_s, finished_at, error) of a pack after task `after`."""
+        where, params = 'pack_id=? AND task>?', [pack_id, int(after)]
+        if status:
+            status = [status] if isinstance(status, str) else list(status)
+            where += f" AND status IN ({','.join('?' * len(status))})"; params += status
+        return self.execute(f'SELECT task, args, status, worker, elapsed_s, finished_at, error FROM pack_tasks WHERE {where} ORDER BY task LIMIT ?',
+                            params + [int(limit)])
+
+    # --- result catalog ---
+    def record_results(self, rows):
+        """rows: (local path, cluster, jobid, remote path, size, sha256, remote mtime) of files just fetched."""
+        fetched = datetime.utcnow().isoformat(); now = time.time()
+        rows = [(str(path), *rest, fetched, now) for path, *rest in rows]
+        if rows: self.transaction(lambda c: c.executemany(SQL_UPSERT_RESULT, rows))
+
+    def held_results(self, cluster, remote_dir):
+        """{relpath: (size, remote mtime)} of the catalogued files fetched from under remote_dir."""
+        prefix = remote_dir.rstrip('/') + '/'
+        return {rp[len(prefix):]: (size, mtime) for rp, size, mtime in self.execute(SQL_HELD_RESULTS, (cluster, prefix, prefix[:-1] + '0'))}
+
+    def touch_results(self, paths):
+        now = time.time()
+        self.transaction(lambda c: c.executemany(SQL_TOUCH_RESULT, [(now, str(p)) for p in paths]))
+
+    def results_usage(self):
+        """(files, bytes, pinned bytes) in the catalog."""
+        return tuple(self.execute(SQL_RESULTS_USAGE)[0])
+
+    def eviction_candidates(self, nbytes):
+        """Rows (path, size, last_access) of the least recently used unpinned files, adding up to at least nbytes."""
+        def run(c):
+            rows = []; total = 0
+            for row in c.execute(SQL_EVICTION_ORDER):
+                if total >= nbytes: break
+                rows.append(row); total += row[1] or 0
+            return rows
+        return self.transaction(run)
+
+    def forget_results(self, rows):
+        """Drop the rows of evicted files, unless a file was fetched again meanwhile (its last_access moved)."""
+        self.transaction(lambda c: c.executemany(SQL_FORGET_RESULT, [(path, last) for path, _, last in rows]))
+
+    def pin_results(self, pinned, cluster=None, jobid=None, path=None):
+        """Pin or unpin the files of a job (and of its array tasks), including files fetched
+        later, or the files at or under a local path. Returns the number of catalogued files changed."""
+        def run(c):
+            if jobid is not None:
+                c.execute('INSERT OR IGNORE INTO result_pins (cluster, jobid) VALUES (?, ?)' if pinned else
+                          'DELETE FROM result_pins WHERE cluster=? AND jobid=?', (cluster, jobid))
+                return c.execute("UPDATE results SET pinned=?1 WHERE cluster=?2 AND (jobid=?3 OR jobid LIKE ?3 || '\\_%' ESCAPE '\\')",
+                                 (int(pinned), cluster, jobid)).rowcount
+            path_ = str(path).rstrip(os.sep); prefix = path_ + os.sep
+            return c.execute('UPDATE results SET pinned=? WHERE path=? OR (path > ? AND path < ?)',
+                             (int(pinned), path_, prefix, path_ + chr(ord(os.sep) + 1))).rowcount
+        return self.transaction(run)
+
+    def results(self, cluster=None, jobid=None, pinned=None, limit=HISTORY_PAGE):
+        """Catalog rows (RESULT_COLUMNS), most recently used first."""
+        where, params = [], []
+        if cluster is not None: where.append('cluster=?'); params.append(cluster)
+        if jobid is not None: where.append('jobid=?'); params.append(str(jobid))
+        if pinned is not None: where.append('pinned=?'); params.append(int(bool(pinned)))
+        sql = f"SELECT {', '.join(RESULT_COLUMNS)} FROM results{' WHERE ' + ' AND '.join(where) if where else ''} ORDER BY last_access DESC LIMIT ?"
+        return self.execute(sql, params + [int(limit)])
+
+    # --- job history ---
+    def job_history(self, status=None, script=None, since=None, until=None, text=None, cluster=None, sort='submitted',
+                    descending=True, after=None, limit=HISTORY_PAGE):
+        """One page of the job history, filtered in SQL and paged by keyset: pass the
+        returned `next` as `after` for the following page. since/until are ISO dates or
+        timestamps (a bare until date includes that day); text is a full-text search.
+        Returns {'rows': [HISTORY_COLUMNS tuples], 'next': cursor or None}."""
+        where, params = [], []
+        if status:
+            status = [status] if isinstance(status, str) else list(status)
+            where.append(f"status IN ({','.join('?' * len(status))})"); params += status
+        if script: where.append('script = ?'); params.append(script)
+        if cluster: where.append('cluster = ?'); params.append(cluster)
+        if since: where.append('submitted_at >= ?'); params.append(since)
+        if until: where.append("submitted_at < date(?, '+1 day')" if len(until) == 10 else 'submitted_at < ?'); params.append(until)
+        if text and text.strip():
+            if self.fts: where.append('id IN (SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH ?)'); params.append(fts_query(text))
+            else:                                  # like the FTS query: every word, anywhere
+                for word in text.split():
+                    where.append(f"({HISTORY_LIKE_TEXT}) LIKE ? ESCAPE '\\'")
+                    params.append('%' + re.sub(r'([\\%_])', r'\\\1', word) + '%')
+        column = HISTORY_SORTS[sort]
+        key = 'id' if column == 'id' else f'COALESCE({column}, -1)'       # unaccounted rows sort as -1
+        op, order = ('<', 'DESC') if descending else ('>', 'ASC')
+        if after:
+            if column == 'id': where.append(f'id {op} ?'); params.append(after[1])
+            else: where.append(f'({key}, id) {op} (?, ?)'); params += list(after)
+        sql = (f"SELECT {', '.join(HISTORY_COLUMNS)}, {key} FROM jobs {'WHERE ' + ' AND '.join(where) if where else ''} "
+               f"ORDER BY {key} {order}, id {order} LIMIT ?")
+        rows = self.execute(sql, params + [int(limit)])
+        cursor = [rows[-1][-1], rows[-1][0]] if len(rows) == int(limit) else None
+        return {'rows': [r[:-1] for r in rows], 'next': cursor}
+
+    def unaccounted_jobs(self, cluster, limit):
+        """Job ids of cluster that are final but have no accounting recorded yet."""
+        sql = SQL_UNACCOUNTED.format(','.join('?' * len(TERMINAL_JOB_STATES)))
+        return [r[0] for r in self.execute(sql, (cluster,) + tuple(sorted(TERMINAL_JOB_STATES)) + (limit,))]
+
+    def record_accounting(self, accounting, missing, cluster):
+        """accounting: {jobid: (elapsed_s, max_rss_kb, cpu_eff, exit_code)}; missing: ids sacct did not know."""
+        def run(c):
+            c.executemany(SQL_SET_ACCOUNTING, [v + (j, cluster) for j, v in accounting.items()])
+            c.executemany(SQL_NO_ACCOUNTING, [(j, cluster) for j in missing])
+        self.transaction(run)
+
+    # --- power history ---
+    def record_transfer(self, method, files, nbytes, seconds):
+        mbps = nbytes / max(seconds, 1e-6) / 1e6
+        row = (datetime.utcnow().isoformat(), method, files, nbytes, seconds, mbps)
+        self.transaction(lambda c: c.execute(SQL_INSERT_TRANSFER, row))
+
+    def transfer_rates(self, last=20, mean_bytes=None):
+        """{method: (mean MB/s over its last `last` non-empty transfers, count)}; with mean_bytes,
+        only transfers whose files averaged within TRANSFER_RATE_SIZE_BAND of that size count."""
+        lo, hi = (mean_bytes / TRANSFER_RATE_SIZE_BAND, mean_bytes * TRANSFER_RATE_SIZE_BAND) if mean_bytes else (0, float('inf'))
+        with self._lock:
+            return {m: (rate, n) for m, rate, n in self._conn.execute(SQL_TRANSFER_RATES, (lo, hi, last)).fetchall()}
+
+    def queue_power(self, ts, power, util, est_flops=None):
+        with self._lock:
+            self._power_queue.append((ts.isoformat(), power, util, est_flops))
+            full = len(self._power_queue) >= POWER_FLUSH_BATCH
+        if full: self._wake.set()
+
+    def flush(self):
+        with self._locked():
+            batch, self._power_queue = self._power_queue, []
+            if batch:
+                with METRICS.timer('db', op='insert', table='power_history'), self._conn: self._conn.executemany(SQL_INSERT_POWER, batch)
+        return len(batch)
+
+    def power_range(self, start, end):
+        """Samples in [start, end): raw rows where retained, rollups for older spans."""
+        s, e = start.isoformat(), end.isoformat()
+        self.flush()
+        with self._lock:
+            return self._conn.execute(SQL_ROLLUP_RANGE, (s, e)).fetchall() + self._conn.execute(SQL_POWER_RANGE, (s, e)).fetchall()
+
+    def apply_retention(self, now=None):
+        """Roll raw power samples older than POWER_RAW_RETENTION_DAYS into
+        POWER_ROLLUP_SECONDS buckets and drop expired rollups."""
+        now = now or datetime.utcnow()
+        cutoff_epoch = int((now - timedelta(days=POWER_RAW_RETENTION_DAYS)).replace(tzinfo=timezone.utc).timestamp())
+        cutoff_epoch -= cutoff_epoch % POWER_ROLLUP_SECONDS  # whole buckets only, so each is rolled up once
+        cutoff = datetime.fromtimestamp(cutoff_epoch, timezone.utc).replace(tzinfo=None).isoformat()
+        expiry = (now - timedelta(days=POWER_ROLLUP_RETENTION_DAYS)).isoformat()
+        def run(c):
+            c.execute(SQL_ROLLUP_POWER, {'width': POWER_ROLLUP_SECONDS, 'cutoff': cutoff})
+            c.execute('DELETE FROM power_history WHERE ts < ?', (cutoff,))
+            c.execute('DELETE FROM power_history_rollup WHERE bucket_ts < ?', (expiry,))
+        self.transaction(run)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(POWER_FLUSH_INTERVAL); self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - self._last_retention >= POWER_RETENTION_EVERY:
+                    self._last_retention = time.time(); self.apply_retention()
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        self._closed = True; self._wake.set()
+        try: self.flush()
+        finally:
+            with self._lock: self._conn.close()
+
+HISTORY_COLUMNS = ('id', 'jobid', 'cluster', 'script', 'status', 'submitted_at', 'elapsed_s', 'max_rss_kb', 'cpu_eff', 'exit_code',
+                   'remote_sbatch', 'remote_out')
+RESULT_COLUMNS = ('path', 'cluster', 'jobid', 'remote_path', 'size', 'sha256', 'remote_mtime', 'fetched_at', 'last_access', 'pinned')
+HISTORY_SORTS = {'submitted': 'id', 'elapsed': 'elapsed_s', 'max_rss': 'max_rss_kb', 'cpu_eff': 'cpu_eff'}
+HISTORY_LIKE_TEXT = ("COALESCE(jobid, '') || ' ' || COALESCE(script, '') || ' ' || COALESCE(cluster, '') || ' ' || "
+                     "COALESCE(remote_sbatch, '') || ' ' || COALESCE(sbatch_output, '')")    # FTS_COLUMNS without FTS5
+SCRIPT_SBATCH_RE = re.compile(r'_(?:job|sweep|pack)_\d+\.sh$')
+
+def script_name(remote_sbatch):
+    """MATLAB script name from a generated sbatch path (<script>_{job,sweep,pack}_<ts>.sh)."""
+    return SCRIPT_SBATCH_RE.sub('', posixpath.basename(remote_sbatch)) if remote_sbatch else None
+
+def fts_query(text):
+    """User text -> FTS5 query: every word must match, as a prefix, with FTS syntax quoted away."""
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in text.split())
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    global _storage
+    with _storage_lock:
+        if _storage is None: _storage = Storage(DB_PATH)
+        return _storage
+
+def init_db():
+    get_storage()
+
+def insert_job_record(jobid, remote_sbatch, remote_out, sbatch_output, status='SUBMITTED', cluster=None):
+    get_storage().insert_job(jobid, remote_sbatch, remote_out, sbatch_output, status, cluster)
+
+def update_job_status(jobid, new_status, cluster=None):
+    get_storage().update_statuses([(jobid, new_status)], cluster)
+
+def update_job_statuses(changes, cluster=None):
+    """Apply many (jobid, new_status) pairs of one cluster in a single transaction."""
+    get_storage().update_statuses(changes, cluster)
+
+def list_active_jobs(cluster=None):
+    """Rows (jobid, status, remote_out) for every job of cluster Slurm may still report
+    on; without cluster, rows of all clusters with the cluster name appended. Rows that
+    never got a job id are closed out as SUBMIT_FAILED on the way."""
+    return get_storage().active_jobs(cluster)
+
+def list_jobs(limit=100):
+    """Rows (jobid, remote_sbatch, remote_out, submitted_at, status, cluster), newest first."""
+    return get_storage().execute(SQL_LIST_JOBS, (limit,))
+
+def list_job_history(**filters):
+    """A page of job history rows (HISTORY_COLUMNS); see Storage.job_history."""
+    return get_storage().job_history(**filters)
+
+def get_job(jobid, cluster=None):
+    rows = get_storage().execute(SQL_GET_JOB, (str(jobid), cluster))
+    return rows[0] if rows else None
+
+def insert_power(ts, power, util, est_flops=None):
+    """Queue a power sample; it is written with the next batch flush."""
+    get_storage().queue_power(ts, power, util, est_flops)
+
+# ---------- config ----------
+def load_config():
+    if CONFIG_PATH.exists():
+        try: return json.loads(CONFIG_PATH.read_text())
+        except: return {}
+    return {}
+
+def save_config(cfg):
+    try: CONFIG_PATH.write_text(json.dumps(cfg, indent=2))
+    except: pass
+
+def update_config(cfg=None, **changes):
+    """Apply changes to the config file (and to cfg, if given) without overwriting keys
+    another process (GUI, daemon, CLI) saved in the meantime."""
+    if cfg is not None: cfg.update(changes)
+    current = load_config(); current.update(changes); save_config(current)
+
+# ---------- SSH helper ----------
+SSH_POOL_SIZE = 4                             # warm connections (transport + SFTP session) per host
+SSH_KEEPALIVE = 30                            # seconds between transport keepalives
+SSH_RECONNECT_BACKOFF = (0.5, 1.0, 2.0, 4.0, 8.0)
+SSH_TRANSPORT_ERRORS = (paramiko.SSHException, EOFError, OSError)
+
+class _PooledConnection:
+    __slots__ = ('client', 'sftp', 'created')
+    def __init__(self, client):
+        self.client = client; self.sftp = None; self.created = time.time()
+
+    def alive(self):
+        t = self.client.get_transport()
+        return t is not None and t.is_active()
+
+    def open_sftp(self):
+        if self.sftp is None: self.sftp = self.client.open_sftp()
+        return self.sftp
+
+    def close(self):
+        for obj in (self.sftp, self.client):
+            try:
+                if obj: obj.close()
+            except: pass
+
+class SSHClientEnhanced:
+    """SSH/SFTP client backed by a pool of warm connections to one host.
+
+    Every operation leases a whole connection (transport plus its SFTP session), so
+    the poller, the job watcher and GUI actions never share an SFTP session and a
+    long download only occupies one of the pool_size connections. Connections whose
+    transport died are replaced transparently, with backoff between attempts.
+    """
+    def __init__(self, hostname, username, key_path=None, password=None, port=22, passphrase_callback=None, pool_size=SSH_POOL_SIZE):
+        self.hostname = hostname; self.username = username; self.key_path = key_path
+        self.password = password; self.port = port; self.passphrase_callback = passphrase_callback
+        self.pool_size = max(1, int(pool_size)); self.timeout = 12
+        self._pkey = None            # loaded once so reconnects never prompt again
+        self._cond = threading.Condition()
+        self._idle = []; self._size = 0; self._closed = True
+        self._stats = {'leases': 0, 'waits': 0, 'wait_time': 0.0, 'reconnects': 0, 'failures': 0}
+
+    def _load_private_key(self, path):
+        last_exc = None
+        for name in ('Ed25519Key', 'RSAKey', 'ECDSAKey', 'DSSKey'):
+            KeyClass = getattr(paramiko, name, None)
+            if KeyClass is None: continue    # DSSKey is gone in newer paramiko
+            try:
+                return KeyClass.from_private_key_file(path)
+            except PasswordRequiredException as e:
+                last_exc = e
+                if self.passphrase_callback:
+                    pw = self.passphrase_callback()
+                    if pw is None: raise RuntimeError('Passphrase canceled')
+                    try: return KeyClass.from_private_key_file(path, password=pw)
+                    except Exception as e2: last_exc = e2; continue
+                else: raise
+            except Exception as e:
+                last_exc = e; continue
+        if last_exc: raise last_exc
+        return None
+
+    def _open(self):
+        with METRICS.timer('remote_call', op='connect', host=self.hostname): return self._open_client()
+
+    def _open_client(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        kw = dict(port=self.port, username=self.username, timeout=self.timeout)
+        try:
+            if self._pkey: client.connect(self.hostname, pkey=self._pkey, **kw)
+            elif self.password: client.connect(self.hostname, password=self.password, **kw)
+            else:
+                try:
+                    agent = Agent(); keys = agent.get_keys()
+                    if keys:
+                        connected=False
+                        for k in keys:
+                            try:
+                                client.connect(self.hostname, pkey=k, **kw)
+                                connected=True; self._pkey=k; break
+                            except Exception: pass
+                        if not connected:
+                            client.connect(self.hostname, **kw)
+                    else:
+                        client.connect(self.hostname, **kw)
+                except Exception:
+                    client.connect(self.hostname, **kw)
+            client.get_transport().set_keepalive(SSH_KEEPALIVE)
+            conn = _PooledConnection(client); conn.open_sftp()
+            return conn
+        except Exception as e:
+            try: client.close()
+            except: pass
+            raise RuntimeError(f"SSH connect failed: {e}")
+
+    def _open_with_backoff(self):
+        last_exc = None
+        for delay in (0.0,) + SSH_RECONNECT_BACKOFF:
+            if self._closed: break
+            if delay: time.sleep(delay)
+            try: return self._open()
+            except RuntimeError as e:
+                last_exc = e; self._stats['failures'] += 1
+        raise last_exc or RuntimeError("Not connected")
+
+    def connect(self, timeout=12):
+        self.timeout = timeout
+        if self.key_path: self._pkey = self._load_private_key(self.key_path)
+        self._closed = False
+        conn = self._open()    # first connection in the foreground so errors reach the caller
+        with self._cond:
+            self._idle.append(conn); self._size = 1
+        threading.Thread(target=self._warm, daemon=True).start()
+
+    def _warm(self):
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.pool_size: return
+                self._size += 1
+            try: conn = self._open()
+            except RuntimeError:
+                with self._cond: self._size -= 1; self._cond.notify()
+                return
+            self._release(conn)
+
+    def _acquire(self, timeout=None):
+        t0 = time.time(); conn = None
+        with self._cond:
+            while True:
+                if self._closed: raise RuntimeError("Not connected")
+                if self._idle: conn = self._idle.pop(); break
+                if self._size < self.pool_size: self._size += 1; break
+                self._stats['waits'] += 1
+                if not self._cond.wait(timeout): raise RuntimeError("SSH pool exhausted")
+            self._stats['leases'] += 1; self._stats['wait_time'] += time.time() - t0
+        METRICS.observe('ssh_lease_wait', time.time() - t0, host=self.hostname)
+        try:
+            if conn is None:
+                conn = self._open_with_backoff()
+            elif not conn.alive():
+                conn.close(); self._stats['reconnects'] += 1
+                conn = self._open_with_backoff()
+        except Exception:
+            with self._cond: self._size -= 1; self._cond.notify()
+            raise
+        return conn
+
+    def _release(self, conn, broken=False):
+        with self._cond:
+            if broken or self._closed:
+                conn.close(); self._size -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Exclusive use of one pooled connection for the duration of the block."""
+        conn = self._acquire(timeout); broken = False
+        try: yield conn
+        except SSH_TRANSPORT_ERRORS:
+            broken = not conn.alive(); raise
+        finally: self._release(conn, broken)
+
+    @contextmanager
+    def sftp_session(self, timeout=None):
+        """A private SFTP session for multi-step transfers (seek/read, stat + get, ...)."""
+        with self.lease(timeout) as conn:
+            yield conn.open_sftp()
+
+    def _with_retry(self, fn, retry=True):
+        # one transparent retry when the transport underneath died mid-operation
+        # (retry=False for non-idempotent commands, whose first run may have taken effect)
+        for attempt in (0, 1):
+            conn = self._acquire(); broken = False
+            try: return fn(conn)
+            except SSH_TRANSPORT_ERRORS:
+                broken = not conn.alive()
+                if not broken or attempt or not retry or self._closed: raise
+                self._stats['reconnects'] += 1
+            finally: self._release(conn, broken)
+
+    @property
+    def connected(self):
+        return not self._closed
+
+    def stats(self):
+        with self._cond:
+            st = dict(self._stats)
+            st.update(pool_size=self.pool_size, open=self._size, idle=len(self._idle), in_use=self._size - len(self._idle))
+        return st
+
+    def exec(self, cmd, timeout=20, retry=True):
+        """Run cmd and return its (stdout, stderr). Pass retry=False for commands that
+        must not run twice (sbatch): a dropped transport then raises instead."""
+        if self._closed: raise RuntimeError("Not connected")
+        def run(conn):
+            stdin, stdout, stderr = conn.client.exec_command(cmd, timeout=timeout)
+            stdin.close()
+            out, err = stdout.read(), stderr.read()
+            METRICS.add('bytes', len(out) + len(err), op='exec', direction='in', host=self.hostname)
+            return out.decode('utf-8', errors='ignore').strip(), err.decode('utf-8', errors='ignore').strip()
+        with METRICS.timer('remote_call', op='exec', host=self.hostname, command=command_kind(cmd)):
+            return self._with_retry(run, retry)
+
+    def exec_stream(self, cmd, feed=None, consume=None, timeout=None):
+        """Run cmd on one channel while feed(stdin) writes its standard input and/or
+        consume(stdout) reads its output as a stream (e.g. tar archives). Returns
+        (exit status, stdout, stderr); stdout is '' when consumed, and a consumer
+        returning False aborts the command."""
+        if self._closed: raise RuntimeError("Not connected")
+        def run(conn):
+            stdin, stdout, stderr = conn.client.exec_command(cmd, timeout=timeout)
+            if feed: feed(stdin); stdin.flush()
+            stdin.channel.shutdown_write()
+            if consume:
+                if consume(stdout) is False:
+                    stdout.channel.close(); return -1, '', 'cancelled'
+                out = ''
+            else: out = stdout.read().decode('utf-8', errors='ignore').strip()
+            err = stderr.read().decode('utf-8', errors='ignore').strip()
+            return stdout.channel.recv_exit_status(), out, err
+        with METRICS.timer('remote_call', op='exec_stream', host=self.hostname, command=command_kind(cmd)):
+            return self._with_retry(run)
+
+    def open_channel(self, cmd):
+        """Start cmd on a channel of its own that outlives the lease: it is multiplexed on
+        a pooled transport, which stays available to other operations meanwhile."""
+        if self._closed: raise RuntimeError("Not connected")
+        with self.lease() as conn:
+            chan = conn.client.get_transport().open_session(); chan.exec_command(cmd)
+        return chan
+
+    def put(self, local_path, remote_path):
+        if self._closed: raise RuntimeError("SFTP not connected")
+        with METRICS.timer('remote_call', op='put', host=self.hostname):
+            attrs = self._with_retry(lambda conn: conn.open_sftp().put(local_path, remote_path))
+        METRICS.add('bytes', attrs.st_size or 0, op='put', direction='out', host=self.hostname)
+
+    def get(self, remote_path, local_path):
+        if self._closed: raise RuntimeError("SFTP not connected")
+        with METRICS.timer('remote_call', op='get', host=self.hostname):
+            self._with_retry(lambda conn: conn.open_sftp().get(remote_path, local_path))
+        if METRICS.enabled: METRICS.add('bytes', os.path.getsize(local_path), op='get', direction='in', host=self.hostname)
+
+    def write_text(self, remote_path, text):
+        """Write a small remote file directly over SFTP, without a local temp file."""
+        if self._closed: raise RuntimeError("SFTP not connected")
+        data = text.encode('utf-8')
+        def run(conn):
+            with conn.open_sftp().open(remote_path, 'w') as f: f.write(data)
+        with METRICS.timer('remote_call', op='write', host=self.hostname): self._with_retry(run)
+        METRICS.add('bytes', len(data), op='write', direction='out', host=self.hostname)
+
+    def listdir(self, remote_path):
+        if self._closed: raise RuntimeError("SFTP not connected")
+        try:
+            with METRICS.timer('remote_call', op='listdir', host=self.hostname):
+                return self._with_retry(lambda conn: conn.open_sftp().listdir(remote_path))
+        except Exception: return []
+
+    def mkdir(self, remote_path):
+        if self._closed: raise RuntimeError("SFTP not connected")
+        try:
+            with METRICS.timer('remote_call', op='mkdir', host=self.hostname):
+                self._with_retry(lambda conn: conn.open_sftp().mkdir(remote_path))
+        except Exception: pass
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle); self._cond.notify_all()
+        for conn in idle: conn.close()
+
+# ---------- bulk transfer ----------
+TRANSFER_WORKERS = 4                 # parallel SFTP sessions used by one sync
+TRANSFER_CHUNK = 1 << 20
+SYNC_MANIFEST_NAME = '.sync_manifest.json'
+TRANSFER_METHODS = ('auto', 'tar', 'sftp')
+TAR_MIN_FILES = 16                   # 'auto' streams a tar when at least this many files are due ...
+TAR_MAX_MEAN_BYTES = 4 << 20         # ... and they are small on average; big files go over resumable SFTP
+TAR_GZIP_LEVEL = 1                   # favour throughput; outputs are mostly text and compress well anyway
+TRANSFER_RATE_SIZE_BAND = 4.0        # 'auto' compares recorded MB/s of transfers whose mean file size is within this factor ...
+TRANSFER_RATE_MIN_SAMPLES = 3        # ... once each method has this many of them; until then the rule above decides
+# POSIX sh has no pipefail: tar's exit status comes back on fd 3, so gzip succeeding cannot hide a failed tar
+TAR_STREAM_CMD = ('cd {dir} && exec 4>&1 && '
+                  's=$({{ {{ tar --null -T - -cf - 3>&-; echo $? >&3; }} | gzip -{level} >&4 3>&-; }} 3>&1) && exit "$s"')
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(TRANSFER_CHUNK), b''): h.update(block)
+    return h.hexdigest()
+
+class TransferEngine:
+    """Incremental, parallel download of a remote directory into a local one.
+
+    Remote size/mtime (and optionally a remote sha256) are compared against a JSON
+    manifest kept next to the local files, so only new or changed files are fetched.
+    Large files are downloaded over several pooled SFTP sessions into `.part` files
+    that are resumed on the next run if a transfer was interrupted; many small files
+    are streamed as one compressed tar over a single exec channel instead.
+
+    With a `catalog` (ResultCache.catalog) the files already held are looked up there
+    instead of the manifest's file list, and every fetched file is recorded in it with
+    its sha256, computed as it is written. `rates(mean_bytes=...)` (Storage.transfer_rates)
+    supplies the MB/s recorded for each method, which 'auto' prefers over its rule.
+    """
+    def __init__(self, ssh, workers=TRANSFER_WORKERS, use_checksum=False, log=None, progress=None, cancel=None,
+                 include=None, exclude=None, method='auto', catalog=None, rates=None):
+        self.ssh = ssh; self.workers = max(1, int(workers)); self.use_checksum = use_checksum
+        self.include = list(include or []); self.exclude = list(exclude or [])    # globs on relpath or file name
+        if method not in TRANSFER_METHODS: raise ValueError(f"unknown transfer method {method!r}")
+        self.method = method
+        self.log = log or (lambda msg: None)
+        self.progress = progress            # progress(done_bytes, total_bytes, relpath)
+        self.cancel = cancel                # callable returning True to stop early
+        self.catalog = catalog; self.rates = rates
+        self._lock = threading.Lock(); self._fetched = {}    # relpath -> (size, mtime, sha256), for the catalog
+
+    # --- listing / manifest ---
+    def list_remote(self, remote_dir, recursive=False):
+        """{relpath: (size, mtime)} for regular files under remote_dir: one `find` call,
+        or a walk over SFTP where find lacks -printf."""
+        depth = '' if recursive else '-maxdepth 1 '
+        rc, out, _ = self.ssh.exec_stream(f"find {shlex.quote(remote_dir)} -mindepth 1 {depth}-type f -printf '%P\\t%s\\t%T@\\n'", timeout=300)
+        if rc == 0:
+            files = {}
+            for line in out.splitlines():
+                parts = line.split('\t')
+                if len(parts) == 3: files[parts[0]] = (int(parts[1]), int(float(parts[2])))
+            return files
+        files = {}
+        with self.ssh.sftp_session() as sftp:
+            pending = ['']
+            while pending:
+                rel = pending.pop()
+                try: entries = sftp.listdir_attr(f"{remote_dir}/{rel}" if rel else remote_dir)
+                except IOError: continue
+                for a in entries:
+                    child = f"{rel}/{a.filename}" if rel else a.filename
+                    if stat.S_ISDIR(a.st_mode or 0):
+                        if recursive: pending.append(child)
+                    elif stat.S_ISREG(a.st_mode or 0):
+                        files[child] = (a.st_size, int(a.st_mtime or 0))
+        return files
+
+    @staticmethod
+    def load_manifest(local_dir):
+        try: return json.loads((Path(local_dir) / SYNC_MANIFEST_NAME).read_text())
+        except Exception: return {'files': {}, 'partial': {}}
+
+    @staticmethod
+    def save_manifest(local_dir, manifest):
+        path = Path(local_dir) / SYNC_MANIFEST_NAME
+        tmp = path.with_suffix('.tmp'); tmp.write_text(json.dumps(manifest)); os.replace(tmp, path)
+
+    def selected(self, rel):
+        name = rel.rsplit('/', 1)[-1]
+        match = lambda pats: any(fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(name, p) for p in pats)
+        return (not self.include or match(self.include)) and not match(self.exclude)
+
+    def choose_method(self, count, nbytes):
+        if self.method != 'auto': return self.method
+        mean = nbytes / max(count, 1)
+        measured = self.rates(mean_bytes=mean) if self.rates and nbytes else {}
+        if all(measured.get(m, (0, 0))[1] >= TRANSFER_RATE_MIN_SAMPLES for m in ('tar', 'sftp')):
+            return max(('tar', 'sftp'), key=lambda m: measured[m][0])
+        return 'tar' if count >= TAR_MIN_FILES and mean <= TAR_MAX_MEAN_BYTES else 'sftp'
+
+    def plan(self, remote_files, local_dir, manifest):
+        """Relpaths whose remote size/mtime differ from what we last fetched."""
+        todo = []
+        for rel, (size, mtime) in remote_files.items():
+            known = manifest['files'].get(rel)
+            local = Path(local_dir) / rel
+            if known and known[0] == size and known[1] == mtime and local.is_file() and local.stat().st_size == size:
+                continue
+            todo.append(rel)
+        return todo
+
+    def remote_checksums(self, remote_dir, relpaths):
+        """{relpath: sha256} computed on the remote side in one exec (sha256sum or shasum)."""
+        if not relpaths: return {}
+        names = ' '.join(shlex.quote(r) for r in relpaths)
+        out, _ = self.ssh.exec(f"cd {shlex.quote(remote_dir)} && (sha256sum -- {names} 2>/dev/null || shasum -a 256 -- {names})", timeout=300)
+        sums = {}
+        for line in out.splitlines():
+            parts = line.split(None, 1)
+            if len(parts) == 2: sums[parts[1].lstrip('*')] = parts[0]
+        return sums
+
+    # --- transfer ---
+    def _fetch_one(self, remote_path, local_path, size, mtime, partial, done):
+        """Download one file; returns its sha256 ('' without a catalog), None if cancelled."""
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        part = local_path.with_name(local_path.name + '.part')
+        offset = part.stat().st_size if part.exists() else 0
+        if partial != [size, mtime] or offset > size: offset = 0   # remote changed since the partial download
+        h = hashlib.sha256() if self.catalog else None
+        if h and offset:
+            with open(part, 'rb') as f:
+                for block in iter(lambda: f.read(TRANSFER_CHUNK), b''): h.update(block)
+        with self.ssh.sftp_session() as sftp, open(part, 'ab' if offset else 'wb') as out:
+            with sftp.open(remote_path, 'rb') as rf:
+                rf.seek(offset); rf.prefetch(size)
+                while offset < size:
+                    if self.cancel and self.cancel(): return None
+                    block = rf.read(min(TRANSFER_CHUNK, size - offset))
+                    if not block: break
+                    out.write(block); offset += len(block); done(len(block))
+                    if h: h.update(block)
+        if offset != size: raise IOError(f"short read: {offset}/{size} bytes")
+        os.replace(part, local_path); os.utime(local_path, (mtime, mtime))
+        return h.hexdigest() if h else ''
+
+    def _fetch_sftp(self, remote_dir, local_dir, todo, remote_files, manifest, done):
+        failed = []
+        def job(rel):
+            size, mtime = remote_files[rel]
+            with self._lock: partial = manifest['partial'].get(rel); manifest['partial'][rel] = [size, mtime]
+            digest = self._fetch_one(f"{remote_dir}/{rel}", local_dir / rel, size, mtime, partial, done)
+            if digest is None: return
+            with self._lock:
+                manifest['files'][rel] = [size, mtime]; manifest['partial'].pop(rel, None); self._fetched[rel] = (size, mtime, digest)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(job, rel): rel for rel in todo}
+            for fut in as_completed(futures):
+                try: fut.result()
+                except Exception as e:
+                    failed.append(futures[fut]); self.log(f"Failed to download {remote_dir}/{futures[fut]}: {e}")
+        return failed
+
+    def _fetch_tar(self, remote_dir, local_dir, todo, remote_files, manifest, done):
+        """Stream `tar | gzip` from the remote side and unpack it as it arrives; nothing
+        is staged on disk at either end beyond the per-file `.part`."""
+        wanted = set(todo); got = set()
+        names = ''.join(rel + '\0' for rel in todo).encode('utf-8')
+        def consume(stdout):
+            with tarfile.open(fileobj=stdout, mode='r|gz') as tar:
+                for m in tar:
+                    if self.cancel and self.cancel(): return False
+                    if not m.isreg() or m.name not in wanted: continue   # never write outside the requested set
+                    size, mtime = remote_files[m.name]
+                    local = local_dir / m.name; local.parent.mkdir(parents=True, exist_ok=True)
+                    part = local.with_name(local.name + '.part'); src = tar.extractfile(m)
+                    h = hashlib.sha256() if self.catalog else None
+                    with open(part, 'wb') as out:
+                        for block in iter(lambda: src.read(TRANSFER_CHUNK), b''):
+                            out.write(block); done(len(block))
+                            if h: h.update(block)
+                    os.replace(part, local); os.utime(local, (mtime, mtime))
+                    with self._lock:
+                        manifest['files'][m.name] = [size, mtime]; manifest['partial'].pop(m.name, None)
+                        self._fetched[m.name] = (size, mtime, h.hexdigest() if h else '')
+                    got.add(m.name)
+        cmd = TAR_STREAM_CMD.format(dir=shlex.quote(remote_dir), level=TAR_GZIP_LEVEL)
+        try:
+            rc, _, err = self.ssh.exec_stream(cmd, feed=lambda stdin: stdin.write(names), consume=consume)
+        except (tarfile.TarError, EOFError, OSError) as e:
+            rc = 0; self.log(f"tar stream from {remote_dir} broke off: {e}")
+        if self.cancel and self.cancel(): return []
+        if rc and rc != -1:
+            # e.g. a file that shrank while tar read it is zero-padded in the archive: trust none of it
+            self.log(f"tar on {remote_dir} exited with {rc}: {err}; its files will be fetched again")
+            with self._lock:
+                for rel in got: manifest['files'].pop(rel, None); self._fetched.pop(rel, None)
+            got.clear()
+        failed = [rel for rel in todo if rel not in got]
+        for rel in failed: self.log(f"Failed to download {remote_dir}/{rel}: missing from tar stream")
+        return failed
+
+    def sync(self, remote_dir, local_dir, recursive=False, prune=False, since_last=False):
+        """Fetch new/changed files from remote_dir into local_dir and return a summary dict.
+        since_last restricts the listing to files modified after the previous full sync."""
+        remote_dir = remote_dir.rstrip('/'); local_dir = Path(local_dir); local_dir.mkdir(parents=True, exist_ok=True)
+        t0 = time.time(); self._fetched = {}
+        manifest = self.load_manifest(local_dir); manifest.setdefault('files', {}); manifest.setdefault('partial', {})
+        if self.catalog: manifest['files'] = self.catalog.held(remote_dir)
+        listed = self.list_remote(remote_dir, recursive)
+        newer = manifest.get('last_sync', 0) if since_last else None
+        remote_files = {r: v for r, v in listed.items() if self.selected(r) and (newer is None or v[1] >= newer)}
+        todo = self.plan(remote_files, local_dir, manifest)
+        if self.use_checksum:
+            # files we already hold locally may only have been touched remotely
+            held = [r for r in todo if (local_dir / r).is_file() and (local_dir / r).stat().st_size == remote_files[r][0]]
+            sums = self.remote_checksums(remote_dir, held)
+            for r in held:
+                if sums.get(r) and sums[r] == _sha256_file(local_dir / r):
+                    manifest['files'][r] = list(remote_files[r]); todo.remove(r); self._fetched[r] = (*remote_files[r], sums[r])
+        skipped = len(remote_files) - len(todo)
+        total = sum(remote_files[r][0] for r in todo); moved = [0]; failed = []; complete = False
+        method = self.choose_method(len(todo), total)
+        def done(n):
+            with self._lock:
+                moved[0] += n; copied = moved[0]
+            if self.progress: self.progress(copied, total, None)
+        try:
+            if todo:
+                fetch = self._fetch_tar if method == 'tar' else self._fetch_sftp
+                failed = fetch(remote_dir, local_dir, todo, remote_files, manifest, done)
+            complete = not failed and not (self.cancel and self.cancel())
+        finally:
+            if prune and not (self.include or self.exclude or since_last):
+                for rel in [r for r in manifest['files'] if r not in listed]: del manifest['files'][rel]
+            if complete and not (self.include or self.exclude):
+                manifest['last_sync'] = max([v[1] for v in listed.values()] + [manifest.get('last_sync', 0)])
+            if self.catalog:
+                self.catalog.record(remote_dir, local_dir, self._fetched); manifest.pop('files')
+            self.save_manifest(local_dir, manifest)
+        secs = max(time.time() - t0, 1e-6)
+        METRICS.observe('transfer', secs, method=method, host=self.ssh.hostname)
+        METRICS.add('bytes', moved[0], op=f'sync_{method}', direction='in', host=self.ssh.hostname)
+        return {'files': len(todo) - len(failed), 'skipped': skipped, 'failed': failed, 'method': method,
+                'bytes': moved[0], 'seconds': secs, 'mbps': moved[0] / secs / 1e6}
+
+# ---------- upload cache ----------
+CAS_DIR_NAME = 'cas'                     # <remote_base>/hpc_jobs/cas/{blobs,trees}
+BUNDLE_SKIP_SUFFIXES = ('.asv', '.out', '.part', '.tmp', '.swp')
+BUNDLE_MAX_FILE_BYTES = 256 << 20        # larger files are left out of the bundle (and logged)
+BUNDLE_MAX_FILES = 5000
+DIGEST_CACHE_SIZE = 4 * BUNDLE_MAX_FILES  # file versions whose sha256 is remembered
+
+class BundleFile(NamedTuple):
+    rel: str
+    path: Path
+    size: int
+    digest: str
+
+@functools.lru_cache(maxsize=DIGEST_CACHE_SIZE)
+def _file_digest(path, size, mtime_ns):
+    """sha256 of one version (size, mtime) of a file: unchanged files are not re-read, and
+    the least recently used versions are dropped (lru_cache locks its own bookkeeping)."""
+    return _sha256_file(path)
+
+def _cached_digest(path, st):
+    return _file_digest(str(path), st.st_size, st.st_mtime_ns)
+
+def _bundle_candidate(p):
+    return not p.name.startswith(('.', 'tmp_')) and not p.name.endswith(BUNDLE_SKIP_SUFFIXES)
+
+def collect_bundle(local_m, project_dir=None, log=None):
+    """Files shipped with a script: everything under project_dir when given, otherwise
+    the script's own folder plus its MATLAB class/package/private subfolders."""
+    local_m = Path(local_m).resolve()
+    root = Path(project_dir).resolve() if project_dir else local_m.parent
+    if root not in local_m.parents: raise ValueError(f"{local_m.name} is not inside project dir {root}")
+    if project_dir: paths = (p for p in root.rglob('*') if not any(part.startswith('.') for part in p.relative_to(root).parts))
+    else: paths = itertools.chain(root.iterdir(), *(d.rglob('*') for d in root.iterdir()
+                                  if d.is_dir() and (d.name[0] in '+@' or d.name == 'private')))
+    files = []
+    for p in paths:
+        if not p.is_file() or not _bundle_candidate(p): continue
+        st = p.stat()
+        if st.st_size > BUNDLE_MAX_FILE_BYTES:
+            if log: log(f"Bundle: skipping {p} ({st.st_size >> 20} MB)")
+            continue
+        files.append((p, st))
+        if len(files) > BUNDLE_MAX_FILES: raise ValueError(f"{root} has more than {BUNDLE_MAX_FILES} files; declare a smaller project dir")
+    entries = [BundleFile(p.relative_to(root).as_posix(), p, st.st_size, _cached_digest(p, st)) for p, st in files]
+    entries.sort()
+    return root, entries
+
+def bundle_digest(entries):
+    h = hashlib.sha256()
+    for e in entries: h.update(f"{e.rel}\0{e.digest}\n".encode())
+    return h.hexdigest()
+
+class _CountingWriter:
+    def __init__(self, f): self.f = f; self.bytes = 0
+    def write(self, data):
+        self.f.write(data); self.bytes += len(data); return len(data)
+
+class UploadCache:
+    """Content-addressed store of submission bundles on the cluster: blobs/<sha256> holds
+    each file once, trees/<bundle sha256>/ is a hard-linked checkout of one bundle."""
+
+    def __init__(self, ssh, remote_root, log=None):
+        self.ssh = ssh; self.root = f"{remote_root}/{CAS_DIR_NAME}"; self.log = log or (lambda m: None)
+
+    def tree_dir(self, bundle): return f"{self.root}/trees/{bundle}"
+
+    def missing(self, bundle, digests):
+        """One round trip: None when the tree already exists, else the set of absent blobs."""
+        q = shlex.quote
+        listing = '\n'.join(sorted(set(digests)))
+        cmd = (f"mkdir -p {q(self.root)}/blobs {q(self.root)}/trees && cd {q(self.root)} && "
+               f"if [ -e trees/{bundle}/.complete ]; then echo TREE; exit 0; fi; "
+               f"while read h; do [ -e \"blobs/$h\" ] || echo \"$h\"; done <<'EOF'\n{listing}\nEOF")
+        out, err = self.ssh.exec(cmd)
+        if err and not out: raise RuntimeError(err)
+        lines = out.split()
+        return None if lines == ['TREE'] else set(lines)
+
+    def upload(self, entries):
+        """Send blobs as one gzip'd tar stream, unpacked into a staging dir and moved into
+        blobs/ only once complete. Returns the compressed bytes sent."""
+        q = shlex.quote
+        cmd = (f"cd {q(self.root)} && d=$(mktemp -d blobs/.in.XXXXXX) && tar -xzf - -C \"$d\" && "
+               f"for f in \"$d\"/*; do mv -f \"$f\" blobs/; done; rmdir \"$d\"")
+        sent = []
+        def feed(stdin):
+            w = _CountingWriter(stdin)
+            with tarfile.open(fileobj=w, mode='w|gz') as tar:
+                for e in entries: tar.add(str(e.path), arcname=e.digest, recursive=False)
+            sent.append(w.bytes)
+        rc, _, err = self.ssh.exec_stream(cmd, feed)
+        if rc: raise RuntimeError(f"blob upload failed: {err}")
+        return sent[-1]
+
+    def materialize(self, bundle, entries):
+        tree = f"trees/{bundle}"; tmp = f"{tree}.tmp$$"
+        dirs = sorted({os.path.dirname(e.rel) for e in entries} - {''})
+        lines = [f"rm -rf {tmp} && mkdir -p {tmp} || exit 1"]
+        lines += [f"mkdir -p {tmp}/{shlex.quote(d)}" for d in dirs]
+        lines += [f"ln -f blobs/{e.digest} {tmp}/{shlex.quote(e.rel)} 2>/dev/null || cp -f blobs/{e.digest} {tmp}/{shlex.quote(e.rel)} || exit 1"
+                  for e in entries]
+        lines += [f"touch {tmp}/.complete", f"rm -rf {tree} && mv {tmp} {tree}"]
+        script = '\n'.join(lines)
+        _, err = self.ssh.exec(f"cd {shlex.quote(self.root)} && sh -s <<'EOF'\n{script}\nEOF", timeout=120)
+        if err: raise RuntimeError(f"checkout failed: {err}")
+
+    def ensure(self, local_m, project_dir=None):
+        """Make sure the script's bundle is on the cluster. Returns (remote tree dir,
+        script path relative to it, stats)."""
+        t0 = time.perf_counter()
+        root, entries = collect_bundle(local_m, project_dir, self.log)
+        bundle = bundle_digest(entries)
+        stats = dict(files=len(entries), uploaded=0, bytes=0, cached=False)
+        missing = self.missing(bundle, [e.digest for e in entries])
+        if missing is None:
+            stats['cached'] = True
+        else:
+            todo = list({e.digest: e for e in entries if e.digest in missing}.values())
+            if todo:
+                stats['bytes'] = self.upload(todo); stats['uploaded'] = len(todo)
+            self.materialize(bundle, entries)
+        stats['seconds'] = time.perf_counter() - t0
+        return self.tree_dir(bundle), Path(local_m).resolve().relative_to(root).as_posix(), stats
+
+# ---------- result cache ----------
+RESULTS_QUOTA_GB = 20.0              # config 'results_quota_gb'; 0 disables eviction
+RESULTS_SHARED_DIR = 'shared'        # <root>/<cluster>/shared mirrors <shared>/outputs
+RESULT_JOBID_RE = re.compile(r'^(\d+(?:_\d+)?)(?=[._-]|$)')     # <jobid>.out and the like in <shared>/outputs
+UNSAFE_NAME_RE = re.compile(r'[^\w.-]+')
+
+def safe_name(name):
+    """A cluster or job name usable as one path component."""
+    return UNSAFE_NAME_RE.sub('_', str(name)).strip('.') or '_'
+
+class _SyncCatalog:
+    """The result catalog as TransferEngine sees it: the files of one cluster."""
+    def __init__(self, cache, cluster):
+        self.cache = cache; self.cluster = cluster
+
+    def held(self, remote_dir):
+        return get_storage().held_results(self.cluster, remote_dir)
+
+    def record(self, remote_dir, local_dir, fetched):
+        self.cache.record_sync(self.cluster, remote_dir, local_dir, fetched)
+
+class ResultCache:
+    """Local copies of job results under one root: <cluster>/<jobid>/ holds a job's
+    output, <cluster>/shared/ the mirror of <shared>/outputs. Every file fetched is
+    catalogued in the results table with its job id (when it can be told), size, sha256,
+    remote mtime and last access, so sync only asks for files not held yet, and after
+    each fetch the cache is trimmed to its quota by evicting the least recently used
+    files. Pinned files, and every file of a pinned job, are never evicted."""
+    def __init__(self, root=RESULTS_DIR, quota_gb=RESULTS_QUOTA_GB):
+        self.root = Path(root); self.quota = int(float(quota_gb) * 1e9); self._trim_lock = threading.Lock()
+
+    def configure(self, root=None, quota_gb=None):
+        if root: self.root = Path(root).expanduser()
+        if quota_gb is not None: self.quota = int(float(quota_gb) * 1e9)
+
+    def job_dir(self, cluster, jobid):
+        return self.root / safe_name(cluster or 'default') / safe_name(jobid)
+
+    def shared_dir(self, cluster):
+        return self.root / safe_name(cluster or 'default') / RESULTS_SHARED_DIR
+
+    def catalog(self, cluster):
+        return _SyncCatalog(self, cluster)
+
+    def record_file(self, cluster, jobid, remote_path, local_path, remote_mtime):
+        """Catalogue a complete local copy of one remote file (job output and the like)."""
+        local_path = Path(local_path)
+        get_storage().record_results([(local_path, cluster, str(jobid), remote_path, local_path.stat().st_size,
+                                       _sha256_file(local_path), int(remote_mtime or 0))])
+
+    def record_sync(self, cluster, remote_dir, local_dir, fetched):
+        """Catalogue files a sync fetched, {relpath: (size, mtime, sha256)}. A file belongs to
+        a job when it lies in a pack's result folder or is named after a known job id."""
+        if not fetched: return
+        storage = get_storage(); remote_dir = remote_dir.rstrip('/')
+        packs = [(d.rstrip('/') + '/', j) for d, j in storage.execute(SQL_PACK_DIRS, (cluster,))]
+        named = {}
+        for rel in fetched:
+            m = RESULT_JOBID_RE.match(posixpath.basename(rel))
+            if m: named[rel] = m.group(1)
+        ids = sorted(set(named.values())); known = set()
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            known.update(j for j, in storage.execute(f"SELECT DISTINCT jobid FROM jobs WHERE cluster IS ? AND jobid IN ({','.join('?' * len(chunk))})",
+                                                      [cluster] + chunk))
+        rows = []
+        for rel, (size, mtime, digest) in fetched.items():
+            remote = f"{remote_dir}/{rel}"
+            jobid = next((j for d, j in packs if remote.startswith(d)), None) or (named.get(rel) if named.get(rel) in known else None)
+            rows.append((Path(local_dir) / rel, cluster, jobid, remote, size, digest or None, int(mtime)))
+        storage.record_results(rows)
+
+    def touch(self, *paths):
+        get_storage().touch_results(paths)
+
+    def usage(self):
+        files, nbytes, pinned = get_storage().results_usage()
+        return {'root': str(self.root), 'quota': self.quota, 'files': files, 'bytes': nbytes, 'pinned_bytes': pinned}
+
+    def trim(self):
+        """Evict least recently used unpinned files until the catalogued total fits the quota.
+        Returns (files, bytes) evicted."""
+        if self.quota <= 0: return 0, 0
+        with self._trim_lock:
+            storage = get_storage(); _, total, _ = storage.results_usage()
+            if total <= self.quota: return 0, 0
+            victims = storage.eviction_candidates(total - self.quota); gone = []
+            for row in victims:
+                path = Path(row[0])
+                try: path.unlink()
+                except FileNotFoundError: pass
+                except OSError: continue
+                gone.append(row); self._prune_dirs(path.parent)
+            storage.forget_results(gone)
+        return len(gone), sum(size or 0 for _, size, _ in gone)
+
+    def _prune_dirs(self, folder):
+        """Remove folders left empty by an eviction, up to the cache root."""
+        root = self.root.resolve()
+        try:
+            while folder.resolve() != root and root in folder.resolve().parents:
+                folder.rmdir(); folder = folder.parent
+        except OSError: pass
+
+RESULTS = ResultCache()
+
+# ---------- job state watcher ----------
+# Slurm job states as reported by squeue %T / sacct State. Everything not listed as
+# active is final; UNKNOWN is ours, for jobs that vanished from squeue and sacct alike.
+ACTIVE_JOB_STATES = ('SUBMITTED', 'PENDING', 'RUNNING', 'CONFIGURING', 'COMPLETING', 'SUSPENDED',
+                     'REQUEUED', 'REQUEUE_HOLD', 'REQUEUE_FED', 'RESIZING', 'STOPPED', 'SIGNALING', 'STAGE_OUT')
+TERMINAL_JOB_STATES = frozenset(('COMPLETED', 'FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'CANCELLED', 'NODE_FAIL',
+                                 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE', 'REVOKED', 'SPECIAL_EXIT', 'UNKNOWN'))
+SACCT_GRACE_CYCLES = 3    # cycles a job may be missing from both squeue and sacct before it is UNKNOWN
+
+def normalize_slurm_state(raw):
+    # sacct prints e.g. "CANCELLED by 501"; some versions abbreviate OUT_OF_MEMORY
+    parts = (raw or '').strip().split()
+    if not parts: return ''
+    st = parts[0].rstrip('+').upper()
+    return 'OUT_OF_MEMORY' if st == 'OOM' else st
+
+def parse_squeue_states(text):
+    """Parse `squeue -h -o '%i %T'` output into {jobid: state}."""
+    states = {}
+    for line in (text or '').splitlines():
+        parts = line.split()
+        if len(parts) >= 2: states[parts[0]] = normalize_slurm_state(parts[1])
+    return states
+
+def parse_sacct_states(text):
+    """Parse `sacct -n -P -o JobID,State` output into {jobid: state}, ignoring job steps."""
+    states = {}
+    for line in (text or '').splitlines():
+        parts = line.strip().split('|')
+        if len(parts) >= 2 and parts[0] and '.' not in parts[0]:
+            states[parts[0]] = normalize_slurm_state(parts[1])
+    return states
+
+class JobStateWatcher:
+    """Tracks all active jobs with one squeue call per cycle (plus one sacct call for
+    jobs that have left the queue) and reports the state transitions."""
+    def __init__(self, grace_cycles=SACCT_GRACE_CYCLES):
+        self.grace_cycles = grace_cycles
+        self._missing = {}    # jobid -> consecutive cycles not seen anywhere
+
+    @staticmethod
+    def _query_ids(jobids):
+        # array tasks (<parent>_<i>) are queried through their parent, expanded with -r
+        return ','.join(dict.fromkeys(j.split('_', 1)[0] for j in jobids))
+
+    def query_states(self, ssh, jobids):
+        out, _ = ssh.exec(f"squeue -h -r -t all -j {self._query_ids(jobids)} -o '%i %T'")
+        states = parse_squeue_states(out)
+        gone = [j for j in jobids if j not in states]
+        if gone:
+            out, _ = ssh.exec(f"sacct -n -P -X -j {self._query_ids(gone)} -o JobID,State")
+            acct = parse_sacct_states(out)
+            states.update((j, acct[j]) for j in gone if j in acct)
+        return states
+
+    def poll(self, ssh, rows, known=None):
+        """Diff live Slurm state against `rows` of (jobid, status, remote_out); `known`
+        states ({jobid: state}, e.g. from a snapshot taken just now) spare the query for
+        the jobs they cover. Returns a list of (jobid, old_status, new_status, remote_out)."""
+        rows = [r for r in rows if r[0]]
+        if not rows: return []
+        states = {j: known[j] for j, _, _ in rows if known and known.get(j)}
+        rest = [j for j, _, _ in rows if j not in states]
+        if rest: states.update(self.query_states(ssh, rest))
+        return self.diff(rows, states)
+
+    def diff(self, rows, states):
+        """Transitions of rows given live {jobid: state}; jobs missing from states count
+        towards the grace period."""
+        transitions = []
+        for jobid, old, remote_out in rows:
+            new = states.get(jobid)
+            if not new:
+                # not yet in sacct (or accounting disabled): give it a few cycles
+                n = self._missing[jobid] = self._missing.get(jobid, 0) + 1
+                if n < self.grace_cycles: continue
+                new = 'UNKNOWN'
+            self._missing.pop(jobid, None)
+            if new != old: transitions.append((jobid, old, new, remote_out))
+        return transitions
+
+# ---------- job accounting ----------
+SACCT_ACCT_FORMAT = 'JobID,Elapsed,TotalCPU,AllocCPUS,MaxRSS,ExitCode'
+ACCT_BATCH = 200                 # jobs per sacct call when backfilling accounting
+MEM_UNITS_KB = {'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}
+
+def parse_slurm_duration(text):
+    """Seconds of a Slurm duration ([D-][HH:]MM:SS[.mmm]); None when empty or unparsable."""
+    text = (text or '').strip()
+    if not text: return None
+    days, _, rest = text.rpartition('-')
+    try:
+        parts = [float(p) for p in rest.split(':')]
+        secs = sum(v * 60 ** i for i, v in enumerate(reversed(parts)))
+        return int(round(secs + (int(days) * 86400 if days else 0)))
+    except ValueError:
+        return None
+
+def parse_slurm_mem_kb(text):
+    """KiB of a Slurm memory figure such as 1234K, 1.5G or 0; None when empty."""
+    text = (text or '').strip()
+    if not text: return None
+    unit = text[-1].upper()
+    try: return int(float(text[:-1]) * MEM_UNITS_KB[unit]) if unit in MEM_UNITS_KB else int(float(text) / 1024)
+    except ValueError: return None
+
+def parse_sacct_accounting(text):
+    """`sacct -n -P -o SACCT_ACCT_FORMAT` output -> {jobid: (elapsed_s, max_rss_kb, cpu_eff, exit_code)}.
+    Elapsed, CPU time and exit code come from the allocation line, MaxRSS is the
+    largest over the job's steps."""
+    alloc, rss = {}, {}
+    for line in (text or '').splitlines():
+        f = line.strip().split('|')
+        if len(f) < 6 or not f[0] or '[' in f[0]: continue        # pending array ranges never ran
+        jobid, step = f[0].split('.', 1)[0], '.' in f[0]
+        mem = parse_slurm_mem_kb(f[4])
+        if mem is not None: rss[jobid] = max(rss.get(jobid, 0), mem)
+        if not step: alloc[jobid] = (parse_slurm_duration(f[1]), parse_slurm_duration(f[2]), _int(f[3]), f[5])
+    out = {}
+    for jobid, (elapsed, cpu, ncpu, exit_code) in alloc.items():
+        eff = round(cpu / (elapsed * ncpu), 4) if elapsed and ncpu and cpu is not None else None
+        out[jobid] = (elapsed, rss.get(jobid), eff, exit_code)
+    return out
+
+def format_duration(secs):
+    if secs is None: return ''
+    d, rest = divmod(int(secs), 86400); h, rest = divmod(rest, 3600); m, s = divmod(rest, 60)
+    return (f"{d}-" if d else '') + f"{h:02d}:{m:02d}:{s:02d}"
+
+def format_kb(kb):
+    if kb is None: return ''
+    for unit in ('K', 'M', 'G'):
+        if kb < 1024: return f"{kb:.0f}{unit}" if unit == 'K' else f"{kb:.1f}{unit}"
+        kb /= 1024.0
+    return f"{kb:.1f}T"
+
+# ---------- output tail ----------
+TAIL_MAX_CHUNK = 256 * 1024      # bytes read per file per cycle while a job runs
+TAIL_VIEW_BYTES = 64 * 1024      # bytes of each output shown in the job output view
+
+def remote_output_path(jobid, remote_out):
+    return remote_out.replace('%j', str(jobid))
+
+def local_output_path(jobid, remote_path, cluster=None):
+    return RESULTS.job_dir(cluster, jobid) / Path(remote_path).name
+
+def read_local_tail(path, nbytes=TAIL_VIEW_BYTES):
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END); size = f.tell(); f.seek(max(0, size - nbytes))
+            return f.read().decode('utf-8', errors='replace')
+    except OSError:
+        return ''
+
+class OutputTailer:
+    """Follows job output files with SFTP seek/read, appending only the new bytes to
+    the local copy. The local file size is the read offset, so tailing resumes across
+    restarts and a finished job only needs its last bytes fetched. Each file's bytes
+    go through its own incremental decoder, so a UTF-8 character split across two
+    reads is decoded whole."""
+    def __init__(self, max_chunk=TAIL_MAX_CHUNK):
+        self.max_chunk = max_chunk
+        self._decoders = {}      # local path -> incremental UTF-8 decoder
+        self._lock = threading.Lock()
+
+    def decode(self, local_path, data, final=False):
+        """Text of the next bytes of local_path; an incomplete trailing character is held
+        back until the rest arrives (or replaced when final)."""
+        with self._lock:
+            dec = self._decoders.pop(local_path, None) if final else self._decoders.get(local_path)
+            if dec is None:
+                dec = codecs.getincrementaldecoder('utf-8')(errors='replace')
+                if not final: self._decoders[local_path] = dec
+            return dec.decode(data, final)
+
+    def reset(self, local_path):
+        """Forget the partial character of local_path, e.g. when the file starts over."""
+        with self._lock: self._decoders.pop(local_path, None)
+
+    def _pull(self, sftp, remote_path, local_path, limit):
+        """Append up to limit new bytes to local_path; returns (data, remote attributes),
+        (None, None) when the remote file does not exist."""
+        try: attrs = sftp.stat(remote_path); size = attrs.st_size
+        except IOError: return None, None      # not created yet (job pending) or gone
+        offset = local_path.stat().st_size if local_path.exists() else 0
+        if size < offset: offset = 0           # rewritten remotely (e.g. requeued job)
+        if size == offset: return b'', attrs
+        if not offset: self.reset(local_path)
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        with sftp.open(remote_path, 'rb') as rf, open(local_path, 'ab' if offset else 'wb') as out:
+            rf.seek(offset)
+            want = size - offset if limit is None else min(limit, size - offset)
+            rf.prefetch(offset + want)
+            data = rf.read(want)
+            out.write(data)
+        return data, attrs
+
+    def poll(self, ssh, outputs, cluster=None):
+        """outputs: [(jobid, remote_path)]. Returns {jobid: new text} for files that grew."""
+        grown = {}
+        if not outputs: return grown
+        nbytes = 0
+        with METRICS.timer('remote_call', op='tail', host=ssh.hostname), ssh.sftp_session() as sftp:
+            for jobid, remote_path in outputs:
+                local_path = local_output_path(jobid, remote_path, cluster)
+                data, _ = self._pull(sftp, remote_path, local_path, self.max_chunk)
+                if not data: continue
+                nbytes += len(data); text = self.decode(local_path, data)
+                if text: grown[jobid] = text
+        METRICS.add('bytes', nbytes, op='tail', direction='in', host=ssh.hostname)
+        return grown
+
+    def finalize(self, ssh, jobid, remote_path, cluster=None):
+        """Fetch whatever is left of a finished job's output and catalogue the complete copy
+        in the result cache. Returns (found, new text)."""
+        local_path = local_output_path(jobid, remote_path, cluster)
+        with METRICS.timer('remote_call', op='tail', host=ssh.hostname), ssh.sftp_session() as sftp:
+            data, attrs = self._pull(sftp, remote_path, local_path, None)
+        METRICS.add('bytes', len(data or b''), op='tail', direction='in', host=ssh.hostname)
+        if attrs is not None and local_path.exists(): RESULTS.record_file(cluster, jobid, remote_path, local_path, attrs.st_mtime)
+        return data is not None, self.decode(local_path, data or b'', final=True)
+
+# ---------- sbatch generation ----------
+SBATCH_JOBID_RE = re.compile(r"Submitted batch job (\d+)")
+
+def build_sbatch_script(job_name, workdir, output, cpus, mem, use_gpu, shared, matlab_call, array=None, setup=''):
+    """sbatch file running one MATLAB call. `array` is an --array spec, `setup` extra
+    shell lines placed before MATLAB starts."""
+    gpu_line = "#SBATCH --gres=gpu:1\n" if use_gpu else ""
+    array_line = f"#SBATCH --array={array}\n" if array else ""
+    shared_export = f"export HPC_SHARED_PATH={shlex.quote(shared)}\n" if shared else ""
+    return f"""#!/bin/bash
+#SBATCH --job-name={job_name}
+#SBATCH --output={output}
+#SBATCH --time=24:00:00
+#SBATCH --ntasks=1
+#SBATCH --cpus-per-task={cpus}
+#SBATCH --mem={mem}
+{gpu_line}{array_line}
+module load matlab || true
+cd {shlex.quote(workdir)}
+{shared_export}{setup}
+matlab -nodisplay -r "try, {matlab_call}; catch e, disp(getReport(e)); exit(1); end; exit(0)"
+"""
+
+def parse_sbatch_jobid(out):
+    m = SBATCH_JOBID_RE.search(out or '')
+    return m.group(1) if m else None
+
+# ---------- parameter sweeps ----------
+SWEEP_MAX_TASKS = 100000
+
+def _fmt_number(v):
+    """Decimal -> shortest MATLAB literal: 3, 0.3, 0.0001 (never an exponent or a trailing .0)."""
+    return format(v.normalize(), 'f') if v else '0'
+
+def expand_sweep_values(spec):
+    """Values of one grid axis: `a:b` or `a:step:b` (MATLAB-style ranges) or a comma
+    list of MATLAB literals, e.g. `0.1,0.2`, `'lin','log'`. Ranges are computed in
+    decimal, so 0:0.1:1 gives 0.3 and not 0.30000000000000004."""
+    spec = spec.strip()
+    parts = spec.split(':')
+    if len(parts) in (2, 3) and "'" not in spec:
+        try: nums = [decimal.Decimal(p.strip()) for p in parts]
+        except decimal.InvalidOperation: nums = None
+        if nums:
+            if not all(n.is_finite() for n in nums): raise ValueError(f"range bounds must be finite: {spec}")
+            start, step, stop = (nums[0], decimal.Decimal(1), nums[1]) if len(nums) == 2 else nums
+            if step == 0 or (stop - start) / step < 0: raise ValueError(f"empty range: {spec}")
+            count = int((stop - start) / step) + 1
+            if count > SWEEP_MAX_TASKS: raise ValueError(f"range has {count} values (max {SWEEP_MAX_TASKS}): {spec}")
+            return [_fmt_number(start + i * step) for i in range(count)]
+    values = [v.strip() for v in next(csv.reader([spec], quotechar='"', skipinitialspace=True))]
+    if not all(values): raise ValueError(f"empty value in: {spec}")
+    return values
+
+def parse_param_grid(text):
+    """`alpha=0.1,0.2; beta=1:3` -> ['0.1, 1', '0.1, 2', ..., '0.2, 3'] (cartesian
+    product, axes in the order given, each entry a MATLAB argument list)."""
+    axes = []
+    for chunk in (c for c in text.split(';') if c.strip()):
+        name, sep, spec = chunk.partition('=')
+        if not sep: raise ValueError(f"expected name=values, got: {chunk.strip()}")
+        axes.append(expand_sweep_values(spec))
+    if not axes: return []
+    total = math.prod(len(a) for a in axes)
+    if total > SWEEP_MAX_TASKS: raise ValueError(f"sweep has {total} points (max {SWEEP_MAX_TASKS})")
+    return [', '.join(combo) for combo in itertools.product(*axes)]
+
+def load_param_csv(path):
+    """One argument set per CSV row; cells are MATLAB literals. A first row made only of
+    identifiers is taken as a header and skipped, as are empty and '#' lines."""
+    rows = [r for r in csv.reader(Path(path).read_text().splitlines(), skipinitialspace=True)
+            if r and any(c.strip() for c in r) and not r[0].lstrip().startswith('#')]
+    if rows and all(c.strip().isidentifier() for c in rows[0]): rows = rows[1:]
+    return [', '.join(c.strip() for c in r) for r in rows]
+
+# ---------- job packing ----------
+PACK_MAX_WORKERS = 512
+PACK_CHUNKS_PER_WORKER = 8       # task chunks per worker: enough to balance uneven tasks, few enough to keep lock traffic low
+PACK_POLL_INTERVAL = 5.0         # agent mode: seconds between progress reads of running packs
+PACK_TASK_STATES = ('QUEUED', 'RUNNING', 'COMPLETED', 'FAILED', 'NOT_RUN')
+PACK_WORKER_NAME = 'hpc_pack_worker'
+# One copy runs per allocated core (srun), each in a single-threaded MATLAB session.
+PACK_WORKER_M = r"""function hpc_pack_worker(fn, inputs, locks, outputs, chunk)
+% Run tasks of a packed submission in this MATLAB session until none are left.
+% Task i (0-based) calls fn with line i+1 of inputs/tasks.txt as its argument list.
+% Chunks of `chunk` tasks are claimed with an atomic mkdir in locks/; each task saves
+% outputs/task_<i>.mat, writes the marker outputs/task_<i>.done and appends its line
+% (task, status, worker, seconds, error; tab separated) to outputs/progress_<worker>.log.
+worker = str2double(getenv('SLURM_PROCID'));
+if isnan(worker), worker = 0; end
+nworkers = str2double(getenv('SLURM_NTASKS'));
+if isnan(nworkers) || nworkers < 1, nworkers = 1; end
+lines = regexp(fileread(fullfile(inputs, 'tasks.txt')), '\r?\n', 'split');
+if ~isempty(lines) && isempty(lines{end}), lines(end) = []; end
+ntasks = numel(lines); nchunks = ceil(ntasks / chunk);
+progress = fullfile(outputs, sprintf('progress_%d.log', worker));
+first = floor(worker * nchunks / nworkers);
+for k = 0:nchunks - 1
+    c = mod(first + k, nchunks);
+    if ~java.io.File(fullfile(locks, sprintf('chunk_%d', c))).mkdir(), continue; end
+    for task = c * chunk:min(ntasks, (c + 1) * chunk) - 1
+        write_line(progress, sprintf('%d\tRUNNING\t%d\t\t', task, worker), 'a');
+        t0 = tic; status = 'COMPLETED'; err = '';
+        try
+            result = run_task(fn, lines{task + 1});
+            save(fullfile(outputs, sprintf('task_%d.mat', task)), 'result', 'task');
+        catch e
+            status = 'FAILED'; err = regexprep(e.message, '\s+', ' ');
+        end
+        line = sprintf('%d\t%s\t%d\t%.3f\t%s', task, status, worker, toc(t0), err);
+        write_line(fullfile(outputs, sprintf('task_%d.done', task)), line, 'w');
+        write_line(progress, line, 'a');
+    end
+end
+end
+
+function result = run_task(fn, args)
+% The task's return value when fn has one, else []. nargout is negative for varargout
+% functions, which may return nothing, and fails for scripts: those are called as a
+% statement, keeping whatever they leave in ans, so that every task runs exactly once.
+result = [];
+call = [fn '(' args ')'];
+try, n = nargout(fn); catch, n = -1; end
+if n > 0, result = eval(call); return; end
+eval([call ';']);
+if n < 0 && exist('ans', 'var'), result = ans; end %#ok<NOANS>
+end
+
+function write_line(path, line, mode)
+f = fopen(path, mode); fprintf(f, '%s\n', line); fclose(f);
+end
+"""
+
+def pack_paths(shared, pack):
+    """Remote folders of a pack: its task list, chunk claims and results."""
+    return {d: f"{shared}/{d}/{pack}" for d in ('inputs', 'locks', 'outputs')}
+
+def matlab_string(value):
+    """value as a MATLAB single-quoted char literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def pack_chunk_size(ntasks, workers):
+    return max(1, math.ceil(ntasks / (workers * PACK_CHUNKS_PER_WORKER)))
+
+def build_pack_sbatch(job_name, workdir, output, workers, mem, shared, fn, paths, chunk, setup=''):
+    """sbatch file for one allocation of `workers` cores, each running PACK_WORKER_M in
+    its own single-threaded MATLAB session. `mem` is per worker."""
+    inputs, locks, outputs = (matlab_string(paths[d]) for d in ('inputs', 'locks', 'outputs'))
+    call = f"addpath({inputs}); {PACK_WORKER_NAME}({matlab_string(fn)}, {inputs}, {locks}, {outputs}, {int(chunk)})"
+    command = shlex.quote(f"try, {call}; catch e, disp(getReport(e)); exit(1); end; exit(0)")
+    return f"""#!/bin/bash
+#SBATCH --job-name={job_name}
+#SBATCH --output={output}
+#SBATCH --time=24:00:00
+#SBATCH --ntasks={workers}
+#SBATCH --cpus-per-task=1
+#SBATCH --mem-per-cpu={mem}
+
+module load matlab || true
+cd {shlex.quote(workdir)}
+export HPC_SHARED_PATH={shlex.quote(shared)}
+{setup}
+srun --ntasks={workers} --cpus-per-task=1 --kill-on-bad-exit=0 matlab -nodisplay -singleCompThread -r {command}
+"""
+
+def parse_pack_progress(text):
+    """Progress log lines -> [(task, status, worker, elapsed_s or None, error)]; malformed lines are skipped."""
+    out = []
+    for line in text.splitlines():
+        p = line.split('\t', 4)
+        if len(p) < 4 or p[1] not in PACK_TASK_STATES: continue
+        try: out.append((int(p[0]), p[1], int(p[2]), float(p[3]) if p[3] else None, p[4] if len(p) > 4 else ''))
+        except ValueError: continue
+    return out
+
+def format_pack_counts(counts):
+    """{task status: n} -> '27/30 done, 2 failed, 1 running'."""
+    total = sum(counts.values()); done = counts.get('COMPLETED', 0) + counts.get('FAILED', 0) + counts.get('NOT_RUN', 0)
+    parts = [f"{done}/{total} done"] + [f"{counts[k]} {label}" for k, label in (('FAILED', 'failed'), ('NOT_RUN', 'not run'), ('RUNNING', 'running'))
+                                        if counts.get(k)]
+    return ', '.join(parts)
+
+class PackTracker:
+    """Follows the progress logs of running packs (outputs/<pack>/progress_<worker>.log)
+    with SFTP seek/read, keeping per log the offset just past its last complete line.
+    Offsets start over after a restart; reading lines twice is harmless."""
+    def __init__(self):
+        self.offsets = {}                 # pack id -> {worker: offset}
+
+    def poll(self, ssh, packs):
+        """packs: {pack id: (pack dir, workers)}. Returns {pack id: parse_pack_progress rows} of new lines."""
+        found = {}; nbytes = 0
+        with METRICS.timer('remote_call', op='pack', host=ssh.hostname), ssh.sftp_session() as sftp:
+            for pack_id, (pack_dir, workers) in packs.items():
+                offsets = self.offsets.setdefault(pack_id, {})
+                for worker in range(workers or 0):
+                    path = f"{pack_dir}/progress_{worker}.log"; offset = offsets.get(worker, 0)
+                    try: size = sftp.stat(path).st_size
+                    except IOError: continue           # worker not started yet
+                    if size <= offset: continue
+                    with sftp.open(path, 'rb') as f:
+                        f.seek(offset); data = f.read(size - offset)
+                    end = data.rfind(b'\n') + 1
+                    if not end: continue
+                    offsets[worker] = offset + end; nbytes += end
+                    found.setdefault(pack_id, []).extend(parse_pack_progress(data[:end].decode('utf-8', errors='replace')))
+        METRICS.add('bytes', nbytes, op='pack', direction='in', host=ssh.hostname)
+        return found
+
+    def forget(self, pack_id):
+        self.offsets.pop(pack_id, None)
+
+# ---------- cluster state ----------
+# Compact, pipe-separated formats instead of `sinfo -Nel` text (or the much larger
+# --json documents); both queries share one exec per poll.
+SINFO_FORMAT = '%N|%P|%T|%C|%m|%e|%O|%G'          # node|partition|state|cpus A/I/O/T|mem|free mem|load|gres
+SQUEUE_FORMAT = '%i|%u|%P|%j|%T|%M|%D|%C|%R'      # id|user|partition|name|state|elapsed|nodes|cpus|reason/nodelist
+CLUSTER_STATE_SEP = '__HPC_SQUEUE__'
+CLUSTER_STATE_CMD = f"sinfo -h -N -o '{SINFO_FORMAT}'; echo {CLUSTER_STATE_SEP}; squeue -h -o '{SQUEUE_FORMAT}'"
+
+class NodeRecord(NamedTuple):
+    name: str
+    partitions: tuple
+    state: str
+    cpus_alloc: int
+    cpus_idle: int
+    cpus_total: int
+    mem_mb: int
+    free_mem_mb: int
+    load: float
+    gres: str
+    cluster: str = ''
+
+class PartitionRecord(NamedTuple):
+    name: str
+    nodes: int
+    cpus_alloc: int
+    cpus_idle: int
+    cpus_total: int
+    cluster: str = ''
+
+class QueueJobRecord(NamedTuple):
+    jobid: str
+    user: str
+    partition: str
+    name: str
+    state: str
+    elapsed: str
+    nodes: int
+    cpus: int
+    reason: str
+    cluster: str = ''
+
+def _int(v, default=0):
+    try: return int(v)
+    except (TypeError, ValueError): return default
+
+def _float(v, default=0.0):
+    try: return float(v)
+    except (TypeError, ValueError): return default
+
+def parse_sinfo_nodes(text):
+    """Parse `sinfo -h -N -o SINFO_FORMAT` into {node: NodeRecord}. sinfo lists a node
+    once per partition; those rows are merged."""
+    nodes = {}
+    for line in (text or '').splitlines():
+        f = line.strip().split('|')
+        if len(f) < 8 or not f[0]: continue
+        part = f[1].rstrip('*'); cpus = (f[3].split('/') + ['0'] * 4)[:4]
+        prev = nodes.get(f[0])
+        parts = tuple(sorted(set(prev.partitions) | {part})) if prev else (part,)
+        nodes[f[0]] = NodeRecord(f[0], parts, f[2].rstrip('*~#!%$@^-').lower(), _int(cpus[0]), _int(cpus[1]), _int(cpus[3]),
+                                 _int(f[4]), _int(f[5]), _float(f[6]), f[7] if f[7] != '(null)' else '')
+    return nodes
+
+def parse_squeue_jobs(text):
+    """Parse `squeue -h -o SQUEUE_FORMAT` into {jobid: QueueJobRecord}."""
+    jobs = {}
+    for line in (text or '').splitlines():
+        f = line.strip().split('|', 8)
+        if len(f) < 9 or not f[0]: continue
+        jobs[f[0]] = QueueJobRecord(f[0], f[1], f[2], f[3], normalize_slurm_state(f[4]), f[5], _int(f[6]), _int(f[7]), f[8])
+    return jobs
+
+def summarize_partitions(nodes):
+    acc = {}
+    for n in nodes.values():
+        for p in n.partitions:
+            a = acc.setdefault(p, [0, 0, 0, 0])
+            a[0] += 1; a[1] += n.cpus_alloc; a[2] += n.cpus_idle; a[3] += n.cpus_total
+    return {p: PartitionRecord(p, *a) for p, a in acc.items()}
+
+class ClusterSnapshot:
+    """In-memory nodes/partitions/queue view of one cluster, updated by diff on every
+    refresh. Records carry the cluster's name, so views of several clusters merge."""
+    KINDS = ('nodes', 'partitions', 'jobs')
+
+    def __init__(self, name=''):
+        self.name = name
+        self._lock = threading.Lock()
+        self.nodes = {}; self.partitions = {}; self.jobs = {}
+        self.updated_at = None
+
+    @staticmethod
+    def _diff(old, new):
+        changed = {k: v for k, v in new.items() if old.get(k) != v}
+        removed = [k for k in old if k not in new]
+        return changed, removed
+
+    def apply(self, nodes, jobs):
+        """Replace the snapshot and return {kind: (changed {key: record}, removed [key])}."""
+        if self.name:
+            nodes = {k: v._replace(cluster=self.name) for k, v in nodes.items()}
+            jobs = {k: v._replace(cluster=self.name) for k, v in jobs.items()}
+        partitions = {k: v._replace(cluster=self.name) for k, v in summarize_partitions(nodes).items()}
+        with self._lock:
+            diff = {'nodes': self._diff(self.nodes, nodes), 'partitions': self._diff(self.partitions, partitions),
+                    'jobs': self._diff(self.jobs, jobs)}
+            self.nodes, self.partitions, self.jobs = nodes, partitions, jobs
+            self.updated_at = time.time()
+        return diff
+
+    def refresh(self, ssh):
+        out, err = ssh.exec(CLUSTER_STATE_CMD)
+        if CLUSTER_STATE_SEP not in out: raise RuntimeError(err or "unexpected sinfo/squeue output")
+        sinfo_text, squeue_text = out.split(CLUSTER_STATE_SEP, 1)
+        return self.apply(parse_sinfo_nodes(sinfo_text), parse_squeue_jobs(squeue_text))
+
+    def free_cpus(self):
+        with self._lock: return sum(n.cpus_idle for n in self.nodes.values())
+
+def is_empty_diff(diff):
+    return not any(changed or removed for changed, removed in diff.values())
+
+# ---------- telemetry ----------
+TELEMETRY_SSH_TIMEOUT = 4        # ConnectTimeout for the login node -> compute node hop
+GFLOPS_PER_CORE = 50.0           # default peak per CPU core used for the TFLOPS estimate
+GPU_PEAK_TFLOPS = 10.0           # default peak per GPU
+TELEMETRY_TAG = 'HPCTEL'
+
+# Runs on each compute node. Prints: ncpu|cpu util %|cpu package W|gpu W|gpu util %|gpu count.
+# Package power needs passwordless `sudo powermetrics` (macOS) and is left empty otherwise.
+TELEMETRY_PROBE = r'''n=$(sysctl -n hw.ncpu 2>/dev/null || nproc 2>/dev/null || echo 1)
+u=$(ps -A -o %cpu= | awk -v n="$n" '{s+=$1} END {printf "%.1f", s/n}')
+p=$(sudo -n powermetrics -n 1 -i 200 --samplers cpu_power 2>/dev/null | awk '/Combined Power/ {printf "%.2f", $(NF-1)/1000}')
+g=$(nvidia-smi --query-gpu=power.draw,utilization.gpu --format=csv,noheader,nounits 2>/dev/null | awk -F', *' '{w+=$1; x+=$2; c++} END {if (c) printf "%.1f|%.1f|%d", w, x/c, c}')
+echo "$n|$u|$p|${g:-||0}"'''
+
+def build_telemetry_command(nodes, timeout=TELEMETRY_SSH_TIMEOUT):
+    """One shell command, run on the login node, that probes every node in parallel."""
+    names = ' '.join(shlex.quote(n) for n in nodes)
+    ssh = f"ssh -n -o BatchMode=yes -o ConnectTimeout={timeout} -o StrictHostKeyChecking=accept-new"
+    return (f"PROBE=$(cat <<'__HPC_PROBE__'\n{TELEMETRY_PROBE}\n__HPC_PROBE__\n)\n"
+            f"for n in {names}; do "
+            f"(out=$({ssh} \"$n\" \"$PROBE\" 2>/dev/null) && echo \"{TELEMETRY_TAG}|$n|$out\") & "
+            f"done; wait")
+
+class NodeSample(NamedTuple):
+    node: str
+    ncpu: int
+    cpu_util: float        # percent of all cores
+    cpu_power: float       # W, nan when unavailable
+    gpu_power: float       # W, nan without nvidia-smi
+    gpu_util: float        # percent, nan without nvidia-smi
+    gpus: int
+
+def parse_telemetry(text):
+    """Parse the tagged probe lines into {node: NodeSample}."""
+    samples = {}
+    for line in (text or '').splitlines():
+        f = line.strip().split('|')
+        if len(f) < 8 or f[0] != TELEMETRY_TAG: continue
+        samples[f[1]] = NodeSample(f[1], _int(f[2], 1), _float(f[3]), _float(f[4], np.nan), _float(f[5], np.nan),
+                                   _float(f[6], np.nan), _int(f[7]))
+    return samples
+
+class TelemetryRing:
+    """Fixed-size NumPy ring buffer of (epoch ts, power W, util %, est TFLOPS) rows."""
+    FIELDS = ('ts', 'power', 'util', 'tflops')
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self._data = np.full((self.capacity, len(self.FIELDS)), np.nan)
+        self._head = 0; self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self): return self._count
+
+    def append(self, ts, power, util, tflops):
+        with self._lock:
+            self._data[self._head] = (ts, power, util, tflops)
+            self._head = (self._head + 1) % self.capacity; self._count = min(self._count + 1, self.capacity)
+
+    def snapshot(self):
+        """Copy of the stored rows, oldest first."""
+        with self._lock:
+            if self._count < self.capacity: return self._data[:self._count].copy()
+            return np.concatenate((self._data[self._head:], self._data[:self._head]))
+
+class TelemetryCollector:
+    """Samples all nodes with one batched remote command per interval and aggregates
+    them into a cluster-wide (power, utilization, estimated TFLOPS) point.
+
+    The login node fans out to the compute nodes over ssh in parallel, so this needs
+    the usual intra-cluster host-based or key-based ssh; nodes that cannot be reached
+    simply drop out of the sample. With several clusters, each records its samples
+    under its own group and every point aggregates the latest samples of all groups.
+    """
+    def __init__(self, ring, gflops_per_core=GFLOPS_PER_CORE, gpu_peak_tflops=GPU_PEAK_TFLOPS):
+        self.ring = ring; self.gflops_per_core = gflops_per_core; self.gpu_peak_tflops = gpu_peak_tflops
+        self.latest = {}      # group (cluster) -> {node: NodeSample}
+        self._lock = threading.Lock()
+
+    def estimate_tflops(self, s):
+        cpu = s.cpu_util / 100.0 * s.ncpu * self.gflops_per_core / 1000.0
+        gpu = 0.0 if np.isnan(s.gpu_util) else s.gpu_util / 100.0 * s.gpus * self.gpu_peak_tflops
+        return cpu + gpu
+
+    def aggregate(self, samples):
+        vals = list(samples.values())
+        cores = sum(s.ncpu for s in vals) or 1
+        util = sum(s.cpu_util * s.ncpu for s in vals) / cores
+        watts = [w for s in vals for w in (s.cpu_power, s.gpu_power) if not np.isnan(w)]
+        power = float(sum(watts)) if watts else np.nan
+        return power, util, sum(self.estimate_tflops(s) for s in vals)
+
+    def collect(self, ssh, nodes, timeout=60, group=''):
+        """Probe `nodes`, record the aggregate in the ring and power_history, return it."""
+        if not nodes: return None
+        out, _ = ssh.exec(build_telemetry_command(nodes), timeout=timeout)
+        return self.record(parse_telemetry(out), group)
+
+    def record(self, samples, group=''):
+        """Record probe samples ({node: NodeSample}) taken elsewhere, e.g. by the remote agent."""
+        if not samples: return None
+        with self._lock:
+            self.latest[group] = samples
+            merged = {(g, n): s for g, nodes in self.latest.items() for n, s in nodes.items()}
+        now = datetime.utcnow()
+        power, util, tflops = self.aggregate(merged)
+        self.ring.append(now.replace(tzinfo=timezone.utc).timestamp(), power, util, tflops)
+        insert_power(now, None if np.isnan(power) else power, util, tflops)
+        return power, util, tflops
+
+    def forget(self, group):
+        with self._lock: self.latest.pop(group, None)
+
+    def node_utils(self):
+        """{group: {node: cpu util %}} of the latest samples."""
+        with self._lock: return {g: {n: s.cpu_util for n, s in nodes.items()} for g, nodes in self.latest.items()}
+
+# ---------- remote agent ----------
+AGENT_SOURCE = Path(__file__).with_name('hpc_agent.py')
+AGENT_REMOTE_DIR = '.hpc_dashboard'      # relative to the remote home; one file per agent version
+AGENT_INTERVAL = 3.0                     # seconds between the agent's job state / output samples
+AGENT_HEARTBEAT = 10.0                   # the agent speaks at least this often ...
+AGENT_STALL_TIMEOUT = 45.0               # ... so this much silence means it is gone
+AGENT_START_TIMEOUT = 20.0
+
+class RemoteAgent:
+    """Client side of hpc_agent.py: uploads it (once per version), runs it on one SSH
+    channel and hands every message to on_message from a reader thread. on_exit(reason)
+    is called once if the channel closes or stalls before stop()."""
+    def __init__(self, ssh, on_message, on_exit, log=None):
+        self.ssh = ssh; self.on_message = on_message; self.on_exit = on_exit; self.log = log or (lambda s: None)
+        self.channel = None; self.info = {}
+        self._send_lock = threading.Lock(); self._stopping = False
+
+    def _install(self):
+        source = AGENT_SOURCE.read_text(encoding='utf-8')
+        remote = f"{AGENT_REMOTE_DIR}/hpc_agent-{hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]}.py"
+        out, _ = self.ssh.exec(f"mkdir -p {AGENT_REMOTE_DIR} && test -s {remote} && echo ok")
+        if out != 'ok':
+            self.ssh.write_text(remote, source); self.log(f"Uploaded remote agent {remote}")
+        return remote
+
+    def start(self, config):
+        """Install and launch the agent and wait for its hello. Raises RuntimeError when it
+        cannot run (no python3 on the login node, ...)."""
+        remote = self._install()
+        chan = self.channel = self.ssh.open_channel(f"exec python3 -u {remote}")
+        chan.settimeout(AGENT_START_TIMEOUT); self._file = chan.makefile('rb')
+        try: hello = json.loads(self._file.readline() or b'null')
+        except (ValueError, socket.timeout): hello = None
+        if not isinstance(hello, dict) or hello.get('t') != 'hello':
+            err = chan.recv_stderr(4096).decode('utf-8', errors='replace').strip() if chan.recv_stderr_ready() else ''
+            chan.close(); raise RuntimeError(err.splitlines()[-1] if err else "agent did not start")
+        self.info = hello
+        chan.settimeout(AGENT_STALL_TIMEOUT)
+        self.send(cmd='config', **config)
+        threading.Thread(target=self._reader, name='agent-reader', daemon=True).start()
+        return hello
+
+    def send(self, **cmd):
+        with self._send_lock: self.channel.sendall((json.dumps(cmd, separators=(',', ':')) + '\n').encode('utf-8'))
+
+    def _reader(self):
+        reason = 'channel closed'
+        try:
+            for line in iter(self._file.readline, b''):
+                try: msg = json.loads(line)
+                except ValueError: continue
+                try: self.on_message(msg)
+                except Exception as e: self.log(f"Agent message {msg.get('t')} failed: {e}")
+        except socket.timeout: reason = f"silent for {AGENT_STALL_TIMEOUT:.0f}s"
+        except Exception as e: reason = str(e) or type(e).__name__
+        if not self._stopping: self.on_exit(reason)
+
+    def stop(self):
+        self._stopping = True
+        try: self.send(cmd='stop')
+        except Exception: pass
+        try: self.channel.close()
+        except Exception: pass
+
+# ---------- polling schedule ----------
+JOB_POLL_FAST = 2.0              # job poll interval right after a submission or a state change ...
+JOB_POLL_BACKOFF = 1.6           # ... growing by this factor per quiet poll ...
+JOB_POLL_MAX = {'PENDING': 60.0, 'RUNNING': 30.0}   # ... up to the ceiling of the job's state
+JOB_POLL_MAX_DEFAULT = 30.0
+CLUSTER_POLL_IDLE = 60.0         # cluster snapshot interval reached while the queue is empty
+POLL_JITTER = 0.15               # +-15% on every interval, so clusters and jobs drift apart
+POLL_COALESCE = 1.5              # polls due within this many seconds share the remote call
+REMOTE_CALL_BUDGET = 60          # monitor remote calls per minute, all clusters together
+REMOTE_CALL_BURST = 8
+SCHEDULER_MAX_SLEEP = 5.0        # new jobs are picked up at least this often
+
+def jittered(interval):
+    return interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+class CallBudget:
+    """Token bucket over remote calls: `rate` per minute, bursts up to `burst`. `clock`
+    returns seconds (time.monotonic)."""
+    def __init__(self, rate=REMOTE_CALL_BUDGET, burst=REMOTE_CALL_BURST, clock=time.monotonic):
+        self.rate = rate / 60.0; self.burst = float(burst); self.clock = clock
+        self.tokens = self.burst; self.stamp = clock(); self._lock = threading.Lock()
+
+    def take(self, n=1):
+        """Spend n calls; returns 0 if granted, else the seconds until they would be."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate); self.stamp = now
+            if self.tokens >= n: self.tokens -= n; return 0.0
+            return (n - self.tokens) / self.rate
+
+class PollPlan:
+    """When each active job of one cluster, and its cluster snapshot, are polled next.
+
+    Jobs start at JOB_POLL_FAST and back off while nothing happens to them, up to a
+    ceiling per state; a transition or new output resets them. The snapshot runs every
+    POLL_INTERVAL while anything is queued and backs off to CLUSTER_POLL_IDLE when the
+    queue is empty. Every interval is jittered."""
+    def __init__(self):
+        self.jobs = {}                   # jobid -> [interval, due]
+        self.cluster_interval = POLL_INTERVAL; self.cluster_due = 0.0
+
+    def sync(self, jobids, now):
+        """Track exactly `jobids`; new ones are due after JOB_POLL_FAST."""
+        for jobid in [j for j in self.jobs if j not in jobids]: del self.jobs[jobid]
+        for jobid in jobids: self.jobs.setdefault(jobid, [JOB_POLL_FAST, now + JOB_POLL_FAST])
+
+    def due_jobs(self, now):
+        """Jobs to poll now: none unless one is due, then also those due within POLL_COALESCE."""
+        if not any(due <= now for _, due in self.jobs.values()): return []
+        return [j for j, (_, due) in self.jobs.items() if due <= now + POLL_COALESCE]
+
+    def job_polled(self, jobid, status, active, now):
+        entry = self.jobs.get(jobid)
+        if entry is None: return
+        entry[0] = JOB_POLL_FAST if active else min(entry[0] * JOB_POLL_BACKOFF, JOB_POLL_MAX.get(status, JOB_POLL_MAX_DEFAULT))
+        entry[1] = now + jittered(entry[0])
+
+    def cluster_polled(self, idle, now):
+        self.cluster_interval = min(self.cluster_interval * JOB_POLL_BACKOFF, CLUSTER_POLL_IDLE) if idle else POLL_INTERVAL
+        self.cluster_due = now + jittered(self.cluster_interval)
+
+    def defer(self, jobids, cluster, until):
+        """Push polls the budget refused to `until`."""
+        for jobid in jobids: self.jobs[jobid][1] = max(self.jobs[jobid][1], until)
+        if cluster: self.cluster_due = max(self.cluster_due, until)
+
+    def hurry(self, now):
+        """Poll everything soon again, e.g. after a submission or a manual refresh."""
+        for entry in self.jobs.values(): entry[0] = JOB_POLL_FAST; entry[1] = min(entry[1], now + JOB_POLL_FAST)
+        self.cluster_interval = POLL_INTERVAL; self.cluster_due = min(self.cluster_due, now + JOB_POLL_FAST)
+
+    def next_due(self, watch_jobs, poll_cluster):
+        dues = [due for _, due in self.jobs.values()] if watch_jobs else []
+        if poll_cluster: dues.append(self.cluster_due)
+        return min(dues, default=None)
+
+# ---------- clusters ----------
+DEFAULT_CLUSTER = 'default'      # profile name given to the host of configs from before profiles
+MONITOR_WORKERS = 4              # shared pool running the monitor cycles of all clusters
+ROUTE_MAX_AGE = 2 * POLL_INTERVAL  # snapshots older than this are refreshed before routing a submission
+PROFILE_FIELDS = ('host', 'user', 'key_path', 'port', 'remote_base_path', 'shared_path')
+
+def cluster_profiles(cfg):
+    """Cluster profiles ({name, host, user, key_path, port, remote_base_path, shared_path})
+    from cfg['clusters']. A config from before profiles yields one profile built from
+    its single-host settings."""
+    profiles = [dict(p) for p in cfg.get('clusters') or () if p.get('name') and p.get('host')]
+    if profiles or not cfg.get('host'): return profiles
+    return [dict({k: cfg.get(k) for k in PROFILE_FIELDS}, name=DEFAULT_CLUSTER)]
+
+class ClusterConnection:
+    """One connected cluster: its SSH pool, snapshot, job watcher, output tailer, pack
+    tracker and, while it runs, its remote agent."""
+    def __init__(self, name, profile, ssh):
+        self.name = name; self.profile = profile; self.ssh = ssh
+        self.host = profile.get('host'); self.user = profile.get('user')
+        self.state = ClusterSnapshot(name); self.watcher = JobStateWatcher(); self.tailer = OutputTailer(); self.packs = PackTracker()
+        self.watch_lock = threading.Lock()
+        self.monitors = (False, False)         # (watch jobs, poll cluster)
+        self.agent = None; self.polling = False; self.closed = False; self.gpu = None
+        self._busy = set()                     # monitor kinds ('jobs', 'cluster', 'packs') queued or running
+        self._busy_lock = threading.Lock()      # the scheduler marks kinds, pool workers clear them
+        self.packs_due = 0.0                   # agent mode: when the running packs' progress is read next
+        self.plan = PollPlan()
+        self.agent_states = {}; self.agent_lines = {}; self.agent_paths = {}; self.agent_nodes = None
+
+    @property
+    def monitor(self):
+        return 'agent' if self.agent else ('polling' if self.polling else None)
+
+    def setting(self, key, cfg):
+        """Profile value, falling back to the global config."""
+        return self.profile.get(key) or cfg.get(key) or ''
+
+    def is_busy(self, kind=None):
+        """Whether a monitor cycle of `kind` (of any kind) is queued or running."""
+        with self._busy_lock: return kind in self._busy if kind else bool(self._busy)
+
+    def claim(self, kinds):
+        with self._busy_lock: self._busy |= set(kinds)
+
+    def release(self, kinds):
+        with self._busy_lock: self._busy -= set(kinds)
+
+# ---------- engine ----------
+EVENT_BACKLOG = 5000             # events kept for clients that poll with `since`
+EVENT_WAIT_MAX = 30.0            # longest a client may block in events()
+LIVE_TELEMETRY_POINTS = 300
+
+class EngineError(RuntimeError):
+    """Error reported to API clients; `kind` lets them react, e.g. prompt for a passphrase."""
+    def __init__(self, message, kind='error'):
+        super().__init__(message); self.kind = kind
+
+class HPCEngine:
+    """Headless core of the dashboard: connections to one or more clusters, each with
+    its job watcher and cluster poller, plus blocking operations (submit, sync, ...) for
+    the CLI, the daemon and the GUI.
+
+    Clusters are named profiles (config 'clusters'). Operations take `cluster=`; without
+    it they use the only connected cluster, else config 'default_cluster', else the
+    first connected profile. submit(cluster='auto') picks the cluster with the most
+    idle CPUs. The monitor cycles of all clusters share one bounded worker pool, fed by
+    one scheduler thread that follows each cluster's PollPlan within a global budget of
+    remote calls; it runs while any cluster is connected.
+
+    Everything the engine does is published as events, dicts with `seq`, `ts` and
+    `type` (log, connected, disconnected, job, job_output, pack, cluster, telemetry,
+    progress) that clients read with events(since). Events about one cluster name it
+    in `cluster`.
+
+    Monitoring runs through the remote agent (hpc_agent.py) when it can start: one
+    channel pushing deltas instead of a remote command per poll. Otherwise, or when the
+    agent dies, the cluster's watcher and poller cycles poll as before.
+    """
+    API = ('status', 'profiles', 'save_profile', 'remove_profile', 'connect', 'connect_all', 'disconnect', 'refresh',
+           'poll_jobs', 'command', 'ensure_shared', 'check_gpu', 'sync', 'submit', 'submit_sweep', 'submit_pack', 'jobs', 'history',
+           'backfill_accounting', 'job', 'pack', 'job_output', 'results', 'pin_results', 'cluster', 'power_range', 'metrics', 'set_metrics',
+           'profile', 'cancel', 'events')
+
+    def __init__(self, cfg=None):
+        init_db()
+        self.cfg = load_config() if cfg is None else cfg
+        METRICS.enabled = bool(self.cfg.get('metrics', True))
+        RESULTS.configure(self.cfg.get('results_dir'), self.cfg.get('results_quota_gb'))
+        self.conns = {}; self._conn_lock = threading.Lock()
+        self.power_history = TelemetryRing(LIVE_TELEMETRY_POINTS)
+        self.telemetry = TelemetryCollector(self.power_history, self.cfg.get('gflops_per_core', GFLOPS_PER_CORE),
+                                            self.cfg.get('gpu_peak_tflops', GPU_PEAK_TFLOPS))
+        self._events = deque(maxlen=EVENT_BACKLOG); self._seq = 0; self._event_cond = threading.Condition()
+        self._stop = threading.Event(); self._closed = False
+        self._pool = ThreadPoolExecutor(MONITOR_WORKERS, thread_name_prefix='monitor')
+        self._budget = CallBudget(self.cfg.get('remote_call_budget', REMOTE_CALL_BUDGET))
+        self._scheduler = None; self._sched_cond = threading.Condition(); self._kicked = False
+        self._cancels = set(); self._cancel_lock = threading.Lock()
+
+    # --- events ---
+    def emit(self, kind, **data):
+        with self._event_cond:
+            self._seq += 1
+            self._events.append(dict(data, seq=self._seq, ts=time.time(), type=kind))
+            self._event_cond.notify_all()
+
+    def log(self, text, cluster=None):
+        if cluster: self.emit('log', text=str(text), cluster=cluster)
+        else: self.emit('log', text=str(text))
+
+    def events(self, since=0, timeout=0.0):
+        """Events with seq > since, waiting up to timeout seconds for the first one."""
+        deadline = time.time() + min(float(timeout), EVENT_WAIT_MAX); since = int(since)
+        with self._event_cond:
+            if since > self._seq: since = 0                 # engine restarted; replay the backlog
+            while self._seq <= since and not self._closed:
+                left = deadline - time.time()
+                if left <= 0: break
+                self._event_cond.wait(left)
+            return {'seq': self._seq, 'events': [e for e in self._events if e['seq'] > since]}
+
+    # --- profiles ---
+    def profiles(self):
+        return cluster_profiles(self.cfg)
+
+    def save_profile(self, name, **fields):
+        """Create or update the profile `name` with any of PROFILE_FIELDS; returns it."""
+        unknown = set(fields) - set(PROFILE_FIELDS)
+        if unknown: raise EngineError(f"Unknown profile fields: {', '.join(sorted(unknown))}", 'bad_request')
+        profiles = cluster_profiles(self.cfg)
+        prof = next((p for p in profiles if p['name'] == name), None)
+        if prof is None: prof = {'name': name}; profiles.append(prof)
+        prof.update((k, v) for k, v in fields.items() if v is not None)
+        if not prof.get('host') or not prof.get('user'): raise EngineError("A cluster profile needs host and user", 'bad_request')
+        update_config(self.cfg, clusters=profiles)
+        conn = self.conns.get(name)
+        if conn: conn.profile.update(prof)
+        return prof
+
+    def remove_profile(self, name):
+        self.disconnect(cluster=name)
+        update_config(self.cfg, clusters=[p for p in cluster_profiles(self.cfg) if p['name'] != name])
+
+    def _find_profile(self, cluster, host, user):
+        profiles = cluster_profiles(self.cfg)
+        if cluster: return next((p for p in profiles if p['name'] == cluster), {'name': cluster})
+        if host:
+            return next((p for p in profiles if p['host'] == host and (not user or p.get('user') == user)), {'name': host})
+        default = self.cfg.get('default_cluster')
+        return next((p for p in profiles if p['name'] == default), profiles[0] if profiles else None)
+
+    # --- connection ---
+    def _default_name(self, conns):
+        if len(conns) == 1: return next(iter(conns))
+        default = self.cfg.get('default_cluster')
+        if default in conns: return default
+        return next((p['name'] for p in cluster_profiles(self.cfg) if p['name'] in conns), next(iter(conns), None))
+
+    def _conn(self, cluster=None):
+        """The connection to cluster, or to the default cluster."""
+        with self._conn_lock: conns = dict(self.conns)
+        name = cluster or self._default_name(conns)
+        if name not in conns: raise EngineError(f"Not connected to {cluster}" if cluster else "Not connected", 'not_connected')
+        return conns[name]
+
+    def connect(self, host=None, user=None, key_path=None, password=None, passphrase=None, port=None,
+                watch_jobs=True, poll_cluster=True, use_agent=None, cluster=None):
+        """Connect one cluster: the profile named `cluster` or the one for host (created or
+        updated with the arguments given), by default the default profile. Starts its
+        monitors, through the remote agent unless use_agent is False or config 'use_agent'
+        is off. Raises EngineError kind 'passphrase_required' when the key is encrypted and
+        no passphrase was given."""
+        prof = self._find_profile(cluster, host, user)
+        if prof is None: raise EngineError("Enter host and user", 'bad_request')
+        name = prof['name']
+        host = host or prof.get('host'); user = user or prof.get('user')
+        if key_path is None: key_path = prof.get('key_path') or None
+        port = int(port or prof.get('port') or 22)
+        if not host or not user: raise EngineError("Enter host and user", 'bad_request')
+        def ask():
+            if passphrase is None: raise EngineError(f"Passphrase required for {key_path}", 'passphrase_required')
+            return passphrase
+        if name in self.conns: self.disconnect(cluster=name)
+        self.log(f"Connecting {user}@{host} ...", name)
+        ssh = SSHClientEnhanced(host, user, key_path=key_path, password=password, port=port, passphrase_callback=ask)
+        try: ssh.connect()
+        except EngineError: raise
+        except Exception as e: raise EngineError(str(e), 'connect_failed')
+        prof = self.save_profile(name, host=host, user=user, key_path=key_path or '', port=port)
+        if cluster_profiles(self.cfg)[0]['name'] == name: get_storage().assign_cluster(name)
+        conn = ClusterConnection(name, prof, ssh); conn.monitors = (watch_jobs, poll_cluster)
+        with self._conn_lock: self.conns[name] = conn
+        if use_agent is None: use_agent = self.cfg.get('use_agent', True)
+        if (watch_jobs or poll_cluster) and not (use_agent and self._start_agent(conn)): conn.polling = True
+        self._ensure_scheduler()
+        self.emit('connected', cluster=name, host=host, user=user); self.log("Connected", name)
+        return self.status()
+
+    def connect_all(self, watch_jobs=True, poll_cluster=True, use_agent=None, passphrase=None):
+        """Connect every profile that is not connected yet, concurrently.
+        Returns {name: None on success, else {'error', 'kind'}}."""
+        names = [p['name'] for p in cluster_profiles(self.cfg) if p['name'] not in self.conns]
+        def one(name):
+            try: self.connect(cluster=name, watch_jobs=watch_jobs, poll_cluster=poll_cluster, use_agent=use_agent, passphrase=passphrase)
+            except EngineError as e: return {'error': str(e), 'kind': e.kind}
+        if not names: return {}
+        with ThreadPoolExecutor(min(len(names), MONITOR_WORKERS)) as ex:
+            return dict(zip(names, ex.map(one, names)))
+
+    def disconnect(self, cluster=None):
+        """Disconnect one cluster, or all of them."""
+        with self._conn_lock:
+            conns = [self.conns.pop(n) for n in ([cluster] if cluster else list(self.conns)) if n in self.conns]
+        if not cluster: self.cancel()
+        for conn in conns:
+            conn.closed = True; conn.polling = False
+            agent, conn.agent = conn.agent, None
+            if agent: agent.stop()
+            deadline = time.time() + 5
+            while conn.is_busy() and time.time() < deadline: time.sleep(0.05)     # let running cycles finish
+            conn.ssh.close(); self.telemetry.forget(conn.name)
+            self._emit_cluster(conn, conn.state.apply({}, {}))                 # its rows leave the aggregated views
+            self.emit('disconnected', cluster=conn.name); self.log("Disconnected", conn.name)
+        self._kick()
+        scheduler = self._scheduler
+        if scheduler and not self.conns: scheduler.join(timeout=5)             # it exits with the last cluster
+
+    def shutdown(self):
+        self._stop.set(); self.disconnect(); self._closed = True
+        self._pool.shutdown(wait=False)
+        with self._event_cond: self._event_cond.notify_all()
+        get_storage().close()
+
+    def status(self):
+        with self._conn_lock: conns = dict(self.conns)
+        default = conns.get(self._default_name(conns)) if conns else None
+        return {'connected': bool(conns), 'cluster': default.name if default else None,
+                'host': default.host if default else None, 'user': default.user if default else None,
+                'clusters': {n: {'host': c.host, 'user': c.user, 'monitor': c.monitor, 'ssh': c.ssh.stats()} for n, c in conns.items()},
+                'profiles': [p['name'] for p in cluster_profiles(self.cfg)],
+                'active_jobs': [r[0] for r in list_active_jobs()], 'seq': self._seq,
+                'shared_path': default.setting('shared_path', self.cfg) if default else self.cfg.get('shared_path', '')}
+
+    # --- cancellation of long operations ---
+    @contextmanager
+    def _operation(self):
+        ev = threading.Event()
+        with self._cancel_lock: self._cancels.add(ev)
+        try: yield ev.is_set
+        finally:
+            with self._cancel_lock: self._cancels.discard(ev)
+
+    def cancel(self):
+        with self._cancel_lock:
+            n = len(self._cancels)
+            for ev in self._cancels: ev.set()
+        return n
+
+    # --- operations ---
+    def _targets(self, cluster):
+        if cluster: return [self._conn(cluster)]
+        with self._conn_lock: return list(self.conns.values())
+
+    def refresh(self, cluster=None):
+        """Poll cluster state and telemetry now instead of waiting for the next cycle
+        (of one cluster, or of all)."""
+        conns = self._targets(cluster)
+        if not conns: raise EngineError("Not connected", 'not_connected')
+        for conn in conns:
+            if conn.agent: conn.agent.send(cmd='poll')
+            else: self._poll_cycle(conn); self._hurry(conn)
+
+    def command(self, cmd, timeout=20, cluster=None):
+        out, err = self._conn(cluster).ssh.exec(cmd, timeout=timeout)
+        return {'out': out, 'err': err}
+
+    def ensure_shared(self, remote=None, cluster=None):
+        """Create the remote shared path and its inputs/outputs/tmp/locks subfolders."""
+        conn = self._conn(cluster); ssh = conn.ssh
+        remote = (remote or conn.setting('shared_path', self.cfg)).rstrip('/')
+        if not remote: raise EngineError("Enter shared remote path", 'bad_request')
+        self.log(f"Creating remote folder {remote} ...", conn.name)
+        ssh.exec(f"mkdir -p {remote} && chmod 2775 {remote} || true")
+        for d in ('inputs', 'outputs', 'tmp', 'locks'): ssh.mkdir(f"{remote}/{d}")
+        self.save_profile(conn.name, shared_path=remote)
+        self.log("Shared path created (note: export via NFS is recommended for true shared FS)", conn.name)
+        return remote
+
+    def check_gpu(self, cluster=None):
+        """True/False for whether nvidia-smi exists on the login node, None if the check failed."""
+        conn = self._conn(cluster)
+        if conn.agent and conn.gpu is not None: return conn.gpu      # reported by the agent at start
+        try: out, _ = conn.ssh.exec("which nvidia-smi && nvidia-smi --query-gpu=name --format=csv,noheader,nounits || true", timeout=8)
+        except Exception: return None
+        return bool(out and 'nvidia-smi' in out)
+
+    def sync(self, remote=None, recursive=False, use_checksum=False, include=None, exclude=None, method='auto',
+             since_last=False, local_dir=None, cluster=None):
+        """Mirror <shared>/outputs into the result cache, or into local_dir (outside the cache,
+        tracked by a manifest only). Returns the TransferEngine summary plus recent
+        per-method rates and what was evicted to stay within the cache quota."""
+        conn = self._conn(cluster); remote = (remote or conn.setting('shared_path', self.cfg)).rstrip('/')
+        if not remote: raise EngineError("Enter shared remote path", 'bad_request')
+        outdir = remote + '/outputs'; cached = not local_dir
+        local_dir = RESULTS.shared_dir(conn.name) if cached else Path(local_dir)
+        with self._operation() as cancelled:
+            engine = TransferEngine(conn.ssh, use_checksum=use_checksum, include=include, exclude=exclude, method=method,
+                                    log=lambda s: self.log(s, conn.name), cancel=cancelled, catalog=RESULTS.catalog(conn.name) if cached else None,
+                                    progress=lambda done, total, _: self.emit('progress', op='sync', done=done, total=total),
+                                    rates=get_storage().transfer_rates)
+            self.log(f"Syncing {outdir} -> {local_dir} ...", conn.name)
+            res = engine.sync(outdir, local_dir, recursive=recursive, prune=recursive, since_last=since_last)
+        res['evicted'] = self._trim_results() if cached and res['files'] else [0, 0]
+        if res['files']: get_storage().record_transfer(res['method'], res['files'], res['bytes'], res['seconds'])
+        res['rates'] = get_storage().transfer_rates()
+        rates = ', '.join(f"{m} {r:.2f} MB/s" for m, (r, _) in sorted(res['rates'].items()))
+        self.log(f"Fetch complete ({res['method']}): {res['files']} downloaded, {res['skipped']} unchanged, {len(res['failed'])} failed — "
+                 f"{res['bytes']/1e6:.1f} MB in {res['seconds']:.1f}s ({res['mbps']:.2f} MB/s)" + (f"; recent averages: {rates}" if rates else ''),
+                 conn.name)
+        return res
+
+    def _stage_bundle(self, conn, script, remote_dir, project_dir):
+        """Ensure the script and its dependencies are in the remote upload cache.
+        Returns (working dir, extra sbatch setup lines)."""
+        log = lambda s: self.log(s, conn.name)
+        try:
+            tree, rel, st = UploadCache(conn.ssh, remote_dir, log=log).ensure(script, project_dir or None)
+        except Exception as e:
+            raise EngineError(f"Upload failed: {e}")
+        if st['cached']: log(f"Bundle cached ({st['files']} files) in {tree}")
+        else: log(f"Bundle {tree}: {st['files']} files, uploaded {st['uploaded']} new ({st['bytes']/1024:.1f} KB) in {st['seconds']:.2f}s")
+        # run from the script's folder; with a project dir, every project folder is on the MATLAB path
+        workdir = posixpath.join(tree, posixpath.dirname(rel)).rstrip('/')
+        setup = f"export MATLABPATH=\"$(find {shlex.quote(tree)} -type d ! -name private ! -path '*/+*' ! -path '*/@*' | paste -sd: -)\"\n" if project_dir else ''
+        return workdir, setup
+
+    def _route(self):
+        """The connected cluster with the most idle CPUs, by sinfo snapshots no older than
+        ROUTE_MAX_AGE (stale ones are refreshed first, in parallel)."""
+        with self._conn_lock: conns = list(self.conns.values())
+        if not conns: raise EngineError("Not connected", 'not_connected')
+        def fresh(conn):
+            if conn.state.updated_at and time.time() - conn.state.updated_at <= ROUTE_MAX_AGE: return
+            try: self._emit_cluster(conn, conn.state.refresh(conn.ssh))
+            except Exception as e: self.log("sinfo/squeue err: "+str(e), conn.name)
+        list(self._pool.map(fresh, conns))
+        # rank the snapshot taken above: a cluster disconnecting meanwhile is skipped, not looked up again
+        ranked = sorted(((c.state.free_cpus(), c) for c in conns if c.state.updated_at and not c.closed), key=lambda r: -r[0])
+        if not ranked: raise EngineError("No cluster reported its load")
+        self.log("Routing to least-loaded cluster: " + ', '.join(f"{c.name} {free} idle CPUs" for free, c in ranked))
+        return ranked[0][1]
+
+    def _sbatch(self, conn, remote_sbatch):
+        """Run sbatch exactly once. It is not idempotent, so a transport that drops while it
+        runs is not retried: the job may or may not exist and the caller must not resubmit."""
+        try: return conn.ssh.exec(f"sbatch {shlex.quote(remote_sbatch)}", retry=False)
+        except SSH_TRANSPORT_ERRORS as e:
+            raise EngineError(f"Submission state unknown: the connection to {conn.name} dropped while sbatch {remote_sbatch} ran ({e}); "
+                              f"check squeue before resubmitting", 'submission_unknown')
+
+    def _submit_args(self, script, remote_base, cluster):
+        conn = self._route() if cluster == 'auto' else self._conn(cluster)
+        if not script or not Path(script).is_file(): raise EngineError("Select a local .m file", 'bad_request')
+        remote_base = remote_base or conn.setting('remote_base_path', self.cfg) or f"/home/{conn.user}"
+        self.save_profile(conn.name, remote_base_path=remote_base)
+        return conn, f"{remote_base}/hpc_jobs"
+
+    def submit(self, script, remote_base=None, cpus=4, mem='8G', use_gpu=False, args='', project_dir='', shared=None, cluster=None):
+        """Stage the script bundle, generate and submit its sbatch file on cluster ('auto':
+        the least loaded). Returns the job record."""
+        conn, remote_dir = self._submit_args(script, remote_base, cluster); ssh = conn.ssh
+        workdir, setup = self._stage_bundle(conn, script, remote_dir, project_dir)
+        script_basename = Path(script).stem
+        if shared is None: shared = conn.setting('shared_path', self.cfg)
+        sbatch_name = f"{script_basename}_job_{int(time.time())}.sh"
+        remote_sbatch = f"{remote_dir}/{sbatch_name}"; remote_out = f"{remote_dir}/{script_basename}_%j.out"
+        matlab_call = f"{script_basename}({args})" if args else f"{script_basename}()"
+        sbatch_content = build_sbatch_script(script_basename, workdir, remote_out, cpus, mem or '8G', use_gpu, shared, matlab_call, setup=setup)
+        try:
+            ssh.write_text(remote_sbatch, sbatch_content)
+            self.log(f"Uploaded sbatch {remote_sbatch}", conn.name)
+            out, err = self._sbatch(conn, remote_sbatch)
+        except EngineError as e:
+            insert_job_record(None, remote_sbatch, remote_out, str(e), status='SUBMIT_UNKNOWN', cluster=conn.name); raise
+        except Exception as e:
+            insert_job_record(None, remote_sbatch, remote_out, str(e), status='SUBMIT_FAILED', cluster=conn.name)
+            raise EngineError(f"Submit failed: {e}")
+        jobid = parse_sbatch_jobid(out)
+        insert_job_record(jobid, remote_sbatch, remote_out, out or err, status='SUBMITTED' if jobid else 'SUBMIT_FAILED', cluster=conn.name)
+        if not jobid: raise EngineError(f"sbatch failed: {err or out}")
+        self.log(out, conn.name); self._agent_watch(conn); self._hurry(conn)
+        return {'jobid': jobid, 'cluster': conn.name, 'remote_sbatch': remote_sbatch, 'remote_out': remote_out}
+
+    def submit_sweep(self, script, grid='', csv_path='', remote_base=None, cpus=4, mem='8G', use_gpu=False,
+                     max_parallel=0, project_dir='', shared=None, cluster=None):
+        """Submit one Slurm array job covering every point of a sweep grid or CSV."""
+        try: arg_sets = load_param_csv(csv_path) if csv_path else parse_param_grid(grid)
+        except Exception as e: raise EngineError(f"Invalid sweep: {e}", 'bad_request')
+        if not arg_sets: raise EngineError("Enter a parameter grid (name=values; ...) or pick a CSV", 'bad_request')
+        conn, remote_dir = self._submit_args(script, remote_base, cluster); ssh = conn.ssh
+        workdir, setup = self._stage_bundle(conn, script, remote_dir, project_dir)
+        script_basename = Path(script).stem; stamp = int(time.time())
+        if shared is None: shared = conn.setting('shared_path', self.cfg)
+        remote_params = f"{remote_dir}/{script_basename}_params_{stamp}.txt"
+        remote_sbatch = f"{remote_dir}/{script_basename}_sweep_{stamp}.sh"
+        out_pattern = f"{remote_dir}/{script_basename}_%A_%a.out"
+        array = f"0-{len(arg_sets) - 1}" + (f"%{max_parallel}" if max_parallel else "")
+        # each task reads its own line of the parameter file; MATLAB evals it from the environment
+        setup += (f'export HPC_TASK_ID=$SLURM_ARRAY_TASK_ID\n'
+                  f'export HPC_TASK_ARGS="$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" {remote_params})"\n')
+        matlab_call = f"eval(['{script_basename}(' getenv('HPC_TASK_ARGS') ')'])"
+        sbatch_content = build_sbatch_script(script_basename, workdir, out_pattern, cpus, mem or '8G', use_gpu, shared,
+                                             matlab_call, array=array, setup=setup)
+        try:
+            ssh.write_text(remote_params, '\n'.join(arg_sets) + '\n')
+            ssh.write_text(remote_sbatch, sbatch_content)
+            self.log(f"Uploaded {remote_params} ({len(arg_sets)} parameter sets) and {remote_sbatch}", conn.name)
+            out, err = self._sbatch(conn, remote_sbatch)
+        except EngineError as e:
+            insert_job_record(None, remote_sbatch, out_pattern, str(e), status='SUBMIT_UNKNOWN', cluster=conn.name); raise
+        except Exception as e:
+            insert_job_record(None, remote_sbatch, out_pattern, str(e), status='SUBMIT_FAILED', cluster=conn.name)
+            raise EngineError(f"Sweep submit failed: {e}")
+        parent = parse_sbatch_jobid(out)
+        if not parent:
+            insert_job_record(None, remote_sbatch, out_pattern, err or out, status='SUBMIT_FAILED', cluster=conn.name)
+            raise EngineError(f"sbatch failed: {err or out}")
+        get_storage().insert_array_job(parent, remote_sbatch, out_pattern, out, len(arg_sets), cluster=conn.name)
+        self.log(f"{out} (array {array})", conn.name); self._agent_watch(conn); self._hurry(conn)
+        return {'jobid': parent, 'cluster': conn.name, 'tasks': len(arg_sets), 'array': array, 'remote_sbatch': remote_sbatch}
+
+    def submit_pack(self, script, grid='', csv_path='', workers=8, remote_base=None, mem='4G', project_dir='', shared=None,
+                    cluster=None):
+        """Run every point of a sweep grid or CSV as a task of one allocation: `workers`
+        single-threaded MATLAB sessions (one per core, `mem` each) pull the tasks from the
+        shared folder, so MATLAB starts once per worker instead of once per task.
+        Task progress is recorded in the DB and announced as `pack` events."""
+        try: arg_sets = load_param_csv(csv_path) if csv_path else parse_param_grid(grid)
+        except Exception as e: raise EngineError(f"Invalid sweep: {e}", 'bad_request')
+        if not arg_sets: raise EngineError("Enter a parameter grid (name=values; ...) or pick a CSV", 'bad_request')
+        workers = int(workers)
+        if not 1 <= workers <= PACK_MAX_WORKERS: raise EngineError(f"Workers must be between 1 and {PACK_MAX_WORKERS}", 'bad_request')
+        workers = min(workers, len(arg_sets))
+        conn, remote_dir = self._submit_args(script, remote_base, cluster); ssh = conn.ssh
+        shared = (conn.setting('shared_path', self.cfg) if shared is None else shared).rstrip('/')
+        if not shared: raise EngineError("Packed submissions need the shared path (its inputs/, locks/ and outputs/ folders)", 'bad_request')
+        workdir, setup = self._stage_bundle(conn, script, remote_dir, project_dir)
+        script_basename = Path(script).stem; stamp = int(time.time())
+        paths = pack_paths(shared, f"{script_basename}_{stamp}"); chunk = pack_chunk_size(len(arg_sets), workers)
+        remote_sbatch = f"{remote_dir}/{script_basename}_pack_{stamp}.sh"; remote_out = f"{remote_dir}/{script_basename}_%j.out"
+        sbatch_content = build_pack_sbatch(script_basename, workdir, remote_out, workers, mem or '4G', shared, script_basename, paths, chunk,
+                                           setup=setup)
+        try:
+            out, err = ssh.exec(f"mkdir -p {' '.join(shlex.quote(p) for p in paths.values())} && echo ok")
+            if out != 'ok': raise RuntimeError(err or f"cannot create {paths['inputs']}")
+            ssh.write_text(f"{paths['inputs']}/tasks.txt", '\n'.join(arg_sets) + '\n')
+            ssh.write_text(f"{paths['inputs']}/{PACK_WORKER_NAME}.m", PACK_WORKER_M)
+            ssh.write_text(remote_sbatch, sbatch_content)
+            self.log(f"Uploaded {len(arg_sets)} tasks to {paths['inputs']} and {remote_sbatch}", conn.name)
+            out, err = self._sbatch(conn, remote_sbatch)
+        except EngineError as e:
+            insert_job_record(None, remote_sbatch, remote_out, str(e), status='SUBMIT_UNKNOWN', cluster=conn.name); raise
+        except Exception as e:
+            insert_job_record(None, remote_sbatch, remote_out, str(e), status='SUBMIT_FAILED', cluster=conn.name)
+            raise EngineError(f"Pack submit failed: {e}")
+        jobid = parse_sbatch_jobid(out)
+        if not jobid:
+            insert_job_record(None, remote_sbatch, remote_out, err or out, status='SUBMIT_FAILED', cluster=conn.name)
+            raise EngineError(f"sbatch failed: {err or out}")
+        get_storage().insert_pack_job(jobid, remote_sbatch, remote_out, out, paths['outputs'], workers, arg_sets, cluster=conn.name)
+        self.log(f"{out} ({len(arg_sets)} tasks on {workers} workers, chunks of {chunk})", conn.name); self._agent_watch(conn); self._hurry(conn)
+        return {'jobid': jobid, 'cluster': conn.name, 'tasks': len(arg_sets), 'workers': workers, 'remote_sbatch': remote_sbatch,
+                'pack_dir': paths['outputs']}
+
+    # --- queries ---
+    def jobs(self, limit=100):
+        return list_jobs(int(limit))
+
+    def history(self, **filters):
+        """A page of the job history; filters and paging as in Storage.job_history."""
+        try: return list_job_history(**filters)
+        except (KeyError, TypeError, sqlite3.OperationalError) as e: raise EngineError(f"Invalid history query: {e}", 'bad_request')
+
+    def backfill_accounting(self, cluster=None):
+        """Record elapsed time, MaxRSS, CPU efficiency and exit code of finished jobs that
+        have none yet, ACCT_BATCH jobs per sacct call. Returns {'updated', 'unknown'}."""
+        storage = get_storage(); res = {'updated': 0, 'unknown': 0}
+        for conn in self._targets(cluster):
+            while True:
+                ids = storage.unaccounted_jobs(conn.name, ACCT_BATCH)
+                if not ids: break
+                out, err = conn.ssh.exec(f"sacct -n -P -j {JobStateWatcher._query_ids(ids)} -o {SACCT_ACCT_FORMAT}", timeout=60)
+                if not out and err: raise EngineError(f"sacct failed: {err}")
+                acct = {j: v for j, v in parse_sacct_accounting(out).items() if j in ids}
+                missing = [j for j in ids if j not in acct]
+                storage.record_accounting(acct, missing, conn.name)
+                res['updated'] += len(acct); res['unknown'] += len(missing)
+        if res['updated']: self.log(f"Accounting recorded for {res['updated']} job(s)")
+        return res
+
+    def job(self, jobid, cluster=None):
+        return get_job(str(jobid), cluster)
+
+    def pack(self, jobid, cluster=None, status=None, after=-1, limit=HISTORY_PAGE):
+        """Task progress of a packed job: {'jobid', 'cluster', 'status', 'pack_dir', 'workers',
+        'counts' {task status: n}, 'total', 'tasks'}, tasks being (task, args, status,
+        worker, elapsed_s, finished_at, error) rows after task `after`, optionally of the
+        given task status(es) only; 'next' is the `after` of the following page."""
+        storage = get_storage()
+        rows = storage.execute(SQL_GET_PACK, (str(jobid), cluster))
+        if not rows: raise EngineError(f"No packed job {jobid}" + (f" on {cluster}" if cluster else ''), 'bad_request')
+        pack_id, job_status, pack_dir, workers, cluster = rows[0]
+        counts = storage.pack_counts(pack_id); tasks = storage.pack_tasks(pack_id, status, after, limit)
+        return {'jobid': str(jobid), 'cluster': cluster, 'status': job_status, 'pack_dir': pack_dir, 'workers': workers, 'counts': counts,
+                'total': sum(counts.values()), 'tasks': tasks, 'next': tasks[-1][0] if len(tasks) == int(limit) else None}
+
+    def job_output(self, jobid, nbytes=TAIL_VIEW_BYTES, cluster=None):
+        """Tail of the local copy of a job's output."""
+        row = get_job(str(jobid), cluster)
+        if not row or not row[2]: return ''
+        local = local_output_path(jobid, remote_output_path(jobid, row[2]), row[5])
+        if local.exists(): RESULTS.touch(local)
+        return read_local_tail(local, int(nbytes))
+
+    # --- result cache ---
+    def results(self, jobid=None, cluster=None, pinned=None, limit=HISTORY_PAGE):
+        """The result cache: {'root', 'quota', 'files', 'bytes', 'pinned_bytes'} and 'results',
+        catalog rows (RESULT_COLUMNS) of the given job, cluster or pin state, most
+        recently used first."""
+        rows = get_storage().results(cluster, None if jobid is None else str(jobid), pinned, limit)
+        return dict(RESULTS.usage(), results=rows)
+
+    def pin_results(self, jobid=None, path=None, pinned=True, cluster=None):
+        """Keep (or, with pinned=False, stop keeping) a job's results, including files fetched
+        later, or the cached files at or under a local path, out of eviction."""
+        if jobid is None and not path: raise EngineError("Name a job or a path to pin", 'bad_request')
+        if jobid is not None:
+            row = get_job(str(jobid), cluster)
+            if not row: raise EngineError(f"No job {jobid}" + (f" on {cluster}" if cluster else ''), 'bad_request')
+            cluster, path = row[5], None
+        n = get_storage().pin_results(bool(pinned), cluster, None if jobid is None else str(jobid), path and str(Path(path).expanduser().resolve()))
+        what = f"job {jobid}" if jobid is not None else str(path)
+        self.log(f"{'Pinned' if pinned else 'Unpinned'} results of {what} ({n} cached file(s))", cluster)
+        if not pinned: self._trim_results()
+        return {'updated': n}
+
+    def _trim_results(self):
+        """Hold the result cache to its quota; returns [files, bytes] evicted."""
+        files, nbytes = RESULTS.trim()
+        if files: self.log(f"Result cache over quota: evicted {files} least recently used file(s), {nbytes/1e6:.1f} MB")
+        return [files, nbytes]
+
+    def cluster(self):
+        """Nodes, partitions and queue of all connected clusters; records name their cluster."""
+        with self._conn_lock: states = [c.state for c in self.conns.values()]
+        return {'nodes': [n for s in states for n in s.nodes.values()], 'partitions': [p for s in states for p in s.partitions.values()],
+                'jobs': [j for s in states for j in s.jobs.values()],
+                'free_cpus': {s.name: s.free_cpus() for s in states if s.updated_at},
+                'updated_at': max((s.updated_at for s in states if s.updated_at), default=None)}
+
+    def power_range(self, seconds):
+        end = datetime.utcnow()
+        return get_storage().power_range(end - timedelta(seconds=float(seconds)), end)
+
+    # --- diagnostics ---
+    def metrics(self, fmt='json'):
+        """Latency histograms and counters since the last reset, plus each cluster's SSH pool
+        and whether profiling runs; fmt='prometheus' returns {'text': exposition} instead."""
+        if fmt == 'prometheus': return {'text': METRICS.prometheus()}
+        if fmt != 'json': raise EngineError(f"Unknown metrics format {fmt!r}", 'bad_request')
+        snap = METRICS.snapshot()
+        with self._conn_lock: snap['pools'] = {n: c.ssh.stats() for n, c in self.conns.items()}
+        snap['profiling'] = PROFILER.active
+        return snap
+
+    def set_metrics(self, enabled=None, reset=False):
+        """Turn metrics collection on/off (saved in the config) and/or clear what was collected."""
+        if enabled is not None:
+            METRICS.enabled = bool(enabled); update_config(self.cfg, metrics=METRICS.enabled)
+        if reset: METRICS.reset()
+        return {'enabled': METRICS.enabled, 'since': METRICS.since}
+
+    def profile(self, action='report', sort='cumulative', limit=PROFILE_REPORT_LINES):
+        """cProfile of engine work: action 'start' (discarding the previous profile), 'stop'
+        or 'report'. Returns {'active', 'since', 'report'}, the report sorted by a pstats key."""
+        if action == 'start': PROFILER.start()
+        elif action == 'stop': PROFILER.stop()
+        elif action != 'report': raise EngineError(f"Unknown profile action {action!r}", 'bad_request')
+        try: report = PROFILER.report(sort, limit)
+        except KeyError: raise EngineError(f"Unknown sort key {sort!r}", 'bad_request')
+        return {'active': PROFILER.active, 'since': PROFILER.since, 'report': report}
+
+    # --- monitors ---
+    def _kick(self):
+        with self._sched_cond: self._kicked = True; self._sched_cond.notify_all()
+
+    def _hurry(self, conn):
+        """Poll conn's jobs and snapshot soon again, e.g. after a submission."""
+        with self._sched_cond: conn.plan.hurry(time.time()); self._kicked = True; self._sched_cond.notify_all()
+
+    def _ensure_scheduler(self):
+        with self._sched_cond:
+            if self._scheduler is None:
+                self._scheduler = threading.Thread(target=self._monitor_loop, name='monitor-scheduler', daemon=True)
+                self._scheduler.start()
+
+    def _monitor_loop(self):
+        """Dispatch the due polls of every polling cluster, and the pack progress reads of
+        clusters the agent monitors, to the worker pool, sleeping until the next one is
+        due. Exits when the last cluster disconnects."""
+        with self._sched_cond:
+            while not self._stop.is_set():
+                with self._conn_lock: conns = list(self.conns.values())
+                if not conns: break
+                now = time.time(); wake = now + SCHEDULER_MAX_SLEEP
+                for conn in conns:
+                    if conn.closed: continue
+                    if conn.polling: wake = min(wake, self._schedule(conn, now))
+                    elif conn.agent: wake = min(wake, self._schedule_packs(conn, now))
+                if not self._kicked: self._sched_cond.wait(max(0.05, wake - time.time()))
+                self._kicked = False
+            self._scheduler = None
+
+    def _schedule(self, conn, now):
+        """Dispatch conn's due polls as one cycle; returns when its next poll is due.
+        A snapshot coming due with a job poll runs first and answers for the jobs it
+        lists, so their squeue call is spared."""
+        watch_jobs, poll_cluster = conn.monitors; plan = conn.plan
+        watch_jobs = watch_jobs and not conn.is_busy('jobs'); poll_cluster = poll_cluster and not conn.is_busy('cluster')
+        if watch_jobs: plan.sync({r[0] for r in list_active_jobs(conn.name) if r[0]}, now)
+        jobs = plan.due_jobs(now) if watch_jobs else []
+        cluster = poll_cluster and plan.cluster_due <= now + (POLL_COALESCE if jobs else 0)
+        if jobs or cluster:
+            wait = self._budget.take((1 if jobs else 0) + (2 if cluster else 0))      # squeue; sinfo/squeue + telemetry
+            if wait:
+                plan.defer(jobs, cluster, now + wait)
+            else:
+                kinds = {k for k, on in (('jobs', jobs), ('cluster', cluster)) if on}
+                plan.defer(jobs, cluster, now + SCHEDULER_MAX_SLEEP)                     # until the cycle reschedules them
+                conn.claim(kinds)                                                        # before the worker can release them
+                try: self._pool.submit(PROFILER.profiled, self._run_cycle, conn, kinds, set(jobs))
+                except RuntimeError: conn.release(kinds); return now + SCHEDULER_MAX_SLEEP   # pool shut down
+        return plan.next_due(watch_jobs, poll_cluster) or now + SCHEDULER_MAX_SLEEP
+
+    def _run_cycle(self, conn, kinds, jobids):
+        try:
+            if conn.closed: return
+            with METRICS.timer('monitor_cycle', cluster=conn.name, kind='+'.join(sorted(kinds))):
+                known = self._poll_cycle(conn) if 'cluster' in kinds else None
+                if 'jobs' in kinds: self._watch_cycle(conn, jobids, known)
+        except Exception as e:
+            if not conn.closed: self.log(("Job watcher loop error: " if 'jobs' in kinds else "Polling error: ") + str(e), conn.name)
+        finally:
+            conn.release(kinds); self._kick()
+
+    # --- job watcher ---
+    def poll_jobs(self, cluster=None):
+        """One job watcher cycle (of one cluster, or of all): record state transitions, tail
+        running jobs' output. Returns the ids still active."""
+        conns = self._targets(cluster)
+        if not conns: raise EngineError("Not connected", 'not_connected')
+        for conn in conns: self._watch_cycle(conn)
+        return [r[0] for r in list_active_jobs()]
+
+    def _watch_cycle(self, conn, jobids=None, known=None):
+        with conn.watch_lock: self._watch_once(conn, jobids, known)
+
+    def _watch_once(self, conn, jobids=None, known=None):
+        """Poll the active jobs in jobids (default: all), then reschedule them: back to
+        fast polling if they changed state or printed output, else backed off."""
+        rows = [r for r in list_active_jobs(conn.name) if jobids is None or r[0] in jobids]
+        transitions = conn.watcher.poll(conn.ssh, rows, known)
+        status = self._apply_transitions(conn, rows, transitions)
+        running = [(jobid, remote_output_path(jobid, out)) for jobid, _, out in rows
+                   if out and status.get(jobid) == 'RUNNING']
+        grown = conn.tailer.poll(conn.ssh, running, conn.name)
+        for jobid, text in grown.items():
+            self.emit('job_output', cluster=conn.name, jobid=jobid, text=text)
+        progressed = self._follow_packs(conn, running=[jobid for jobid, st in status.items() if st == 'RUNNING'])
+        changed = {t[0] for t in transitions} | set(grown) | progressed; now = time.time()
+        with self._sched_cond:
+            for jobid, _, _ in rows: conn.plan.job_polled(jobid, status.get(jobid), jobid in changed, now)
+
+    def _apply_transitions(self, conn, rows, transitions):
+        """Finish the output of jobs that ended, then record and announce the transitions;
+        returns {jobid: status}. Output first, so a job stops counting as active only once
+        its local copy is complete."""
+        for jobid, old, new, remote_out in transitions:
+            if new in TERMINAL_JOB_STATES: self._fetch_job_output(conn, jobid, remote_out)
+        ended = {jobid for jobid, _, new, _ in transitions if new in TERMINAL_JOB_STATES}
+        if ended: self._follow_packs(conn, final=ended); self._trim_results()
+        update_job_statuses([(jobid, new) for jobid, _, new, _ in transitions], conn.name)
+        parents = [jobid.split('_', 1)[0] for jobid, _, _, _ in transitions if '_' in jobid]
+        if parents: get_storage().refresh_array_parents(parents, conn.name)
+        status = {jobid: st for jobid, st, _ in rows}
+        for jobid, old, new, remote_out in transitions:
+            self.log(f"Job {jobid}: {old} -> {new}", conn.name); self.emit('job', cluster=conn.name, jobid=jobid, old=old, new=new)
+            status[jobid] = new
+        return status
+
+    def _fetch_job_output(self, conn, jobid, remote_out):
+        """Finish the local copy of a job's output: only bytes not tailed yet are read."""
+        if not remote_out: return
+        ssh = conn.ssh
+        remote_out_path = remote_output_path(jobid, remote_out)
+        local_target = local_output_path(jobid, remote_out_path, conn.name)
+        try:
+            found, text = conn.tailer.finalize(ssh, jobid, remote_out_path, conn.name)
+        except Exception as e:
+            found, text = False, ''; self.log(f"Reading {remote_out_path} failed: {e}", conn.name)
+        if found:
+            if text: self.emit('job_output', cluster=conn.name, jobid=jobid, text=text)
+            self.log(f"Output for job {jobid} complete at {local_target}", conn.name); return
+        # try get from shared outputs if configured
+        shared = conn.setting('shared_path', self.cfg)
+        if shared:
+            cand = f"{shared}/outputs/{jobid}.out"
+            try:
+                local_target.parent.mkdir(parents=True, exist_ok=True); ssh.get(cand, str(local_target))
+                RESULTS.record_file(conn.name, jobid, cand, local_target, os.path.getmtime(local_target))
+                self.log(f"Downloaded output for job {jobid} from shared folder", conn.name)
+                self.emit('job_output', cluster=conn.name, jobid=jobid, text=read_local_tail(local_target)); return
+            except Exception: pass
+        self.log(f"Could not download output for {jobid}: {remote_out_path} not found", conn.name)
+
+    # --- packs ---
+    def _follow_packs(self, conn, running=(), final=()):
+        """Record the new task progress of conn's packs among the jobs `running` and `final`;
+        packs whose job ended (`final`) are read to the end, then closed. Emits a `pack`
+        event per pack that changed; returns the job ids of packs that progressed."""
+        storage = get_storage(); wanted = set(running) | set(final)
+        packs = {jobid: p for jobid, p in storage.open_packs(conn.name).items() if jobid in wanted} if wanted else {}
+        if not packs: return set()
+        try: found = conn.packs.poll(conn.ssh, {pack_id: (pack_dir, workers) for pack_id, pack_dir, workers in packs.values()})
+        except Exception as e:
+            found = {}; self.log(f"Reading pack progress failed: {e}", conn.name)
+        progressed = set()
+        for jobid, (pack_id, _, _) in packs.items():
+            if found.get(pack_id): storage.record_pack_progress(pack_id, found[pack_id]); progressed.add(jobid)
+            if jobid in final: storage.close_pack(pack_id); conn.packs.forget(pack_id)
+            if jobid in progressed or jobid in final:
+                counts = storage.pack_counts(pack_id)
+                self.emit('pack', cluster=conn.name, jobid=jobid, counts=counts, total=sum(counts.values()))
+        return progressed
+
+    # --- cluster poller ---
+    def _poll_cycle(self, conn):
+        """Refresh conn's snapshot and telemetry. Returns {jobid: state} of the queue, or
+        None when sinfo/squeue failed."""
+        try:
+            diff = conn.state.refresh(conn.ssh)
+        except Exception as e:
+            self.log("sinfo/squeue err: "+str(e), conn.name); return None
+        finally:
+            with self._sched_cond: conn.plan.cluster_polled(not conn.state.jobs and not conn.plan.jobs, time.time())
+        self._emit_cluster(conn, diff)
+        try:
+            if self.telemetry.collect(conn.ssh, self._telemetry_nodes(conn), group=conn.name): self._emit_telemetry()
+        except Exception as e:
+            self.log("telemetry err: "+str(e), conn.name)
+        return {j.jobid: normalize_slurm_state(j.state) for j in conn.state.jobs.values()}
+
+    def _emit_cluster(self, conn, diff):
+        if not is_empty_diff(diff): self.emit('cluster', cluster=conn.name, diff={k: [v[0], list(v[1])] for k, v in diff.items()})
+
+    @staticmethod
+    def _telemetry_nodes(conn):
+        return [n.name for n in conn.state.nodes.values() if not n.state.startswith(('down', 'drain', 'fail'))]
+
+    def _emit_telemetry(self):
+        ts, power, util, tflops = (None if np.isnan(v) else float(v) for v in self.power_history.snapshot()[-1])
+        self.emit('telemetry', ts_sample=ts, power=power, util=util, tflops=tflops, nodes=self.telemetry.node_utils())
+
+    # --- remote agent ---
+    def _start_agent(self, conn):
+        watch_jobs, poll_cluster = conn.monitors
+        agent = RemoteAgent(conn.ssh, lambda msg: PROFILER.profiled(self._on_agent_message, conn, msg), lambda reason: self._on_agent_exit(conn, reason),
+                            log=lambda s: self.log(s, conn.name))
+        try:
+            hello = agent.start(dict(interval=AGENT_INTERVAL, cluster_interval=POLL_INTERVAL if poll_cluster else 0,
+                                     heartbeat=AGENT_HEARTBEAT, cluster_cmd=CLUSTER_STATE_CMD, cluster_sep=CLUSTER_STATE_SEP,
+                                     max_chunk=TAIL_MAX_CHUNK))
+        except Exception as e:
+            self.log(f"Remote agent unavailable ({e}); polling instead", conn.name); return False
+        conn.agent = agent
+        self.log(f"Remote agent running on {hello.get('host')} (Python {hello.get('python')})", conn.name)
+        if watch_jobs: self._agent_watch(conn)
+        return True
+
+    def _on_agent_exit(self, conn, reason):
+        if conn.closed or not conn.agent: return
+        conn.agent = None
+        self.log(f"Remote agent stopped ({reason}); falling back to polling", conn.name)
+        conn.polling = True; self._kick()
+
+    def _agent_watch(self, conn, seek=None):
+        """Send the agent the active jobs with their output file and local copy size."""
+        agent = conn.agent
+        if not agent or not conn.monitors[0]: return
+        jobs = {}
+        for jobid, _, out in list_active_jobs(conn.name):
+            if not jobid: continue
+            path = remote_output_path(jobid, out) if out else ''
+            local = local_output_path(jobid, path, conn.name) if path else None
+            jobs[jobid] = [path, local.stat().st_size if local and local.exists() else 0]
+        conn.agent_paths = {jobid: path for jobid, (path, _) in jobs.items()}
+        try: agent.send(cmd='watch', jobs=jobs, seek=seek or {})
+        except Exception as e: self.log(f"Agent watch update failed: {e}", conn.name)
+
+    def _on_agent_message(self, conn, msg):
+        kind = msg.get('t')
+        if kind == 'jobs': self._agent_jobs(conn, msg.get('states') or {})
+        elif kind == 'out': self._agent_output(conn, msg)
+        elif kind == 'cluster': self._agent_cluster(conn, msg)
+        elif kind == 'telemetry':
+            if self.telemetry.record(parse_telemetry(msg.get('text')), conn.name): self._emit_telemetry()
+        elif kind == 'gpu': conn.gpu = bool(msg.get('present'))
+        elif kind == 'error': self.log(f"Agent {msg.get('where')} error: {msg.get('msg')}", conn.name)
+
+    def _agent_jobs(self, conn, states):
+        if conn.closed: return
+        conn.agent_states.update((jobid, normalize_slurm_state(st)) for jobid, st in states.items())
+        # only jobs the agent has reported on; missing ones ('') count towards the grace period
+        rows = [r for r in list_active_jobs(conn.name) if r[0] in conn.agent_states]
+        live = {jobid: st for jobid, st in conn.agent_states.items() if st}
+        with conn.watch_lock:
+            transitions = conn.watcher.diff(rows, live)
+            self._apply_transitions(conn, rows, transitions)
+        if transitions: self._agent_watch(conn)
+        if any(new == 'RUNNING' for _, _, new, _ in transitions):
+            conn.packs_due = time.time() + JOB_POLL_FAST; self._kick()                      # a pack may have started
+
+    def _schedule_packs(self, conn, now):
+        """Agent mode: dispatch a progress read of conn's running packs every PACK_POLL_INTERVAL,
+        within the remote call budget (the agent reports job states, not task logs). Returns
+        when the next read is due."""
+        if conn.packs_due > now: return conn.packs_due
+        conn.packs_due = now + PACK_POLL_INTERVAL
+        if conn.is_busy('packs') or not conn.monitors[0]: return conn.packs_due
+        running = [jobid for jobid in get_storage().open_packs(conn.name) if conn.agent_states.get(jobid) == 'RUNNING']
+        if not running: return conn.packs_due
+        wait = self._budget.take()
+        if wait: conn.packs_due = now + wait; return conn.packs_due
+        conn.claim({'packs'})
+        def run():
+            try:
+                with conn.watch_lock: self._follow_packs(conn, running=running)
+            except Exception as e:
+                if not conn.closed: self.log(f"Pack progress error: {e}", conn.name)
+            finally: conn.release({'packs'})
+        try: self._pool.submit(PROFILER.profiled, run)
+        except RuntimeError: conn.release({'packs'})         # pool shut down
+        return conn.packs_due
+
+    def _agent_output(self, conn, msg):
+        jobid = msg['job']; path = conn.agent_paths.get(jobid)
+        if not path: return
+        local = local_output_path(jobid, path, conn.name); offset = int(msg['off'])
+        data = msg['data'].encode('utf-8', 'surrogateescape')
+        with conn.watch_lock:
+            size = 0 if msg.get('reset') or not local.exists() else local.stat().st_size
+            if offset > size:                      # we lost a chunk: have the agent resend from our size
+                self._agent_watch(conn, seek={jobid: size}); return
+            data = data[size - offset:]
+            if not data: return
+            local.parent.mkdir(parents=True, exist_ok=True)
+            with open(local, 'ab' if size else 'wb') as f: f.write(data)
+            if not size: conn.tailer.reset(local)
+            text = conn.tailer.decode(local, data)
+        if text: self.emit('job_output', cluster=conn.name, jobid=jobid, text=text)
+
+    def _agent_cluster(self, conn, msg):
+        for key in ('sinfo', 'squeue'):
+            if key not in msg: continue
+            lines = conn.agent_lines.setdefault(key, {})
+            for line in msg[key].get('del', ()): lines.pop(line, None)
+            for line in msg[key].get('add', ()): lines[line] = None
+        diff = conn.state.apply(parse_sinfo_nodes('\n'.join(conn.agent_lines.get('sinfo', ()))),
+                                parse_squeue_jobs('\n'.join(conn.agent_lines.get('squeue', ()))))
+        self._emit_cluster(conn, diff)
+        nodes = self._telemetry_nodes(conn)
+        if nodes != conn.agent_nodes and conn.agent:
+            conn.agent_nodes = nodes
+            conn.agent.send(cmd='telemetry', script=build_telemetry_command(nodes) if nodes else '')
@@ -0,0 +1,1025 @@
+"""
+hpc_gui.py
+
+Qt dashboard for the HPC engine: cluster profiles and connections, submission, sync
+and job controls, live cluster tables, packed task progress, job output and the
+power/utilization chart. The window is a
+thin client: every action is an engine API call (in-process or through the
+daemon) and all state arrives as engine events.
+
+Dependencies:
+    pip install pyqt5 matplotlib numpy
+"""
+from __future__ import annotations
+import sys, os, json, time, getpass, threading, traceback
+from datetime import datetime
+from pathlib import Path
+from collections import deque
+
+import numpy as np
+from PyQt5 import QtWidgets, QtCore, QtGui
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QLabel, QLineEdit, QPushButton, QTextEdit,
+    QHBoxLayout, QVBoxLayout, QFileDialog, QMessageBox, QPlainTextEdit,
+    QInputDialog, QCheckBox, QSpinBox, QProgressBar, QTabWidget, QTableWidget, QTableWidgetItem
+)
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+
+from hpc_engine import (ACTIVE_JOB_STATES, HISTORY_COLUMNS, PACK_MAX_WORKERS, POLL_INTERVAL, SSH_POOL_SIZE, TERMINAL_JOB_STATES,
+                        TRANSFER_METHODS, EngineError, NodeRecord, PartitionRecord, QueueJobRecord, TelemetryRing, cluster_profiles,
+                        format_duration, format_kb, format_pack_counts, load_config, update_config)
+
+# ---------- background tasks ----------
+LOG_FLUSH_MS = 150              # GUI-side log flush period
+LOG_MAX_LINES_PER_FLUSH = 400   # lines appended to the log widget per flush
+LOG_MAX_ENTRY_LINES = 200       # longer messages (e.g. a big sinfo dump) are truncated
+LOG_BACKLOG_LIMIT = 5000        # queued log entries kept before the oldest are dropped
+LOG_MAX_BLOCKS = 20000          # lines kept in the log widget
+
+class TaskSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(str)
+    progress = QtCore.pyqtSignal(object, object, str)   # done, total, message
+
+class RemoteTask(QtCore.QRunnable):
+    """Runs fn(task) on a QThreadPool thread; the outcome is reported through queued signals."""
+    def __init__(self, name, fn):
+        super().__init__(); self.setAutoDelete(False)
+        self.name = name; self.fn = fn
+        self.signals = TaskSignals()     # created on the GUI thread, so slots run there
+        self._cancel = threading.Event()
+
+    def cancel(self): self._cancel.set()
+    def cancelled(self): return self._cancel.is_set()
+    def report(self, done, total, message=''): self.signals.progress.emit(done, total, message)
+
+    def run(self):
+        try: result = self.fn(self)
+        except Exception as e: self.signals.error.emit(f"{self.name} failed: {e}")
+        else: self.signals.done.emit(result)
+
+class TaskExecutor(QtCore.QObject):
+    """Bounded pool for blocking remote operations started from the GUI."""
+    def __init__(self, parent=None, max_threads=SSH_POOL_SIZE):
+        super().__init__(parent)
+        self.pool = QtCore.QThreadPool(self); self.pool.setMaxThreadCount(max_threads)
+        self._tasks = set()
+
+    def submit(self, name, fn, on_done=None, on_error=None, on_progress=None):
+        task = RemoteTask(name, fn); queued = QtCore.Qt.QueuedConnection
+        if on_done: task.signals.done.connect(on_done, queued)
+        if on_error: task.signals.error.connect(on_error, queued)
+        if on_progress: task.signals.progress.connect(on_progress, queued)
+        task.signals.done.connect(lambda _r, t=task: self._tasks.discard(t), queued)
+        task.signals.error.connect(lambda _e, t=task: self._tasks.discard(t), queued)
+        self._tasks.add(task); self.pool.start(task)
+        return task
+
+    def active(self): return len(self._tasks)
+
+    def cancel_all(self):
+        for t in list(self._tasks): t.cancel()
+
+# ---------- plotting ----------
+CHART_MAX_FPS = 4.0               # upper bound on chart repaints per second
+CHART_RANGES = (("Live", None), ("1 h", 3600), ("24 h", 86400), ("7 d", 7 * 86400), ("30 d", 30 * 86400))
+CHART_HISTORY_TTL = 60.0          # seconds a lazily loaded history range is reused
+
+def minmax_downsample(x, y, buckets):
+    """Reduce (x, y) to the min and max of y per x bucket (about one bucket per pixel
+    column), which keeps spikes visible while bounding the number of drawn points."""
+    n = len(x)
+    if n <= 2 * buckets or n < 2 or x[-1] <= x[0]: return x, y
+    b = ((x - x[0]) * (buckets / (x[-1] - x[0]))).astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, b[1:] != b[:-1]])
+    with np.errstate(all='ignore'):
+        lo = np.fmin.reduceat(y, starts); hi = np.fmax.reduceat(y, starts)
+    ends = np.r_[starts[1:], n] - 1
+    xs = np.empty(2 * len(starts)); ys = np.empty(2 * len(starts))
+    xs[0::2] = x[starts]; xs[1::2] = x[ends]; ys[0::2] = lo; ys[1::2] = hi
+    return xs, ys
+
+def power_rows_to_arrays(rows):
+    """power_history / rollup rows (iso ts, power, util, est_flops) -> (n, 4) float array."""
+    if not rows: return np.empty((0, 4))
+    ts = np.array([r[0] for r in rows], dtype='datetime64[us]').astype(np.int64) / 1e6
+    vals = np.array([r[1:4] for r in rows], dtype=float)    # None -> nan
+    out = np.column_stack((ts, vals))
+    return out[np.argsort(out[:, 0], kind='stable')]
+
+class MplCanvas(FigureCanvas):
+    """Matplotlib canvas with an incremental mode: registered line artists are drawn
+    over a cached background and blitted, and updates are throttled to max_fps.
+    A full redraw only happens when the axis limits have to move, and it is rendered
+    into the Agg buffer by a worker thread so the event loop never waits on it; the
+    figure is left alone until that render lands."""
+    rendered = QtCore.pyqtSignal()
+
+    def __init__(self, parent=None, width=6, height=2.5, dpi=100):
+        fig = Figure(figsize=(width,height), dpi=dpi)
+        self.ax = fig.add_subplot(111)
+        super().__init__(fig)
+        fig.tight_layout()
+        self.max_fps = CHART_MAX_FPS
+        self._artists = []; self._background = None; self._last_paint = 0.0; self._pending = None
+        self._render_lock = threading.Lock(); self._rendering = False; self._redraw = False
+        self._throttle = QtCore.QTimer(self); self._throttle.setSingleShot(True); self._throttle.timeout.connect(self._flush_pending)
+        self.rendered.connect(self._on_rendered)
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def set_animated_artists(self, artists):
+        for a in artists: a.set_animated(True)
+        self._artists = list(artists)
+
+    def _on_draw(self, event):
+        self._background = self.copy_from_bbox(self.figure.bbox)
+        for a in self._artists: a.axes.draw_artist(a)
+
+    def draw(self):
+        """Full redraw (also what Qt's idle draws call): started in the background."""
+        if self._rendering: self._redraw = True; return
+        self._rendering = True
+        threading.Thread(target=self._render, name='chart-render', daemon=True).start()
+
+    def _render(self):
+        try:
+            with self._render_lock: FigureCanvasAgg.draw(self)
+        except Exception: traceback.print_exc()
+        finally: self.rendered.emit()
+
+    def _on_rendered(self):
+        self._rendering = False
+        if self._redraw: self._redraw = False; self.draw(); return
+        self.update(); self._flush_pending()
+
+    def paintEvent(self, event):
+        # the buffer is being rewritten; the finished render schedules another paint
+        if not self._render_lock.acquire(blocking=False): return
+        try: super().paintEvent(event)
+        finally: self._render_lock.release()
+
+    def plot_series(self, x, series, xlim):
+        """Show `series` ({line: y array}) against x within xlim, downsampled to the
+        canvas width. Calls faster than max_fps are coalesced into one paint."""
+        self._pending = (x, series, xlim)
+        wait = self._last_paint + 1.0 / self.max_fps - time.time()
+        if wait > 0:
+            if not self._throttle.isActive(): self._throttle.start(int(wait * 1000) + 1)
+            return
+        self._flush_pending()
+
+    def _flush_pending(self):
+        if self._pending is None or self._rendering: return
+        x, series, xlim = self._pending; self._pending = None; self._last_paint = time.time()
+        buckets = max(self.width(), 50)
+        need_full = self._background is None or tuple(self.ax.get_xlim()) != tuple(xlim)
+        per_axis = {}
+        for line, y in series.items():
+            xs, ys = minmax_downsample(x, y, buckets)
+            line.set_data(xs, ys)
+            finite = ys[np.isfinite(ys)]
+            if len(finite): per_axis.setdefault(line.axes, []).append((finite.min(), finite.max()))
+        if tuple(self.ax.get_xlim()) != tuple(xlim): self.ax.set_xlim(*xlim)
+        for ax, spans in per_axis.items():
+            lo = min(s[0] for s in spans); hi = max(s[1] for s in spans)
+            pad = (hi - lo) * 0.1 or max(abs(hi) * 0.1, 1.0)
+            want_lo, want_hi = min(0.0, lo - pad), hi + pad
+            cur_lo, cur_hi = ax.get_ylim()
+            # rescale only when data leaves the view or would fit in half of it
+            if lo < cur_lo or hi > cur_hi or (want_hi - want_lo) < 0.5 * (cur_hi - cur_lo):
+                ax.set_ylim(want_lo, want_hi); need_full = True
+        if need_full:
+            self.draw()            # re-caches the background through draw_event
+            return
+        self.restore_region(self._background)
+        for a in self._artists: a.axes.draw_artist(a)
+        self.blit(self.figure.bbox)
+
+    def resizeEvent(self, event):
+        self._background = None
+        super().resizeEvent(event)
+
+# ---------- job history ----------
+HISTORY_FIELDS = ('jobid', 'cluster', 'script', 'status', 'submitted_at', 'elapsed_s', 'max_rss_kb', 'cpu_eff', 'exit_code')
+HISTORY_HEADERS = ("Job", "Cluster", "Script", "Status", "Submitted", "Elapsed", "MaxRSS", "CPU eff.", "Exit")
+HISTORY_SORTS = {0: 'submitted', 4: 'submitted', 5: 'elapsed', 6: 'max_rss', 7: 'cpu_eff'}    # column -> server-side sort
+HISTORY_STATUS_FILTERS = {"All": None, "Active": list(ACTIVE_JOB_STATES),
+                          **{st: [st] for st in sorted(TERMINAL_JOB_STATES | {'SUBMIT_FAILED', 'SUBMIT_UNKNOWN'})}}
+
+HISTORY_FORMAT = {'submitted_at': lambda v: (v or '')[:19].replace('T', ' '), 'elapsed_s': format_duration, 'max_rss_kb': format_kb,
+                  'cpu_eff': lambda v: '' if v is None else f"{v * 100:.0f}%"}
+
+class JobHistoryModel(QtCore.QAbstractTableModel):
+    """Job history loaded page by page as the view scrolls (canFetchMore/fetchMore).
+    Filtering and sorting happen in the database; each page is one keyset query run off
+    the GUI thread through run(fn, on_done, on_error)."""
+    def __init__(self, client, run, parent=None):
+        super().__init__(parent)
+        self.client = client; self._run = run
+        self._rows = []; self._next = None; self._done = True; self._loading = False
+        self._filters = {}; self._generation = 0
+
+    def reset(self, **filters):
+        """Start over with new filters (sort/descending included)."""
+        self.beginResetModel()
+        self._filters = filters; self._rows = []; self._next = None; self._done = False; self._loading = False
+        self._generation += 1
+        self.endResetModel()
+        self.fetchMore()
+
+    def refresh(self):
+        self.reset(**self._filters)
+
+    def row(self, i):
+        return dict(zip(HISTORY_COLUMNS, self._rows[i]))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(HISTORY_FIELDS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid(): return None
+        row = self.row(index.row()); field = HISTORY_FIELDS[index.column()]
+        if role == QtCore.Qt.DisplayRole:
+            value = row[field]
+            return HISTORY_FORMAT[field](value) if field in HISTORY_FORMAT else ('' if value is None else str(value))
+        if role == QtCore.Qt.ToolTipRole: return f"sbatch: {row['remote_sbatch'] or '-'}\noutput: {row['remote_out'] or '-'}"
+        if role == QtCore.Qt.TextAlignmentRole and field in ('elapsed_s', 'max_rss_kb', 'cpu_eff'):
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal: return HISTORY_HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self._done and not self._loading
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if self._done or self._loading: return
+        self._loading = True; generation = self._generation
+        query = dict(self._filters, after=self._next)
+        def loaded(page):
+            if generation != self._generation: return          # filters changed meanwhile
+            self._loading = False
+            if page['rows']:
+                self.beginInsertRows(QtCore.QModelIndex(), len(self._rows), len(self._rows) + len(page['rows']) - 1)
+                self._rows.extend(page['rows']); self.endInsertRows()
+            self._next = page['next']; self._done = page['next'] is None
+        def failed(msg):
+            if generation == self._generation: self._loading = False; self._done = True
+        self._run(lambda: self.client.history(**query), loaded, failed)
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        if column not in HISTORY_SORTS: return
+        self.reset(**dict(self._filters, sort=HISTORY_SORTS[column], descending=order == QtCore.Qt.DescendingOrder))
+
+class JobHistoryDialog(QtWidgets.QDialog):
+    """Browsable job history: filters by status, script, cluster, date range and text,
+    sorting by submission or accounting columns, and lazy loading while scrolling.
+    Double-clicking a job shows its output in the dashboard; the selected jobs' results
+    can be pinned in the local result cache."""
+    def __init__(self, dashboard):
+        super().__init__(dashboard)
+        self.dashboard = dashboard; self.setWindowTitle("Job history"); self.resize(1000, 600)
+        run = lambda fn, done, failed: dashboard._run_task("Load job history", lambda t: fn(), on_done=done, on_error=failed)
+        self.model = JobHistoryModel(dashboard.client, run, self)
+        self.status = QtWidgets.QComboBox(); self.status.addItems(list(HISTORY_STATUS_FILTERS))
+        self.cluster = QtWidgets.QComboBox(); self.cluster.addItem("All clusters")
+        self.cluster.addItems([p['name'] for p in cluster_profiles(dashboard.cfg)])
+        self.script = QLineEdit(); self.script.setPlaceholderText("script name")
+        self.text = QLineEdit(); self.text.setPlaceholderText("search job id, script, sbatch output…")
+        self.use_since = QCheckBox("From"); self.since = QtWidgets.QDateEdit(QtCore.QDate.currentDate().addMonths(-1))
+        self.use_until = QCheckBox("to"); self.until = QtWidgets.QDateEdit(QtCore.QDate.currentDate())
+        for d in (self.since, self.until): d.setCalendarPopup(True); d.setDisplayFormat("yyyy-MM-dd")
+        btn_apply = QPushButton("Apply"); btn_apply.clicked.connect(self.apply)
+        btn_acct = QPushButton("Fetch accounting"); btn_acct.clicked.connect(self.fetch_accounting)
+        btn_acct.setToolTip("Fill in elapsed time, MaxRSS, CPU efficiency and exit code of finished jobs from sacct")
+        btn_pin = QPushButton("Pin results"); btn_pin.clicked.connect(lambda: self.pin_selected(True))
+        btn_pin.setToolTip("Never evict the selected jobs' results (including files fetched later) from the local result cache")
+        btn_unpin = QPushButton("Unpin"); btn_unpin.clicked.connect(lambda: self.pin_selected(False))
+        for w in (self.script, self.text): w.returnPressed.connect(self.apply)
+        for w in (self.status, self.cluster): w.currentIndexChanged.connect(lambda _: self.apply())
+        filters = QHBoxLayout()
+        for w in (QLabel("Status:"), self.status, self.cluster, self.script, self.use_since, self.since, self.use_until, self.until,
+                  self.text, btn_apply, btn_acct, btn_pin, btn_unpin):
+            filters.addWidget(w)
+        self.view = QtWidgets.QTableView(); self.view.setModel(self.model)
+        self.view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows); self.view.verticalHeader().setVisible(False)
+        self.view.horizontalHeader().setStretchLastSection(True)
+        self.view.horizontalHeader().setSortIndicator(4, QtCore.Qt.DescendingOrder); self.view.setSortingEnabled(True)
+        self.view.doubleClicked.connect(lambda index: dashboard.show_job(self.model.row(index.row())['jobid']))
+        layout = QVBoxLayout(self); layout.addLayout(filters); layout.addWidget(self.view)
+
+    def filters(self):
+        f = {'status': HISTORY_STATUS_FILTERS[self.status.currentText()], 'script': self.script.text().strip() or None,
+             'cluster': self.cluster.currentText() if self.cluster.currentIndex() > 0 else None, 'text': self.text.text().strip() or None}
+        if self.use_since.isChecked(): f['since'] = self.since.date().toString("yyyy-MM-dd")
+        if self.use_until.isChecked(): f['until'] = self.until.date().toString("yyyy-MM-dd")
+        header = self.view.horizontalHeader()
+        f['sort'] = HISTORY_SORTS.get(header.sortIndicatorSection(), 'submitted')
+        f['descending'] = header.sortIndicatorOrder() == QtCore.Qt.DescendingOrder
+        return f
+
+    def apply(self):
+        self.model.reset(**self.filters())
+
+    def pin_selected(self, pinned):
+        rows = [self.model.row(i.row()) for i in self.view.selectionModel().selectedRows()]
+        if not rows: return
+        client = self.dashboard.client
+        self.dashboard._run_task("Pin results" if pinned else "Unpin results",
+                                 lambda t: [client.pin_results(jobid=r['jobid'], cluster=r['cluster'], pinned=pinned) for r in rows])
+
+    def fetch_accounting(self):
+        if not self.dashboard.connected: return
+        def done(res):
+            if res['updated']: self.model.refresh()
+        self.dashboard._run_task("Fetch accounting", lambda t: self.dashboard.client.backfill_accounting(), on_done=done)
+
+# ---------- diagnostics ----------
+DIAG_REFRESH_MS = 2000
+LATENCY_HEADERS = ("Metric", "Labels", "Count", "p50 ms", "p95 ms", "p99 ms", "Max ms", "Total s")
+COUNTER_HEADERS = ("Counter", "Labels", "Value")
+POOL_HEADERS = ("Cluster", "Open", "Idle", "In use", "Leases", "Waits", "Wait s", "Reconnects", "Failures")
+POOL_FIELDS = ('open', 'idle', 'in_use', 'leases', 'waits', 'wait_time', 'reconnects', 'failures')
+
+def _labels_text(labels):
+    return ', '.join(f"{k}={v}" for k, v in sorted(labels.items()) if v != '')
+
+def _fill_table(table, headers, rows):
+    table.setSortingEnabled(False)
+    table.setColumnCount(len(headers)); table.setHorizontalHeaderLabels(headers); table.setRowCount(len(rows))
+    for r, values in enumerate(rows):
+        for c, v in enumerate(values):
+            item = QTableWidgetItem()
+            item.setData(QtCore.Qt.DisplayRole, v)       # numbers sort as numbers
+            table.setItem(r, c, item)
+    table.setSortingEnabled(True)
+
+class DiagnosticsDialog(QtWidgets.QDialog):
+    """Engine metrics while it is open: remote call, transfer and database latency
+    percentiles, byte and error counters, the SSH pools, and a cProfile switch."""
+    def __init__(self, dashboard):
+        super().__init__(dashboard)
+        self.dashboard = dashboard; self.client = dashboard.client; self._pending = False
+        self.setWindowTitle("Diagnostics"); self.resize(950, 560)
+        self.enabled = QCheckBox("Collect metrics"); self.enabled.clicked.connect(self.toggle_metrics)
+        self.auto = QCheckBox("Auto refresh"); self.auto.setChecked(True)
+        btn_refresh = QPushButton("Refresh"); btn_refresh.clicked.connect(self.refresh)
+        btn_reset = QPushButton("Reset"); btn_reset.clicked.connect(lambda: self._call(lambda: self.client.set_metrics(reset=True)))
+        btn_export = QPushButton("Export…"); btn_export.clicked.connect(self.export)
+        self.btn_profile = QPushButton("Start profiling"); self.btn_profile.clicked.connect(self.toggle_profile)
+        self.since = QLabel("")
+        top = QHBoxLayout()
+        for w in (self.enabled, self.auto, btn_refresh, btn_reset, btn_export, self.btn_profile): top.addWidget(w)
+        top.addStretch(1); top.addWidget(self.since)
+        self.latency = QTableWidget(); self.counters = QTableWidget(); self.pools = QTableWidget()
+        for t in (self.latency, self.counters, self.pools):
+            t.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers); t.verticalHeader().setVisible(False)
+            t.horizontalHeader().setStretchLastSection(True)
+        self.profile = QPlainTextEdit(); self.profile.setReadOnly(True)
+        self.profile.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        tabs = QTabWidget()
+        tabs.addTab(self.latency, "Latency"); tabs.addTab(self.counters, "Counters"); tabs.addTab(self.pools, "SSH pools")
+        tabs.addTab(self.profile, "Profile")
+        layout = QVBoxLayout(self); layout.addLayout(top); layout.addWidget(tabs)
+        self.timer = QtCore.QTimer(self); self.timer.timeout.connect(lambda: self.auto.isChecked() and self.refresh())
+
+    def showEvent(self, event):
+        super().showEvent(event); self.refresh(); self.timer.start(DIAG_REFRESH_MS)
+
+    def hideEvent(self, event):
+        self.timer.stop(); super().hideEvent(event)
+
+    def _call(self, fn, on_done=None):
+        def done(result):
+            if on_done: on_done(result)
+            self.refresh()
+        self.dashboard._run_task("Diagnostics", lambda t: fn(), on_done=done)
+
+    def refresh(self):
+        if self._pending: return                # a slow engine must not pile up refreshes
+        self._pending = True
+        def fetch(task):
+            return self.client.metrics(), self.client.profile()
+        def failed(msg): self._pending = False
+        self.dashboard.tasks.submit("Diagnostics", fetch, on_done=self._show, on_error=failed)
+
+    def _show(self, result):
+        self._pending = False
+        snap, prof = result
+        self.enabled.setChecked(snap['enabled'])
+        self.since.setText("since " + time.strftime('%H:%M:%S', time.localtime(snap['since'])))
+        ms = lambda v: round(v * 1000.0, 2)
+        _fill_table(self.latency, LATENCY_HEADERS, [(r['name'], _labels_text(r['labels']), r['count'], ms(r['p50']), ms(r['p95']),
+                                                     ms(r['p99']), ms(r['max']), round(r['sum'], 3)) for r in snap['latency']])
+        _fill_table(self.counters, COUNTER_HEADERS, [(r['name'], _labels_text(r['labels']), r['value']) for r in snap['counters']])
+        _fill_table(self.pools, POOL_HEADERS, [(name,) + tuple(round(st.get(f, 0), 3) for f in POOL_FIELDS)
+                                               for name, st in sorted(snap['pools'].items())])
+        self.btn_profile.setText("Stop profiling" if prof['active'] else "Start profiling")
+        if prof['report'] != self.profile.toPlainText(): self.profile.setPlainText(prof['report'] or "No profile yet.")
+
+    def toggle_metrics(self, checked):
+        self._call(lambda: self.client.set_metrics(enabled=checked))
+
+    def toggle_profile(self):
+        action = 'stop' if self.btn_profile.text().startswith("Stop") else 'start'
+        self._call(lambda: self.client.profile(action=action))
+
+    def export(self):
+        path, kind = QFileDialog.getSaveFileName(self, "Export metrics", str(Path.home() / "hpc_metrics.prom"),
+                                                 "Prometheus text (*.prom *.txt);;JSON (*.json)")
+        if not path: return
+        def fetch(task):
+            if kind.startswith("JSON"): text = json.dumps(self.client.metrics(), indent=2)
+            else: text = self.client.metrics(fmt='prometheus')['text']
+            Path(path).write_text(text); return path
+        self.dashboard._run_task("Export metrics", fetch, on_done=lambda p: self.dashboard.append_log(f"Metrics exported to {p}"))
+
+# ---------- main GUI ----------
+NODE_TABLE_COLUMNS = ("Cluster", "Node", "Partitions", "State", "CPUs alloc/total", "Load", "Free mem (MB)", "GRES", "Util %")
+QUEUE_TABLE_COLUMNS = ("Cluster", "Job", "User", "Partition", "Name", "State", "Elapsed", "Nodes", "CPUs", "Reason/Nodes")
+PACK_TABLE_COLUMNS = ("Cluster", "Job", "Completed", "Failed", "Running", "Queued", "Total", "Progress")
+CLUSTER_RECORDS = {'nodes': NodeRecord, 'partitions': PartitionRecord, 'jobs': QueueJobRecord}
+EVENT_POLL_TIMEOUT = 20.0        # seconds the event thread long-polls the engine
+SUBMIT_DEFAULT, SUBMIT_AUTO = "default cluster", "auto (least loaded)"
+
+def _node_row(n):
+    return (n.cluster, n.name, ','.join(n.partitions), n.state, f"{n.cpus_alloc}/{n.cpus_total}", f"{n.load:.2f}", str(n.free_mem_mb), n.gres)
+
+def _queue_row(j):
+    return (j.cluster, j.jobid, j.user, j.partition, j.name, j.state, j.elapsed, str(j.nodes), str(j.cpus), j.reason)
+
+def _pack_row(ev):
+    counts = ev['counts']
+    return (ev['cluster'], ev['jobid'], *(str(counts.get(k, 0)) for k in ('COMPLETED', 'FAILED', 'RUNNING', 'QUEUED')), str(ev['total']),
+            format_pack_counts(counts))
+
+def _nan(v):
+    return np.nan if v is None else v
+
+class HPCDashboard(QWidget):
+    """Thin client of an HPCEngine: actions are API calls run on the task pool, and all
+    state (log, jobs, cluster, telemetry) arrives as engine events."""
+    _passphrase_requested = QtCore.pyqtSignal()
+    engine_events = QtCore.pyqtSignal(object)        # list of event dicts from the event thread
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.cfg = load_config()
+        self.connected = set()       # names of the connected clusters
+        self.max_history=300
+        self.power_history=TelemetryRing(self.max_history)
+        self._chart_history = {}     # range seconds -> (loaded_at, (n, 4) array from power_history)
+        self._chart_span = None      # range shown; read by the tick formatter on the render thread
+        self.tasks = TaskExecutor(self)
+        self.cluster = {kind: {} for kind in CLUSTER_RECORDS}
+        self._node_util = {}      # cluster -> {node: util %}
+        self._table_rows = {}     # id(table) -> {key: row index}
+        self._node_states = {}
+        self._log_queue = deque(maxlen=LOG_BACKLOG_LIMIT); self._log_dropped = 0
+        self._passphrase_reply = None
+        self._closing = False
+        self._history = None; self._diagnostics = None
+        # worker threads block on this until the dialog on the GUI thread returns
+        self._passphrase_requested.connect(self._prompt_passphrase, QtCore.Qt.BlockingQueuedConnection)
+        self._build_ui()
+        self.engine_events.connect(self._on_engine_events)
+        self._log_timer = QtCore.QTimer(self); self._log_timer.timeout.connect(self._flush_log); self._log_timer.start(LOG_FLUSH_MS)
+        self._run_task("Attach", lambda t: self._attach(), on_done=self._attached)
+
+    def _build_ui(self):
+        self.setWindowTitle("HPC Dashboard — MATLAB + SLURM + Shared")
+        self.resize(1150,780)
+
+        # connection row
+        self.profile_combo = QtWidgets.QComboBox(); self.profile_combo.setEditable(True)
+        self.profile_combo.setToolTip("Cluster profile: pick one to fill in its host, or type a new name")
+        self.profile_combo.addItems([p['name'] for p in cluster_profiles(self.cfg)])
+        self.profile_combo.setCurrentText(self.cfg.get('default_cluster') or self.profile_combo.currentText())
+        self.profile_combo.activated.connect(lambda _: self._load_profile())
+        self.host_edit = QLineEdit(self.cfg.get('host',''))
+        self.user_edit = QLineEdit(self.cfg.get('user',''))
+        self.key_edit = QLineEdit(self.cfg.get('key_path') or '')
+        btn_browse_key = QPushButton("Browse")
+        btn_browse_key.clicked.connect(self.browse_key)
+        self.use_agent = QCheckBox("Remote agent"); self.use_agent.setChecked(bool(self.cfg.get('use_agent', True)))
+        self.use_agent.setToolTip("Monitor through one long-lived agent process on the login node (falls back to polling)")
+        btn_connect = QPushButton("Connect"); btn_connect.clicked.connect(self.connect_clicked)
+        btn_connect_all = QPushButton("Connect all"); btn_connect_all.clicked.connect(self.connect_all_clicked)
+        btn_disconnect = QPushButton("Disconnect"); btn_disconnect.clicked.connect(self.disconnect_clicked)
+
+        row1 = QHBoxLayout()
+        row1.addWidget(QLabel("Cluster:")); row1.addWidget(self.profile_combo)
+        row1.addWidget(QLabel("Host:")); row1.addWidget(self.host_edit)
+        row1.addWidget(QLabel("User:")); row1.addWidget(self.user_edit)
+        row1.addWidget(QLabel("Key:")); row1.addWidget(self.key_edit)
+        row1.addWidget(btn_browse_key); row1.addWidget(self.use_agent); row1.addWidget(btn_connect); row1.addWidget(btn_connect_all); row1.addWidget(btn_disconnect)
+
+        # quick actions
+        btn_sinfo=QPushButton("sinfo -Nel"); btn_sinfo.clicked.connect(lambda: self.run_command_and_append("sinfo -Nel"))
+        btn_squeue=QPushButton("squeue -u $USER"); btn_squeue.clicked.connect(lambda: self.run_command_and_append("squeue -u $USER"))
+        btn_refresh=QPushButton("Refresh"); btn_refresh.clicked.connect(lambda: self._run_task("Refresh", lambda t: self.client.refresh(cluster=self._op_cluster())))
+        self.task_progress = QProgressBar(); self.task_progress.setRange(0, 1000); self.task_progress.setFormat("%p%"); self.task_progress.setVisible(False)
+        self.task_label = QLabel("")
+        btn_cancel = QPushButton("Cancel tasks"); btn_cancel.clicked.connect(self.cancel_tasks)
+        btn_history = QPushButton("Job history"); btn_history.clicked.connect(self.show_job_history)
+        btn_diag = QPushButton("Diagnostics"); btn_diag.clicked.connect(self.show_diagnostics)
+        btn_row = QHBoxLayout(); btn_row.addWidget(btn_sinfo); btn_row.addWidget(btn_squeue); btn_row.addWidget(btn_refresh)
+        btn_row.addWidget(btn_history); btn_row.addWidget(btn_diag)
+        btn_row.addWidget(self.task_label); btn_row.addWidget(self.task_progress); btn_row.addWidget(btn_cancel)
+
+        # shared folder controls
+        self.shared_path_edit = QLineEdit(self.cfg.get('shared_path','/srv/hpc/shared'))
+        btn_ensure_shared = QPushButton("Ensure shared folder"); btn_ensure_shared.clicked.connect(self.ensure_shared_folder)
+        btn_fetch_shared = QPushButton("Fetch shared results"); btn_fetch_shared.clicked.connect(self.fetch_shared_results)
+        btn_sync_remote = QPushButton("Sync outputs from remote"); btn_sync_remote.clicked.connect(self.sync_outputs_from_remote)
+        self.sync_checksum = QCheckBox("Verify checksums"); self.sync_checksum.setChecked(bool(self.cfg.get('sync_checksum', False)))
+        shared_row = QHBoxLayout()
+        shared_row.addWidget(QLabel("Shared (remote):")); shared_row.addWidget(self.shared_path_edit)
+        shared_row.addWidget(btn_ensure_shared); shared_row.addWidget(btn_fetch_shared); shared_row.addWidget(btn_sync_remote); shared_row.addWidget(self.sync_checksum)
+        self.sync_include = QLineEdit(self.cfg.get('sync_include', '')); self.sync_include.setPlaceholderText("include globs, e.g. *.mat *.csv")
+        self.sync_exclude = QLineEdit(self.cfg.get('sync_exclude', '')); self.sync_exclude.setPlaceholderText("exclude globs")
+        self.sync_newer = QCheckBox("Only newer than last sync"); self.sync_newer.setChecked(bool(self.cfg.get('sync_newer', False)))
+        self.sync_method = QtWidgets.QComboBox(); self.sync_method.addItems(TRANSFER_METHODS)
+        self.sync_method.setCurrentText(self.cfg.get('sync_method', 'auto'))
+        sync_row = QHBoxLayout()
+        sync_row.addWidget(QLabel("Sync include:")); sync_row.addWidget(self.sync_include)
+        sync_row.addWidget(QLabel("exclude:")); sync_row.addWidget(self.sync_exclude)
+        sync_row.addWidget(self.sync_newer); sync_row.addWidget(QLabel("Transfer:")); sync_row.addWidget(self.sync_method)
+
+        # matlab controls
+        self.remote_base_path = QLineEdit(self.cfg.get('remote_base_path', f"/home/{getpass.getuser()}"))
+        self.matlab_script_path = QLineEdit()
+        self.matlab_project_dir = QLineEdit(); self.matlab_project_dir.setPlaceholderText("project dir (default: script folder)")
+        btn_browse_m = QPushButton("Browse .m"); btn_browse_m.clicked.connect(self.browse_matlab_script)
+        self.matlab_use_gpu = QCheckBox("Use GPU")
+        self.matlab_cpus = QSpinBox(); self.matlab_cpus.setRange(1,128); self.matlab_cpus.setValue(4)
+        self.matlab_mem = QLineEdit("8G")
+        self.matlab_args = QLineEdit()
+        btn_submit = QPushButton("Submit MATLAB Job"); btn_submit.clicked.connect(self.submit_matlab_job)
+        self.submit_cluster = QtWidgets.QComboBox(); self.submit_cluster.addItems([SUBMIT_DEFAULT, SUBMIT_AUTO])
+        self.sweep_grid = QLineEdit(); self.sweep_grid.setPlaceholderText("alpha=0.1,0.2; beta=1:3   or   csv:/path/params.csv")
+        btn_sweep_csv = QPushButton("CSV…"); btn_sweep_csv.clicked.connect(self.browse_sweep_csv)
+        self.sweep_max_parallel = QSpinBox(); self.sweep_max_parallel.setRange(0, 10000); self.sweep_max_parallel.setSpecialValueText("unlimited")
+        self.sweep_pack = QSpinBox(); self.sweep_pack.setRange(0, PACK_MAX_WORKERS); self.sweep_pack.setSpecialValueText("off")
+        self.sweep_pack.setToolTip("Run the sweep's tasks in one allocation of this many single-core MATLAB workers\n"
+                                   "instead of an array job (Mem is per worker; needs the shared path)")
+        btn_submit_sweep = QPushButton("Submit sweep"); btn_submit_sweep.clicked.connect(self.submit_sweep)
+        sweep_row = QHBoxLayout()
+        sweep_row.addWidget(QLabel("Sweep:")); sweep_row.addWidget(self.sweep_grid); sweep_row.addWidget(btn_sweep_csv)
+        sweep_row.addWidget(QLabel("Max parallel:")); sweep_row.addWidget(self.sweep_max_parallel)
+        sweep_row.addWidget(QLabel("Pack workers:")); sweep_row.addWidget(self.sweep_pack); sweep_row.addWidget(btn_submit_sweep)
+
+        matlab_row = QHBoxLayout()
+        matlab_row.addWidget(QLabel("Remote base:")); matlab_row.addWidget(self.remote_base_path)
+        matlab_row.addWidget(QLabel("Script:")); matlab_row.addWidget(self.matlab_script_path); matlab_row.addWidget(btn_browse_m)
+        matlab_row.addWidget(self.matlab_project_dir)
+        matlab_row.addWidget(self.matlab_use_gpu); matlab_row.addWidget(QLabel("CPUs:")); matlab_row.addWidget(self.matlab_cpus)
+        matlab_row.addWidget(QLabel("Mem:")); matlab_row.addWidget(self.matlab_mem); matlab_row.addWidget(QLabel("Args:")); matlab_row.addWidget(self.matlab_args)
+        matlab_row.addWidget(QLabel("On:")); matlab_row.addWidget(self.submit_cluster); matlab_row.addWidget(btn_submit)
+
+        # chart
+        self.canvas = MplCanvas(self, width=9, height=3); self.canvas.ax.set_title("Power/Util/TFLOPS")
+        self.canvas.plot_line_power, = self.canvas.ax.plot([], [], label='Power (W)'); self.canvas.plot_line_util, = self.canvas.ax.plot([], [], label='Util (%)')
+        self.canvas.ax_flops = self.canvas.ax.twinx()    # TFLOPS are orders of magnitude below W and %
+        self.canvas.plot_line_flops, = self.canvas.ax_flops.plot([], [], color='tab:green', label='Est TFLOPS')
+        self.canvas.ax.xaxis.set_major_formatter(FuncFormatter(self._format_chart_time))
+        self.canvas.ax.legend(handles=[self.canvas.plot_line_power, self.canvas.plot_line_util, self.canvas.plot_line_flops], loc='upper left')
+        self.canvas.set_animated_artists([self.canvas.plot_line_power, self.canvas.plot_line_util, self.canvas.plot_line_flops])
+        self.chart_range = QtWidgets.QComboBox(); self.chart_range.addItems([name for name, _ in CHART_RANGES])
+        self.chart_range.currentIndexChanged.connect(lambda _: self._update_chart())
+        chart_row = QHBoxLayout(); chart_row.addWidget(QLabel("Chart range:")); chart_row.addWidget(self.chart_range); chart_row.addStretch(1)
+
+        # advanced job editor + log
+        self.job_editor = QTextEdit()
+        self.job_editor.setPlainText("# advanced sbatch editor")
+        self.log = QPlainTextEdit(); self.log.setReadOnly(True); self.log.setMaximumBlockCount(LOG_MAX_BLOCKS)
+        self.node_table = self._make_table(NODE_TABLE_COLUMNS); self.queue_table = self._make_table(QUEUE_TABLE_COLUMNS)
+        self.cluster_summary = QLabel("")
+        self.tabs = QTabWidget()
+        self.pack_table = self._make_table(PACK_TABLE_COLUMNS)
+        self.pack_table.cellDoubleClicked.connect(lambda row, _: self.show_job(self.pack_table.item(row, 1).text()))
+        self.tabs.addTab(self.log, "Log"); self.tabs.addTab(self.node_table, "Nodes"); self.tabs.addTab(self.queue_table, "Queue")
+        self.tabs.addTab(self.pack_table, "Packs")
+        self.output_job = QtWidgets.QComboBox(); self.output_job.currentTextChanged.connect(self._show_job_output)
+        self.output_view = QPlainTextEdit(); self.output_view.setReadOnly(True); self.output_view.setMaximumBlockCount(LOG_MAX_BLOCKS)
+        output_tab = QWidget(); output_layout = QVBoxLayout(output_tab)
+        output_row = QHBoxLayout(); output_row.addWidget(QLabel("Job:")); output_row.addWidget(self.output_job); output_row.addStretch(1)
+        output_layout.addLayout(output_row); output_layout.addWidget(self.output_view)
+        self.tabs.addTab(output_tab, "Job output")
+
+        # assemble
+        layout = QVBoxLayout()
+        layout.addLayout(row1); layout.addLayout(btn_row); layout.addLayout(shared_row); layout.addLayout(sync_row); layout.addLayout(matlab_row); layout.addLayout(sweep_row)
+        layout.addLayout(chart_row); layout.addWidget(self.canvas); layout.addWidget(QLabel("Advanced job script editor:")); layout.addWidget(self.job_editor)
+        layout.addWidget(self.cluster_summary); layout.addWidget(self.tabs)
+        self.setLayout(layout)
+
+    # ---------- UI helpers ----------
+    def browse_key(self):
+        p,_ = QFileDialog.getOpenFileName(self, "Select private key", str(Path.home()))
+        if p: self.key_edit.setText(p)
+
+    def browse_matlab_script(self):
+        p,_ = QFileDialog.getOpenFileName(self, "Select MATLAB script", str(Path.home()), "MATLAB Files (*.m)")
+        if p: self.matlab_script_path.setText(p)
+
+    def _load_profile(self):
+        prof = next((p for p in cluster_profiles(self.cfg) if p['name'] == self.profile_combo.currentText()), None)
+        if not prof: return
+        self.host_edit.setText(prof.get('host') or ''); self.user_edit.setText(prof.get('user') or '')
+        self.key_edit.setText(prof.get('key_path') or '')
+        if prof.get('shared_path'): self.shared_path_edit.setText(prof['shared_path'])
+        if prof.get('remote_base_path'): self.remote_base_path.setText(prof['remote_base_path'])
+
+    def _op_cluster(self):
+        """Cluster for single-cluster actions: the selected profile when it is connected."""
+        name = self.profile_combo.currentText().strip()
+        return name if name in self.connected else None
+
+    def append_log(self, text, cluster=None):
+        """Thread-safe: queue a log line; the GUI thread appends queued lines in batches."""
+        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if cluster and len(self.connected) > 1: text = f"{cluster}: {text}"
+        lines = str(text).splitlines() or ['']
+        if len(lines) > LOG_MAX_ENTRY_LINES:
+            text = '\n'.join(lines[:LOG_MAX_ENTRY_LINES] + [f"... ({len(lines) - LOG_MAX_ENTRY_LINES} more lines)"])
+        if len(self._log_queue) == self._log_queue.maxlen: self._log_dropped += 1
+        self._log_queue.append(f"[{ts}] {text}")
+
+    def _flush_log(self):
+        if not self._log_queue: return
+        batch = []; n = 0
+        if self._log_dropped:
+            batch.append(f"... {self._log_dropped} log entries dropped"); self._log_dropped = 0
+        while self._log_queue and n < LOG_MAX_LINES_PER_FLUSH:
+            entry = self._log_queue.popleft(); batch.append(entry); n += entry.count('\n') + 1
+        self.log.appendPlainText('\n'.join(batch))
+
+    def _ask_passphrase(self):
+        # called from the connect task; the dialog itself must run on the GUI thread
+        if QtCore.QThread.currentThread() is self.thread(): self._prompt_passphrase()
+        else: self._passphrase_requested.emit()
+        return self._passphrase_reply
+
+    def _prompt_passphrase(self):
+        pw, ok = QInputDialog.getText(self, 'SSH passphrase', 'Enter passphrase:', QLineEdit.Password)
+        self._passphrase_reply = pw if ok else None
+
+    def _require_connection(self):
+        if not self.connected: QMessageBox.warning(self, "Not connected", "Connect first")
+        return bool(self.connected)
+
+    # ---------- background tasks ----------
+    def _run_task(self, name, fn, on_done=None, on_error=None, progress=False):
+        """Run fn(task) off the GUI thread. on_done(result) / on_error(message) are called back on the GUI thread."""
+        def finished(result):
+            self._task_state_changed()
+            if on_done: on_done(result)
+        def failed(msg):
+            self._task_state_changed(); self.append_log(msg)
+            if on_error: on_error(msg)
+        task = self.tasks.submit(name, fn, on_done=finished, on_error=failed, on_progress=self._task_progress if progress else None)
+        self._task_state_changed(name)
+        return task
+
+    def _task_state_changed(self, started=None):
+        # done/error callbacks run before the executor drops the finished task
+        active = self.tasks.active() - (0 if started else 1)
+        self.task_label.setText(f"{started}…" if started else (f"{active} task(s) running" if active > 0 else ""))
+        if active <= 0: self.task_progress.setVisible(False)
+
+    def _task_progress(self, done, total, message):
+        self.task_progress.setVisible(True)
+        self.task_progress.setValue(int(1000 * done / total) if total else 0)
+        if message: self.task_label.setText(message)
+
+    def cancel_tasks(self):
+        n = self.tasks.active(); self.tasks.cancel_all()
+        threading.Thread(target=self.client.cancel, daemon=True).start()     # stop the engine side as well
+        if n: self.append_log(f"Cancelling {n} task(s)")
+
+    # ---------- engine events ----------
+    def _attach(self):
+        """Current engine state, so a GUI attaching to a running daemon starts complete."""
+        return self.client.status(), self.client.cluster()
+
+    def _attached(self, state):
+        status, cluster = state
+        self.connected = set(status['clusters'])
+        for name, c in status['clusters'].items():
+            self.append_log(f"Attached to engine connected to {c['user']}@{c['host']} ({name})"); self._cluster_connected(name)
+        diff = {kind: (dict(self._record_key(kind, r) for r in cluster[kind]), []) for kind in CLUSTER_RECORDS}
+        self._apply_cluster_diff(diff)
+        threading.Thread(target=self._event_loop, args=(status['seq'],), name='engine-events', daemon=True).start()
+
+    @staticmethod
+    def _record_key(kind, rec):
+        rec = CLUSTER_RECORDS[kind](*rec)
+        return f"{rec.cluster}/{rec.jobid if kind == 'jobs' else rec.name}", rec
+
+    def _event_loop(self, since):
+        while not self._closing:
+            try: batch = self.client.events(since=since, timeout=EVENT_POLL_TIMEOUT)
+            except Exception:
+                time.sleep(1.0); continue
+            if batch['events'] and not self._closing: self.engine_events.emit(batch['events'])
+            since = batch['seq']
+
+    def _on_engine_events(self, events):
+        telemetry = False
+        for ev in events:
+            kind = ev['type']
+            if kind == 'log': self.append_log(ev['text'], ev.get('cluster'))
+            elif kind == 'connected':
+                self.connected.add(ev['cluster']); self._cluster_connected(ev['cluster']); self._check_remote_gpu_availability(ev['cluster'])
+            elif kind == 'disconnected':
+                self.connected.discard(ev['cluster']); self._cluster_connected(ev['cluster'], False)
+            elif kind == 'job_output': self._append_job_output(ev['jobid'], ev['text'])
+            elif kind == 'pack': self._update_table(self.pack_table, {f"{ev['cluster']}/{ev['jobid']}": ev}, (), _pack_row)
+            elif kind == 'cluster':
+                prefix = f"{ev['cluster']}/"
+                self._apply_cluster_diff({k: (dict(self._record_key(k, r) for r in changed.values()), [prefix + key for key in removed])
+                                          for k, (changed, removed) in ev['diff'].items()})
+            elif kind == 'telemetry':
+                self.power_history.append(ev['ts_sample'], _nan(ev['power']), _nan(ev['util']), _nan(ev['tflops']))
+                self._node_util = ev['nodes']; telemetry = True
+            elif kind == 'progress' and self.tasks.active():
+                self._task_progress(ev['done'], ev['total'], f"{ev['done']/1e6:.1f}/{ev['total']/1e6:.1f} MB")
+        if telemetry:
+            self._update_chart(); self._update_node_util()
+
+    # ---------- connection ----------
+    def _cluster_connected(self, name, connected=True):
+        """Keep the submit target list in step with the connected clusters."""
+        i = self.submit_cluster.findText(name)
+        if connected and i < 0: self.submit_cluster.addItem(name)
+        elif not connected and i >= 0: self.submit_cluster.removeItem(i)
+        if connected and self.profile_combo.findText(name) < 0: self.profile_combo.addItem(name)
+
+    def _connect(self, **kw):
+        """client.connect(**kw) from a task, asking for the key passphrase when needed."""
+        try: return self.client.connect(**kw)
+        except EngineError as e:
+            if e.kind != 'passphrase_required': raise
+            pw = self._ask_passphrase()
+            if pw is None: raise EngineError('Passphrase canceled')
+            return self.client.connect(passphrase=pw, **kw)
+
+    def connect_clicked(self):
+        host = self.host_edit.text().strip(); user = self.user_edit.text().strip(); key = self.key_edit.text().strip() or None
+        name = self.profile_combo.currentText().strip() or None
+        if not host or not user:
+            QMessageBox.warning(self, "Missing", "Enter host and user"); return
+        update_config(self.cfg, use_agent=self.use_agent.isChecked())
+        kw = dict(cluster=name, host=host, user=user, key_path=key, use_agent=self.use_agent.isChecked())
+        self._run_task("Connect", lambda t: self._connect(**kw), on_error=lambda msg: QMessageBox.critical(self, "SSH", msg))
+
+    def connect_all_clicked(self):
+        """Connect every saved profile; profiles with encrypted keys ask for their passphrase."""
+        update_config(self.cfg, use_agent=self.use_agent.isChecked())
+        def work(task):
+            for name, err in self.client.connect_all(use_agent=self.use_agent.isChecked()).items():
+                if err and err['kind'] == 'passphrase_required':
+                    try: self._connect(cluster=name, use_agent=self.use_agent.isChecked())
+                    except EngineError as e: self.append_log(f"{name}: {e}")
+                elif err: self.append_log(f"Connecting {name} failed: {err['error']}")
+        self._run_task("Connect all", work)
+
+    def disconnect_clicked(self):
+        self.append_log("Disconnecting..."); self.tasks.cancel_all()
+        self._run_task("Disconnect", lambda t: self.client.disconnect())
+
+    def run_command_and_append(self, cmd):
+        if not self._require_connection(): return
+        def work(task):
+            res = self.client.command(cmd=cmd, cluster=self._op_cluster())
+            if res['out']: self.append_log(res['out'])
+            if res['err']: self.append_log("ERR: "+res['err'])
+        self._run_task(cmd, work)
+
+    # ---------- SHARED FOLDER helpers ----------
+    def ensure_shared_folder(self):
+        """Create remote shared path and subfolders (inputs/outputs/tmp/locks)."""
+        if not self._require_connection(): return
+        remote = self.shared_path_edit.text().strip()
+        if not remote:
+            QMessageBox.warning(self, "Missing", "Enter shared remote path"); return
+        self._run_task("ensure_shared_folder", lambda t: self.client.ensure_shared(remote=remote, cluster=self._op_cluster()))
+
+    def fetch_shared_results(self):
+        """Download new/changed files from remote shared outputs/ into the local result cache"""
+        self._sync_shared_outputs(recursive=False)
+
+    def sync_outputs_from_remote(self):
+        """Incremental mirror of the whole remote outputs/ tree (subfolders included)."""
+        self._sync_shared_outputs(recursive=True)
+
+    def _sync_shared_outputs(self, recursive):
+        if not self._require_connection(): return
+        remote = self.shared_path_edit.text().strip()
+        if not remote:
+            QMessageBox.warning(self, "Missing", "Enter shared remote path"); return
+        opts = dict(use_checksum=self.sync_checksum.isChecked(), include=self.sync_include.text().split(),
+                    exclude=self.sync_exclude.text().split(), method=self.sync_method.currentText(),
+                    since_last=self.sync_newer.isChecked())
+        update_config(self.cfg, sync_checksum=opts['use_checksum'], sync_include=self.sync_include.text().strip(),
+                      sync_exclude=self.sync_exclude.text().strip(), sync_newer=opts['since_last'], sync_method=opts['method'])
+        self._run_task(f"Sync {remote}/outputs", lambda t: self.client.sync(remote=remote, recursive=recursive, cluster=self._op_cluster(), **opts))
+
+    # ---------- MATLAB job submission ----------
+    def _submit_params(self):
+        local_m = self.matlab_script_path.text().strip()
+        if not local_m or not Path(local_m).is_file():
+            QMessageBox.warning(self,"Missing script","Select a local .m file"); return None
+        return dict(script=local_m, remote_base=self.remote_base_path.text().strip() or None, cpus=int(self.matlab_cpus.value()),
+                    mem=self.matlab_mem.text().strip() or "8G", use_gpu=bool(self.matlab_use_gpu.isChecked()),
+                    project_dir=self.matlab_project_dir.text().strip(), shared=self.shared_path_edit.text().strip(),
+                    cluster={SUBMIT_DEFAULT: self._op_cluster(), SUBMIT_AUTO: 'auto'}.get(self.submit_cluster.currentText(),
+                                                                                           self.submit_cluster.currentText()))
+
+    def submit_matlab_job(self):
+        if not self._require_connection(): return
+        params = self._submit_params()
+        if not params: return
+        params['args'] = self.matlab_args.text().strip()
+        self._run_task(f"Submit {os.path.basename(params['script'])}", lambda task: self.client.submit(**params))
+
+    # ---------- parameter sweep submission ----------
+    def browse_sweep_csv(self):
+        p,_ = QFileDialog.getOpenFileName(self, "Select parameter CSV", str(Path.home()), "CSV Files (*.csv);;All Files (*)")
+        if p: self.sweep_grid.setText(f"csv:{p}")
+
+    def submit_sweep(self):
+        """Submit one Slurm array job covering every point of the sweep grid / CSV, or with
+        pack workers set, one allocation running all of them."""
+        if not self._require_connection(): return
+        params = self._submit_params()
+        if not params: return
+        spec = self.sweep_grid.text().strip()
+        if spec.startswith('csv:'): params['csv_path'] = spec[4:]
+        else: params['grid'] = spec
+        if self.sweep_pack.value():
+            params.pop('cpus'); params.pop('use_gpu'); params['workers'] = int(self.sweep_pack.value())
+            def packed(res):
+                key = f"{res['cluster']}/{res['jobid']}"
+                if key in self._table_rows.get(id(self.pack_table), {}): return      # progress already arrived
+                self._update_table(self.pack_table, {key: dict(res, counts={'QUEUED': res['tasks']}, total=res['tasks'])}, (), _pack_row)
+            self._run_task(f"Pack {os.path.basename(params['script'])}", lambda task: self.client.submit_pack(**params), on_done=packed,
+                           on_error=lambda msg: QMessageBox.warning(self, "Sweep", msg))
+            return
+        params['max_parallel'] = int(self.sweep_max_parallel.value())
+        self._run_task(f"Sweep {os.path.basename(params['script'])}", lambda task: self.client.submit_sweep(**params),
+                       on_error=lambda msg: QMessageBox.warning(self, "Sweep", msg))
+
+    # ---------- job output view ----------
+    def _append_job_output(self, jobid, text):
+        if self.output_job.findText(jobid) < 0:
+            self.output_job.addItem(jobid)
+            if self.output_job.count() == 1: return    # selecting it already loaded the local tail
+        if self.output_job.currentText() == jobid:
+            cursor = self.output_view.textCursor(); cursor.movePosition(cursor.End)
+            cursor.insertText(text); self.output_view.ensureCursorVisible()
+
+    def _show_job_output(self, jobid):
+        if not jobid: self.output_view.clear(); return
+        def loaded(text):
+            if self.output_job.currentText() != jobid: return
+            self.output_view.setPlainText(text); self.output_view.moveCursor(self.output_view.textCursor().End)
+        self._run_task("Load output", lambda t: self.client.job_output(jobid=jobid), on_done=loaded)
+
+    # ---------- chart ----------
+    def _format_chart_time(self, x, pos=None):
+        span = self._chart_span or 0
+        return datetime.fromtimestamp(x).strftime("%m-%d %H:%M" if span > 86400 else "%H:%M:%S" if not span else "%H:%M")
+
+    def _update_chart(self):
+        span = self._chart_span = CHART_RANGES[self.chart_range.currentIndex()][1]
+        live = self.power_history.snapshot(); now = time.time()
+        if span is None:
+            data = live
+            if not len(data): return
+            width = max(data[-1, 0] - data[0, 0], POLL_INTERVAL * 10)
+            cur = self.canvas.ax.get_xlim()
+            # keep the limits (and thus blitting) until the newest sample runs off the right edge
+            if cur[0] <= data[0, 0] and data[-1, 0] <= cur[1] and cur[1] - cur[0] <= width * 1.5: xlim = tuple(cur)
+            else: xlim = (data[0, 0], data[0, 0] + width * 1.2)
+        else:
+            loaded_at, hist = self._chart_history.get(span, (0.0, None))
+            if hist is None or now - loaded_at > CHART_HISTORY_TTL:
+                self._load_chart_history(span)
+                if hist is None: return
+            newer = live[live[:, 0] > hist[-1, 0]] if len(hist) else live
+            data = np.concatenate((hist, newer)) if len(newer) else hist
+            xlim = (now - span, now)
+            if not len(data): return
+        c = self.canvas
+        c.plot_series(data[:, 0], {c.plot_line_power: data[:, 1], c.plot_line_util: data[:, 2], c.plot_line_flops: data[:, 3]}, xlim)
+
+    def _load_chart_history(self, span):
+        """Fetch one historic range from power_history off the GUI thread, then redraw."""
+        if getattr(self, '_chart_loading', None) == span: return
+        self._chart_loading = span
+        def loaded(arr):
+            self._chart_loading = None; self._chart_history[span] = (time.time(), arr); self._update_chart()
+        self._run_task("Load chart history", lambda t: power_rows_to_arrays(self.client.power_range(seconds=span)), on_done=loaded)
+
+    def _update_node_util(self):
+        rows = self._table_rows.get(id(self.node_table), {}); col = NODE_TABLE_COLUMNS.index("Util %")
+        for cluster, nodes in self._node_util.items():
+            for name, util in nodes.items():
+                key = f"{cluster}/{name}"
+                if key in rows and util is not None: self.node_table.setItem(rows[key], col, QTableWidgetItem(f"{util:.0f}"))
+
+    # ---------- cluster tables ----------
+    def _make_table(self, columns):
+        t = QTableWidget(0, len(columns)); t.setHorizontalHeaderLabels(columns)
+        t.setEditTriggers(QTableWidget.NoEditTriggers); t.verticalHeader().setVisible(False)
+        t.horizontalHeader().setStretchLastSection(True)
+        return t
+
+    def _update_table(self, table, changed, removed, row_fn):
+        """Touch only the rows that changed; removed rows are deleted bottom-up."""
+        index = self._table_rows.setdefault(id(table), {})
+        table.setUpdatesEnabled(False)
+        try:
+            for row in sorted((index.pop(k) for k in removed if k in index), reverse=True):
+                table.removeRow(row)
+                for k, r in index.items():
+                    if r > row: index[k] = r - 1
+            for key, rec in changed.items():
+                row = index.get(key)
+                if row is None:
+                    row = index[key] = table.rowCount(); table.insertRow(row)
+                for col, val in enumerate(row_fn(rec)):
+                    item = table.item(row, col)
+                    if item is None: table.setItem(row, col, QTableWidgetItem(val))
+                    elif item.text() != val: item.setText(val)
+        finally:
+            table.setUpdatesEnabled(True)
+
+    def _apply_cluster_diff(self, diff):
+        for kind, (changed, removed) in diff.items():
+            view = self.cluster[kind]; view.update(changed)
+            for key in removed: view.pop(key, None)
+        changed, removed = diff['nodes']
+        for key, rec in changed.items():
+            prev = self._node_states.get(key)
+            if prev and prev != rec.state: self.append_log(f"Node {rec.name}: {prev} -> {rec.state}", rec.cluster)
+            self._node_states[key] = rec.state
+        for key in removed: self._node_states.pop(key, None)
+        self._update_table(self.node_table, changed, removed, _node_row)
+        self._update_table(self.queue_table, *diff['jobs'], _queue_row)
+        jobs = self.cluster['jobs']; parts = self.cluster['partitions']
+        if not self.cluster['nodes']: return
+        running = sum(1 for j in jobs.values() if j.state == 'RUNNING'); pending = sum(1 for j in jobs.values() if j.state == 'PENDING')
+        several = len({p.cluster for p in parts.values()}) > 1
+        cpus = ', '.join(f"{p.cluster + '/' if several else ''}{p.name}: {p.cpus_idle}/{p.cpus_total} CPUs free" for p in parts.values())
+        self.cluster_summary.setText(f"{len(self.cluster['nodes'])} nodes — {cpus} — {running} running, {pending} pending")
+
+    def _check_remote_gpu_availability(self, cluster=None):
+        def apply(found):
+            if found:
+                self.append_log("nvidia-smi found; GPU enabled"); self.matlab_use_gpu.setEnabled(True); return
+            self.append_log("nvidia-smi not found; GPU disabled" if found is False else "nvidia-smi check failed")
+            self.matlab_use_gpu.setEnabled(False); self.matlab_use_gpu.setChecked(False)
+        self._run_task("GPU check", lambda t: self.client.check_gpu(cluster=cluster), on_done=apply)
+
+    # ---------- job history UI ----------
+    def show_job_history(self):
+        """Open (or raise) the job history browser; accounting of newly finished jobs is fetched on the way."""
+        if self._history is None: self._history = JobHistoryDialog(self)
+        self._history.show(); self._history.raise_()
+        self._history.apply(); self._history.fetch_accounting()
+
+    def show_diagnostics(self):
+        if self._diagnostics is None: self._diagnostics = DiagnosticsDialog(self)
+        self._diagnostics.show(); self._diagnostics.raise_()
+
+    def show_job(self, jobid):
+        """Show a job's output in the Job output tab."""
+        if not jobid: return
+        if self.output_job.findText(jobid) < 0: self.output_job.addItem(jobid)
+        self.output_job.setCurrentText(jobid); self.tabs.setCurrentIndex(self.tabs.count() - 1)
+
+    def closeEvent(self, event):
+        self._closing = True
+        super().closeEvent(event)
+
+# ---------- run ----------
+def run_gui(client):
+    """Show the dashboard on top of client (ApiClient or LocalClient) until the window closes."""
+    app = QApplication.instance() or QApplication(sys.argv)
+    dash = HPCDashboard(client); dash.show()
+    rc = app.exec_()
+    dash._closing = True
+    client.close()
+    return rc
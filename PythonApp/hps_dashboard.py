@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """
-hpc_dashboard_matlab_slurm_shared.py
+hps_dashboard.py
 
 Enhanced HPC Dashboard for macOS with:
 - SSH agent & GUI passphrase for encrypted private keys
@@ -8,517 +8,328 @@ Enhanced HPC Dashboard for macOS with:
 - Job history (SQLite: ~/.hpc_dashboard.db) and job-watcher
 - Shared-folder helpers (NFS guidance + SFTP fallback sync)
 - Power history and GPU detection
+- Headless CLI and daemon with a local JSON API (hpc_daemon.py)
+
+Commands (hps_dashboard.py):
+    gui                     Qt dashboard (default)
+    daemon                  headless engine serving the local JSON API
+    submit SCRIPT.m         submit a job; --sweep / --sweep-csv submit an array job,
+                            with --pack N the sweep's tasks run in N MATLAB workers of one allocation
+    pack JOBID              task progress of a packed job (--status FAILED NOT_RUN lists only those tasks)
+    status                  job history from the local database (--refresh asks Slurm first)
+    history                 searchable job history with elapsed time, MaxRSS and CPU efficiency
+    sync [SHARED]           mirror <shared>/outputs into the local result cache
+    results [JOBID]         files in the result cache (--pin/--unpin keeps a job's results, or --path's, from eviction)
+    watch [JOBID ...]       follow job states (and output) until the jobs finish
+    profiles [add|remove NAME]  list or edit the cluster profiles
+    metrics                 latency percentiles and counters of a running daemon
+                            (--prometheus for the text format, --profile start|stop|report)
+--cluster NAME picks a profile (submit also takes `auto`: the least loaded); without
+it commands use the default cluster, or connect every profile when there are several.
+Commands go through the daemon when one is running (see --api) and use an
+in-process engine otherwise. Qt and matplotlib are only imported for `gui`.
 
 Dependencies:
-    pip install pyqt5 paramiko matplotlib
+    pip install paramiko numpy            # CLI / daemon
+    pip install pyqt5 matplotlib          # GUI
 Run:
-    python3 hpc_dashboard_matlab_slurm_shared.py
+    python3 hps_dashboard.py [command] [options]
 """
 from __future__ import annotations
-import sys, os, json, time, re, sqlite3
+import sys, json, getpass, argparse
 from datetime import datetime
-from pathlib import Path
-import threading
 
-import paramiko
-from paramiko.agent import Agent
-from paramiko.ssh_exception import PasswordRequiredException
-from PyQt5 import QtWidgets, QtCore
-from PyQt5.QtWidgets import (
-    QApplication, QWidget, QLabel, QLineEdit, QPushButton, QTextEdit,
-    QHBoxLayout, QVBoxLayout, QFileDialog, QMessageBox, QPlainTextEdit,
-    QInputDialog, QCheckBox, QSpinBox
-)
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from matplotlib.figure import Figure
-
-# ---------------- constants ----------------
-POLL_INTERVAL = 8.0
-JOB_WATCH_INTERVAL = 10.0
-DB_PATH = Path.home() / '.hpc_dashboard.db'
-CONFIG_PATH = Path.home() / '.hpc_dashboard_conf.json'
-LOCAL_JOB_OUTPUT_DIR = Path.cwd() / 'hpc_job_outputs'
-LOCAL_JOB_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-# ---------- DB helpers ----------
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS jobs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            jobid TEXT,
-            remote_sbatch TEXT,
-            remote_out TEXT,
-            submitted_at TEXT,
-            status TEXT,
-            sbatch_output TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS power_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ts TEXT,
-            power REAL,
-            util REAL,
-            est_flops REAL
-        )
-    ''')
-    conn.commit(); conn.close()
-
-def insert_job_record(jobid, remote_sbatch, remote_out, sbatch_output, status='SUBMITTED'):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('INSERT INTO jobs (jobid, remote_sbatch, remote_out, submitted_at, status, sbatch_output) VALUES (?, ?, ?, ?, ?, ?)',
-              (str(jobid), remote_sbatch, remote_out, datetime.utcnow().isoformat(), status, sbatch_output))
-    conn.commit(); conn.close()
-
-def update_job_status(jobid, new_status):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('UPDATE jobs SET status=? WHERE jobid=?', (new_status, str(jobid)))
-    conn.commit(); conn.close()
-
-def list_jobs(limit=100):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('SELECT jobid, remote_sbatch, remote_out, submitted_at, status FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
-    rows = c.fetchall(); conn.close(); return rows
-
-def insert_power(ts, power, util, est_flops=None):
-    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-    c.execute('INSERT INTO power_history (ts, power, util, est_flops) VALUES (?, ?, ?, ?)', (ts.isoformat(), power, util, est_flops))
-    conn.commit(); conn.close()
-
-# ---------- config ----------
-def load_config():
-    if CONFIG_PATH.exists():
-        try: return json.loads(CONFIG_PATH.read_text())
-        except: return {}
-    return {}
-
-def save_config(cfg):
-    try: CONFIG_PATH.write_text(json.dumps(cfg, indent=2))
-    except: pass
-
-# ---------- SSH helper ----------
-class SSHClientEnhanced:
-    def __init__(self, hostname, username, key_path=None, password=None, port=22, passphrase_callback=None):
-        self.hostname = hostname; self.username = username; self.key_path = key_path
-        self.password = password; self.port = port; self.passphrase_callback = passphrase_callback
-        self.client = None; self.sftp = None
-
-    def _load_private_key(self, path):
-        last_exc = None
-        for KeyClass in (paramiko.Ed25519Key, paramiko.RSAKey, paramiko.ECDSAKey, paramiko.DSSKey):
-            try:
-                return KeyClass.from_private_key_file(path)
-            except PasswordRequiredException as e:
-                last_exc = e
-                if self.passphrase_callback:
-                    pw = self.passphrase_callback()
-                    if pw is None: raise RuntimeError('Passphrase canceled')
-                    try: return KeyClass.from_private_key_file(path, password=pw)
-                    except Exception as e2: last_exc = e2; continue
-                else: raise
-            except Exception as e:
-                last_exc = e; continue
-        if last_exc: raise last_exc
-        return None
-
-    def connect(self, timeout=12):
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        pkey = None
-        if self.key_path:
-            pkey = self._load_private_key(self.key_path)
-        try:
-            if pkey: self.client.connect(self.hostname, port=self.port, username=self.username, pkey=pkey, timeout=timeout)
-            elif self.password: self.client.connect(self.hostname, port=self.port, username=self.username, password=self.password, timeout=timeout)
-            else:
-                try:
-                    agent = Agent(); keys = agent.get_keys()
-                    if keys:
-                        connected=False; last_exc=None
-                        for k in keys:
-                            try:
-                                self.client.connect(self.hostname, port=self.port, username=self.username, pkey=k, timeout=timeout)
-                                connected=True; break
-                            except Exception as e: last_exc=e
-                        if not connected:
-                            self.client.connect(self.hostname, port=self.port, username=self.username, timeout=timeout)
-                    else:
-                        self.client.connect(self.hostname, port=self.port, username=self.username, timeout=timeout)
-                except Exception:
-                    self.client.connect(self.hostname, port=self.port, username=self.username, timeout=timeout)
-            self.sftp = self.client.open_sftp()
-        except Exception as e:
-            raise RuntimeError(f"SSH connect failed: {e}")
-
-    def exec(self, cmd, timeout=20):
-        if self.client is None: raise RuntimeError("Not connected")
-        stdin, stdout, stderr = self.client.exec_command(cmd, timeout=timeout)
-        return stdout.read().decode('utf-8', errors='ignore').strip(), stderr.read().decode('utf-8', errors='ignore').strip()
-
-    def put(self, local_path, remote_path):
-        if self.sftp is None: raise RuntimeError("SFTP not connected")
-        self.sftp.put(local_path, remote_path)
-
-    def get(self, remote_path, local_path):
-        if self.sftp is None: raise RuntimeError("SFTP not connected")
-        self.sftp.get(remote_path, local_path)
-
-    def listdir(self, remote_path):
-        if self.sftp is None: raise RuntimeError("SFTP not connected")
-        try: return self.sftp.listdir(remote_path)
-        except Exception: return []
-
-    def mkdir(self, remote_path):
-        if self.sftp is None: raise RuntimeError("SFTP not connected")
-        try: self.sftp.mkdir(remote_path)
-        except Exception: pass
-
-    def close(self):
-        try: 
-            if self.sftp: self.sftp.close()
-        except: pass
-        try:
-            if self.client: self.client.close()
-        except: pass
-        self.client=None; self.sftp=None
-
-# ---------- plotting ----------
-class MplCanvas(FigureCanvas):
-    def __init__(self, parent=None, width=6, height=2.5, dpi=100):
-        fig = Figure(figsize=(width,height), dpi=dpi)
-        self.ax = fig.add_subplot(111)
-        super().__init__(fig)
-        fig.tight_layout()
-
-# ---------- main GUI ----------
-class HPCDashboard(QWidget):
-    def __init__(self):
-        super().__init__()
-        init_db()
-        self.cfg = load_config()
-        self.ssh = None
-        self.polling=False
-        self.poll_thread=None
-        self.job_watcher_thread=None
-        self.power_history=[]
-        self.max_history=300
-        self._build_ui()
-
-    def _build_ui(self):
-        self.setWindowTitle("HPC Dashboard — MATLAB + SLURM + Shared")
-        self.resize(1150,780)
-
-        # connection row
-        self.host_edit = QLineEdit(self.cfg.get('host',''))
-        self.user_edit = QLineEdit(self.cfg.get('user',''))
-        self.key_edit = QLineEdit(self.cfg.get('key_path',''))
-        btn_browse_key = QPushButton("Browse")
-        btn_browse_key.clicked.connect(self.browse_key)
-        btn_connect = QPushButton("Connect"); btn_connect.clicked.connect(self.connect_clicked)
-        btn_disconnect = QPushButton("Disconnect"); btn_disconnect.clicked.connect(self.disconnect_clicked)
-
-        row1 = QHBoxLayout()
-        row1.addWidget(QLabel("Host:")); row1.addWidget(self.host_edit)
-        row1.addWidget(QLabel("User:")); row1.addWidget(self.user_edit)
-        row1.addWidget(QLabel("Key:")); row1.addWidget(self.key_edit)
-        row1.addWidget(btn_browse_key); row1.addWidget(btn_connect); row1.addWidget(btn_disconnect)
-
-        # quick actions
-        btn_sinfo=QPushButton("sinfo -Nel"); btn_sinfo.clicked.connect(lambda: self.run_command_and_append("sinfo -Nel"))
-        btn_squeue=QPushButton("squeue -u $USER"); btn_squeue.clicked.connect(lambda: self.run_command_and_append("squeue -u $USER"))
-        btn_refresh=QPushButton("Refresh"); btn_refresh.clicked.connect(self.poll_once)
-        btn_row = QHBoxLayout(); btn_row.addWidget(btn_sinfo); btn_row.addWidget(btn_squeue); btn_row.addWidget(btn_refresh)
-
-        # shared folder controls
-        self.shared_path_edit = QLineEdit(self.cfg.get('shared_path','/srv/hpc/shared'))
-        btn_ensure_shared = QPushButton("Ensure shared folder"); btn_ensure_shared.clicked.connect(self.ensure_shared_folder)
-        btn_fetch_shared = QPushButton("Fetch shared results"); btn_fetch_shared.clicked.connect(self.fetch_shared_results)
-        btn_sync_remote = QPushButton("Sync outputs from remote"); btn_sync_remote.clicked.connect(self.sync_outputs_from_remote)
-        shared_row = QHBoxLayout()
-        shared_row.addWidget(QLabel("Shared (remote):")); shared_row.addWidget(self.shared_path_edit)
-        shared_row.addWidget(btn_ensure_shared); shared_row.addWidget(btn_fetch_shared); shared_row.addWidget(btn_sync_remote)
-
-        # matlab controls
-        self.remote_base_path = QLineEdit(self.cfg.get('remote_base_path', f"/home/{os.getlogin()}"))
-        self.matlab_script_path = QLineEdit()
-        btn_browse_m = QPushButton("Browse .m"); btn_browse_m.clicked.connect(self.browse_matlab_script)
-        self.matlab_use_gpu = QCheckBox("Use GPU")
-        self.matlab_cpus = QSpinBox(); self.matlab_cpus.setRange(1,128); self.matlab_cpus.setValue(4)
-        self.matlab_mem = QLineEdit("8G")
-        self.matlab_args = QLineEdit()
-        btn_submit = QPushButton("Submit MATLAB Job"); btn_submit.clicked.connect(self.submit_matlab_job)
-
-        matlab_row = QHBoxLayout()
-        matlab_row.addWidget(QLabel("Remote base:")); matlab_row.addWidget(self.remote_base_path)
-        matlab_row.addWidget(QLabel("Script:")); matlab_row.addWidget(self.matlab_script_path); matlab_row.addWidget(btn_browse_m)
-        matlab_row.addWidget(self.matlab_use_gpu); matlab_row.addWidget(QLabel("CPUs:")); matlab_row.addWidget(self.matlab_cpus)
-        matlab_row.addWidget(QLabel("Mem:")); matlab_row.addWidget(self.matlab_mem); matlab_row.addWidget(QLabel("Args:")); matlab_row.addWidget(self.matlab_args)
-        matlab_row.addWidget(btn_submit)
-
-        # chart
-        self.canvas = MplCanvas(self, width=9, height=3); self.canvas.ax.set_title("Power/Util/TFLOPS")
-        self.canvas.plot_line_power, = self.canvas.ax.plot([], [], label='Power'); self.canvas.plot_line_util, = self.canvas.ax.plot([], [], label='Util')
-        self.canvas.plot_line_flops, = self.canvas.ax.plot([], [], label='Est TFLOPS'); self.canvas.ax.legend()
-
-        # advanced job editor + log
-        self.job_editor = QTextEdit()
-        self.job_editor.setPlainText("# advanced sbatch editor")
-        self.log = QPlainTextEdit(); self.log.setReadOnly(True)
-
-        # assemble
-        layout = QVBoxLayout()
-        layout.addLayout(row1); layout.addLayout(btn_row); layout.addLayout(shared_row); layout.addLayout(matlab_row)
-        layout.addWidget(self.canvas); layout.addWidget(QLabel("Advanced job script editor:")); layout.addWidget(self.job_editor)
-        layout.addWidget(QLabel("Log:")); layout.addWidget(self.log)
-        self.setLayout(layout)
-
-    # ---------- UI helpers ----------
-    def browse_key(self):
-        p,_ = QFileDialog.getOpenFileName(self, "Select private key", str(Path.home()))
-        if p: self.key_edit.setText(p)
-
-    def browse_matlab_script(self):
-        p,_ = QFileDialog.getOpenFileName(self, "Select MATLAB script", str(Path.home()), "MATLAB Files (*.m)")
-        if p: self.matlab_script_path.setText(p)
-
-    def append_log(self, text):
-        ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S"); self.log.appendPlainText(f"[{ts}] {text}")
-
-    def _ask_passphrase(self):
-        pw, ok = QInputDialog.getText(self, 'SSH passphrase', 'Enter passphrase:', QLineEdit.Password)
-        return pw if ok else None
-
-    # ---------- connection ----------
-    def connect_clicked(self):
-        host = self.host_edit.text().strip(); user = self.user_edit.text().strip(); key = self.key_edit.text().strip() or None
-        if not host or not user:
-            QMessageBox.warning(self, "Missing", "Enter host and user"); return
-        self.append_log(f"Connecting {user}@{host} ...")
-        try:
-            self.ssh = SSHClientEnhanced(host, user, key_path=key, passphrase_callback=self._ask_passphrase)
-            self.ssh.connect()
-        except Exception as e:
-            self.append_log(f"Connect failed: {e}"); QMessageBox.critical(self, "SSH", str(e)); self.ssh=None; return
-        self.append_log("Connected")
-        self.cfg['host']=host; self.cfg['user']=user; self.cfg['key_path']=key; save_config(self.cfg)
-        if not getattr(self,'polling',False):
-            self.polling=True; self.poll_thread=threading.Thread(target=self._poll_loop, daemon=True); self.poll_thread.start()
-        if not getattr(self,'job_watcher_thread',None):
-            self.job_watcher_thread = threading.Thread(target=self._job_watcher_loop, daemon=True); self.job_watcher_thread.start()
-        self._check_remote_gpu_availability()
-
-    def disconnect_clicked(self):
-        self.append_log("Disconnecting..."); self.polling=False
-        if self.ssh:
-            try: self.ssh.close()
-            except: pass
-        self.ssh=None; self.append_log("Disconnected")
-
-    def run_command_and_append(self, cmd):
-        if not self.ssh:
-            QMessageBox.warning(self, "Not connected", "Please connect first"); return
-        try:
-            out, err = self.ssh.exec(cmd)
-            if out: self.append_log(out)
-            if err: self.append_log("ERR: "+err)
-        except Exception as e:
-            self.append_log("Command failed: "+str(e))
-
-    # ---------- SHARED FOLDER helpers ----------
-    def ensure_shared_folder(self):
-        """Create remote shared path and subfolders (inputs/outputs/tmp/locks)."""
-        if not self.ssh:
-            QMessageBox.warning(self, "Not connected", "Connect first"); return
-        remote = self.shared_path_edit.text().strip()
-        if not remote:
-            QMessageBox.warning(self, "Missing", "Enter shared remote path"); return
-        try:
-            self.append_log(f"Creating remote folder {remote} ...")
-            self.ssh.exec(f"mkdir -p {remote} && chmod 2775 {remote} || true")
-            for d in ('inputs','outputs','tmp','locks'):
-                self.ssh.mkdir(f"{remote}/{d}")
-            self.append_log("Shared path created (note: export via NFS is recommended for true shared FS)")
-            self.cfg['shared_path']=remote; save_config(self.cfg)
-        except Exception as e:
-            self.append_log("ensure_shared_folder failed: "+str(e))
-
-    def _remote_list_shared_outputs(self):
-        if not self.ssh: return []
-        remote = self.shared_path_edit.text().strip()
-        if not remote: return []
-        outdir = remote.rstrip('/') + '/outputs'
-        try: return self.ssh.listdir(outdir)
-        except: return []
-
-    def fetch_shared_results(self):
-        """Download all files from remote shared outputs/ to local ./hpc_job_outputs/"""
-        if not self.ssh:
-            QMessageBox.warning(self, "Not connected", "Connect first"); return
-        remote = self.shared_path_edit.text().strip()
-        if not remote:
-            QMessageBox.warning(self, "Missing", "Enter shared remote path"); return
-        outdir = remote.rstrip('/') + '/outputs'
-        files = self._remote_list_shared_outputs()
-        if not files:
-            self.append_log(f"No files in {outdir}")
-            return
-        for f in files:
-            r = f"{outdir}/{f}"; l = LOCAL_JOB_OUTPUT_DIR / f
-            try:
-                self.append_log(f"Downloading {r} -> {l}")
-                self.ssh.get(r, str(l))
-            except Exception as e:
-                self.append_log(f"Failed to download {r}: {e}")
-        self.append_log("Fetch complete")
-
-    def sync_outputs_from_remote(self):
-        # currently a convenience wrapper around fetch_shared_results
-        self.fetch_shared_results()
-
-    # ---------- MATLAB job submission ----------
-    def submit_matlab_job(self):
-        if not self.ssh:
-            QMessageBox.warning(self,"Not connected","Connect first"); return
-        local_m = self.matlab_script_path.text().strip()
-        if not local_m or not Path(local_m).is_file():
-            QMessageBox.warning(self,"Missing script","Select a local .m file"); return
-        remote_base = self.remote_base_path.text().strip() or f"/home/{self.user_edit.text().strip()}"
-        self.cfg['remote_base_path']=remote_base; save_config(self.cfg)
-        remote_dir = f"{remote_base}/hpc_jobs"
-        remote_m = f"{remote_dir}/{os.path.basename(local_m)}"
-        try:
-            self.append_log(f"Ensuring remote dir {remote_dir} ..."); self.ssh.exec(f"mkdir -p {remote_dir}")
-        except Exception as e:
-            self.append_log("mkdir failed: "+str(e))
-        # upload .m
-        try:
-            tmp = Path.cwd() / f"tmp_{int(time.time())}_{os.path.basename(local_m)}"
-            tmp.write_bytes(Path(local_m).read_bytes())
-            self.ssh.put(str(tmp), remote_m); tmp.unlink()
-            self.append_log(f"Uploaded {remote_m}")
-        except Exception as e:
-            self.append_log("Upload failed: "+str(e)); return
-        # build sbatch
-        cpus = int(self.matlab_cpus.value()); mem = self.matlab_mem.text().strip() or "8G"
-        use_gpu = bool(self.matlab_use_gpu.isChecked()); args = self.matlab_args.text().strip()
-        script_basename = Path(local_m).stem
-        gpu_line = "#SBATCH --gres=gpu:1\n" if use_gpu else ""
-        sbatch_name = f"{script_basename}_job_{int(time.time())}.sh"
-        remote_sbatch = f"{remote_dir}/{sbatch_name}"; remote_out = f"{remote_dir}/{script_basename}_%j.out"
-        shared = self.shared_path_edit.text().strip()
-        shared_export = f"export HPC_SHARED_PATH={shared}\n" if shared else ""
-        matlab_call = f"{script_basename}({args})" if args else f"{script_basename}()"
-        sbatch_content = f"""#!/bin/bash
-#SBATCH --job-name={script_basename}
-#SBATCH --output={script_basename}_%j.out
-#SBATCH --time=24:00:00
-#SBATCH --ntasks=1
-#SBATCH --cpus-per-task={cpus}
-#SBATCH --mem={mem}
-{gpu_line}
-module load matlab || true
-cd {remote_dir}
-{shared_export}
-matlab -nodisplay -r "try, {matlab_call}; catch e, disp(getReport(e)); exit(1); end; exit(0)"
-"""
-        local_sbatch = Path.cwd() / sbatch_name; local_sbatch.write_text(sbatch_content)
-        try:
-            self.ssh.put(str(local_sbatch), remote_sbatch); local_sbatch.unlink()
-            self.append_log(f"Uploaded sbatch {remote_sbatch}")
-            out, err = self.ssh.exec(f"sbatch {remote_sbatch}")
-            if out:
-                self.append_log(out)
-                m = re.search(r"Submitted batch job (\\d+)", out)
-                jobid = m.group(1) if m else None
-                insert_job_record(jobid, remote_sbatch, remote_out, out, status='SUBMITTED' if jobid else 'SUBMIT_FAILED')
-            else:
-                self.append_log("ERR: "+err); insert_job_record(None, remote_sbatch, remote_out, err, status='SUBMIT_FAILED')
-        except Exception as e:
-            self.append_log("Submit failed: "+str(e)); insert_job_record(None, remote_sbatch, remote_out, str(e), status='SUBMIT_FAILED')
-            try: local_sbatch.unlink()
-            except: pass
-
-    # ---------- job watcher ----------
-    def _job_watcher_loop(self):
-        while True:
-            try:
-                if self.ssh:
-                    conn = sqlite3.connect(DB_PATH); c = conn.cursor()
-                    c.execute("SELECT jobid, remote_out FROM jobs WHERE status='SUBMITTED'")
-                    rows = c.fetchall(); conn.close()
-                    for jobid, remote_out in rows:
-                        if not jobid:
-                            update_job_status(jobid, 'SUBMIT_FAILED'); continue
-                        try:
-                            out, err = self.ssh.exec(f"squeue -j {jobid} -h")
-                            if not out.strip():
-                                remote_out_path = remote_out.replace('%j', str(jobid))
-                                local_target = LOCAL_JOB_OUTPUT_DIR / Path(remote_out_path).name
-                                self.append_log(f"Job {jobid} finished — fetching {remote_out_path} -> {local_target}")
-                                try:
-                                    self.ssh.get(remote_out_path, str(local_target)); update_job_status(jobid, 'COMPLETED')
-                                    self.append_log(f"Downloaded output for job {jobid} to {local_target}")
-                                except Exception as e:
-                                    # try get from shared outputs if configured
-                                    shared = self.shared_path_edit.text().strip()
-                                    if shared:
-                                        cand = f"{shared}/outputs/{jobid}.out"
-                                        try:
-                                            self.ssh.get(cand, str(local_target)); update_job_status(jobid, 'COMPLETED')
-                                            self.append_log(f"Downloaded output for job {jobid} from shared folder")
-                                            continue
-                                        except: pass
-                                    update_job_status(jobid, 'FINISHED_NO_OUTPUT'); self.append_log(f"Could not download output for {jobid}: {e}")
-                        except Exception as e:
-                            self.append_log("Job watcher squeue failed: "+str(e))
-            except Exception as e:
-                self.append_log("Job watcher loop error: "+str(e))
-            time.sleep(JOB_WATCH_INTERVAL)
-
-    # ---------- polling ----------
-    def _poll_loop(self):
-        while self.polling:
-            try: self.poll_once()
-            except Exception as e: self.append_log("Polling error: "+str(e))
-            time.sleep(POLL_INTERVAL)
-
-    def poll_once(self):
-        if not self.ssh: return
-        try:
-            out, err = self.ssh.exec("sinfo -Nel")
-            if out: self.append_log(out)
-        except Exception as e: self.append_log("sinfo err: "+str(e))
-        # GPU check and optional metrics omitted for brevity in this version
-
-    def _check_remote_gpu_availability(self):
-        if not self.ssh: return
-        try:
-            out, err = self.ssh.exec("which nvidia-smi && nvidia-smi --query-gpu=name --format=csv,noheader,nounits || true", timeout=8)
-            if out and 'nvidia-smi' in out:
-                self.append_log("nvidia-smi found; GPU enabled"); self.matlab_use_gpu.setEnabled(True)
-            else:
-                self.append_log("nvidia-smi not found; GPU disabled"); self.matlab_use_gpu.setEnabled(False); self.matlab_use_gpu.setChecked(False)
-        except Exception:
-            self.append_log("nvidia-smi check failed"); self.matlab_use_gpu.setEnabled(False); self.matlab_use_gpu.setChecked(False)
-
-    # ---------- job history UI ----------
-    def show_job_history(self):
-        rows = list_jobs(200)
-        text = '\\n'.join([f"[{r[0]}] jobid={r[0]} status={r[4]} at {r[3]} sbatch={r[1]} out={r[2]}" for r in rows])
-        dlg = QtWidgets.QDialog(self); dlg.setWindowTitle("Job history"); layout=QVBoxLayout()
-        te = QPlainTextEdit(); te.setPlainText(text); te.setReadOnly(True); layout.addWidget(te)
-        btn = QPushButton("Close"); btn.clicked.connect(dlg.accept); layout.addWidget(btn); dlg.setLayout(layout); dlg.exec_()
+from hpc_engine import (HISTORY_COLUMNS, HISTORY_SORTS, PACK_TASK_STATES, RESULT_COLUMNS, HPCEngine, EngineError, format_duration,
+                        format_kb, format_pack_counts)
+from hpc_daemon import ApiClient, LocalClient, ping, run_daemon
+
+# ---------- client selection ----------
+def open_client(args):
+    """The daemon's API when one answers, otherwise an in-process engine."""
+    if args.api:
+        if not ping(args.api): raise EngineError(f"no daemon answering on {args.api}", 'unreachable')
+        return ApiClient(args.api)
+    if ping(): return ApiClient()
+    return LocalClient(HPCEngine())
+
+def target_cluster(args):
+    """The --cluster name for operations on one cluster ('auto' only means something to submit)."""
+    return None if args.cluster in (None, 'auto') else args.cluster
+
+def _connect(client, **kw):
+    try: client.connect(**kw)
+    except EngineError as e:
+        if e.kind != 'passphrase_required' or not sys.stdin.isatty(): raise
+        client.connect(passphrase=getpass.getpass(f"{e} — passphrase: "), **kw)
+
+def ensure_connected(client, args, **monitors):
+    """Connect the --cluster profile (or --host); with several profiles and neither, all of them."""
+    status = client.status(); cluster = target_cluster(args)
+    if cluster in status['clusters'] or (not cluster and status['connected'] and args.cluster != 'auto'): return
+    kw = dict(use_agent=False if args.no_agent else None, **monitors)
+    if cluster or args.host or len(status['profiles']) <= 1:
+        return _connect(client, cluster=cluster, host=args.host, user=args.user, key_path=args.key, port=args.port, **kw)
+    for name, err in client.connect_all(**kw).items():
+        if not err: continue
+        if err['kind'] == 'passphrase_required' and sys.stdin.isatty(): _connect(client, cluster=name, **kw)
+        else: print(f"warning: {name}: {err['error']}", file=sys.stderr)
+    if not client.status()['connected']: raise EngineError("no cluster could be connected", 'connect_failed')
+
+def _print(args, result, text):
+    print(json.dumps(result, indent=2, default=str) if args.json else text)
+
+# ---------- commands ----------
+def cmd_gui(args):
+    client = ApiClient(args.api) if args.api else (ApiClient() if ping() else LocalClient(HPCEngine()))
+    from hpc_gui import run_gui          # Qt/matplotlib only load here
+    return run_gui(client)
+
+def cmd_daemon(args):
+    run_daemon(args.listen, connect=not args.no_connect, use_agent=False if args.no_agent else None, allow_remote=args.allow_remote)
+    return 0
+
+def cmd_submit(args, client):
+    ensure_connected(client, args, watch_jobs=args.watch, poll_cluster=False)
+    common = dict(script=args.script, remote_base=args.remote_base, cpus=args.cpus, mem=args.mem, use_gpu=args.gpu,
+                  project_dir=args.project_dir or '', cluster=args.cluster)
+    if args.pack:
+        if not (args.sweep or args.sweep_csv): raise EngineError("--pack needs --sweep or --sweep-csv", 'bad_request')
+        common.pop('cpus'); common.pop('use_gpu')
+        res = client.submit_pack(grid=args.sweep or '', csv_path=args.sweep_csv or '', workers=args.pack, **common)
+        _print(args, res, f"Submitted packed job {res['jobid']} on {res['cluster']} ({res['tasks']} tasks on {res['workers']} workers)")
+    elif args.sweep or args.sweep_csv:
+        res = client.submit_sweep(grid=args.sweep or '', csv_path=args.sweep_csv or '', max_parallel=args.max_parallel, **common)
+        _print(args, res, f"Submitted array job {res['jobid']} on {res['cluster']} ({res['tasks']} tasks, --array={res['array']})")
+    else:
+        res = client.submit(args=args.args or '', **common)
+        _print(args, res, f"Submitted job {res['jobid']} on {res['cluster']}")
+    if args.watch: return watch_jobs(client, [res['jobid']], args.output)
+    return 0
+
+def cmd_status(args, client):
+    if args.refresh:
+        ensure_connected(client, args, watch_jobs=False, poll_cluster=False); client.poll_jobs(cluster=target_cluster(args))
+    rows = client.jobs(limit=args.limit)
+    if target_cluster(args): rows = [r for r in rows if r[5] == args.cluster]
+    if args.json:
+        print(json.dumps([dict(zip(('jobid', 'remote_sbatch', 'remote_out', 'submitted_at', 'status', 'cluster'), r)) for r in rows], indent=2))
+        return 0
+    print(f"{'JOBID':<14} {'CLUSTER':<12} {'STATUS':<14} {'SUBMITTED':<20} SBATCH")
+    for jobid, sbatch, _, submitted, status, cluster in rows:
+        print(f"{jobid or '-':<14} {cluster or '-':<12} {status or '-':<14} {(submitted or '')[:19]:<20} {sbatch or ''}")
+    return 0
+
+def cmd_history(args, client):
+    if args.accounting:
+        ensure_connected(client, args, watch_jobs=False, poll_cluster=False); client.backfill_accounting(cluster=target_cluster(args))
+    filters = dict(status=[s.upper() for s in args.status] if args.status else None, script=args.script, since=args.since,
+                   until=args.until, text=args.search, cluster=target_cluster(args), sort=args.sort, descending=not args.ascending)
+    rows, after = [], None
+    while len(rows) < args.limit:                       # keyset pages until --limit rows
+        page = client.history(after=after, limit=min(args.limit - len(rows), 500), **filters)
+        rows += page['rows']; after = page['next']
+        if after is None: break
+    if args.json:
+        print(json.dumps([dict(zip(HISTORY_COLUMNS, r)) for r in rows], indent=2)); return 0
+    print(f"{'JOBID':<14} {'CLUSTER':<12} {'SCRIPT':<20} {'STATUS':<14} {'SUBMITTED':<20} {'ELAPSED':>11} {'MAXRSS':>8} {'CPU':>5} EXIT")
+    for r in rows:
+        r = dict(zip(HISTORY_COLUMNS, r)); eff = '' if r['cpu_eff'] is None else f"{r['cpu_eff'] * 100:.0f}%"
+        print(f"{r['jobid'] or '-':<14} {r['cluster'] or '-':<12} {(r['script'] or '')[:20]:<20} {r['status'] or '-':<14} "
+              f"{(r['submitted_at'] or '')[:19]:<20} {format_duration(r['elapsed_s']):>11} {format_kb(r['max_rss_kb']):>8} {eff:>5} "
+              f"{r['exit_code'] or ''}")
+    return 0
+
+def cmd_pack(args, client):
+    res = client.pack(jobid=args.jobid, cluster=target_cluster(args), status=args.status or None, limit=args.limit)
+    if args.json: print(json.dumps(res, indent=2)); return 0
+    print(f"{res['cluster']}/{res['jobid']}: job {res['status']}, {res['workers']} workers, tasks {format_pack_counts(res['counts'])}")
+    print(f"results in {res['pack_dir']}")
+    if not res['tasks']: return 0
+    print(f"\n{'TASK':>6} {'STATUS':<10} {'WORKER':>6} {'ELAPSED':>9} {'ARGS':<30} ERROR")
+    for task, task_args, st, worker, elapsed, _, error in res['tasks']:
+        print(f"{task:>6} {st:<10} {'' if worker is None else worker:>6} {'' if elapsed is None else f'{elapsed:.1f}s':>9} "
+              f"{task_args[:30]:<30} {error or ''}")
+    if res['next'] is not None: print("... more tasks (--limit)")
+    return 0
+
+def cmd_results(args, client):
+    if args.pin or args.unpin:
+        if args.jobid is None and not args.path: raise EngineError("--pin/--unpin need a JOBID or --path")
+        res = client.pin_results(jobid=args.jobid, path=args.path, pinned=args.pin, cluster=target_cluster(args))
+        target = f"job {args.jobid}" if args.jobid is not None else args.path
+        _print(args, res, f"{'pinned' if args.pin else 'unpinned'} {target}: {res['updated']} cached file(s)"); return 0
+    res = client.results(jobid=args.jobid, cluster=target_cluster(args), pinned=True if args.pinned else None, limit=args.limit)
+    if args.json:
+        print(json.dumps(dict(res, results=[dict(zip(RESULT_COLUMNS, r)) for r in res['results']]), indent=2)); return 0
+    quota = f" of {format_kb(res['quota'] / 1024)}" if res['quota'] else ''
+    print(f"{res['root']}: {res['files']} files, {format_kb(res['bytes'] / 1024)}{quota} ({format_kb(res['pinned_bytes'] / 1024)} pinned)")
+    if not res['results']: return 0
+    print(f"\n{'JOBID':<14} {'CLUSTER':<12} {'SIZE':>8} {'LAST USED':<19} {'PIN':<3} PATH")
+    for r in res['results']:
+        r = dict(zip(RESULT_COLUMNS, r))
+        used = datetime.fromtimestamp(r['last_access']).strftime('%Y-%m-%d %H:%M:%S') if r['last_access'] else ''
+        print(f"{r['jobid'] or '-':<14} {r['cluster'] or '-':<12} {format_kb(r['size'] / 1024):>8} {used:<19} {'yes' if r['pinned'] else '':<3} {r['path']}")
+    return 0
+
+def cmd_metrics(args, client):
+    if args.enable or args.disable or args.reset:
+        client.set_metrics(enabled=True if args.enable else (False if args.disable else None), reset=args.reset)
+    if args.profile:
+        res = client.profile(action=args.profile, sort=args.sort)
+        _print(args, res, res['report'] or f"profiling {'on' if res['active'] else 'off'}, nothing recorded yet"); return 0
+    if args.prometheus:
+        print(client.metrics(fmt='prometheus')['text'], end=''); return 0
+    snap = client.metrics()
+    if args.json: print(json.dumps(snap, indent=2)); return 0
+    if not snap['enabled']: print("metrics collection is off (--enable turns it on)")
+    labels = lambda r: ','.join(f"{k}={v}" for k, v in sorted(r['labels'].items()) if v != '')
+    print(f"{'METRIC':<16} {'LABELS':<44} {'COUNT':>7} {'P50 MS':>9} {'P95 MS':>9} {'P99 MS':>9} {'MAX MS':>9}")
+    for r in snap['latency']:
+        print(f"{r['name']:<16} {labels(r)[:44]:<44} {r['count']:>7} {r['p50'] * 1e3:>9.2f} {r['p95'] * 1e3:>9.2f} "
+              f"{r['p99'] * 1e3:>9.2f} {r['max'] * 1e3:>9.2f}")
+    if snap['counters']: print(f"\n{'COUNTER':<16} {'LABELS':<44} VALUE")
+    for r in snap['counters']: print(f"{r['name']:<16} {labels(r)[:44]:<44} {r['value']}")
+    return 0
+
+def cmd_sync(args, client):
+    ensure_connected(client, args, watch_jobs=False, poll_cluster=False)
+    res = client.sync(remote=args.shared, recursive=not args.top_level, use_checksum=args.checksum, include=args.include,
+                      exclude=args.exclude, method=args.method, since_last=args.newer, local_dir=args.dest,
+                      cluster=target_cluster(args))
+    _print(args, res, f"{res['method']}: {res['files']} downloaded, {res['skipped']} unchanged, {len(res['failed'])} failed — "
+                      f"{res['bytes']/1e6:.1f} MB in {res['seconds']:.1f}s ({res['mbps']:.2f} MB/s)"
+                      + (f"; {res['evicted'][0]} cached file(s) evicted to stay within the quota" if res['evicted'][0] else ''))
+    return 1 if res['failed'] else 0
+
+def cmd_watch(args, client):
+    ensure_connected(client, args, watch_jobs=True, poll_cluster=False)
+    return watch_jobs(client, args.jobids or client.status()['active_jobs'], args.output)
+
+def watch_jobs(client, jobids, show_output=False):
+    """Print transitions (and output) of jobids until none is active; array parents cover their tasks."""
+    ours = lambda j: any(j == w or j.startswith(w + '_') for w in jobids)
+    status = client.status(); since = status['seq']
+    if not jobids: print("No active jobs."); return 0
+    print(f"Watching {', '.join(jobids)} (Ctrl-C to stop)", flush=True)
+    several = len(status['clusters']) > 1
+    tag = lambda ev: f"{ev.get('cluster')}/" if several else ''
+    def show(events):
+        for ev in events:
+            if ev['type'] == 'job' and ours(ev['jobid']): print(f"{tag(ev)}{ev['jobid']}: {ev['old']} -> {ev['new']}", flush=True)
+            elif ev['type'] == 'job_output' and show_output and ours(ev['jobid']): sys.stdout.write(ev['text']); sys.stdout.flush()
+            elif ev['type'] == 'pack' and ours(ev['jobid']): print(f"{tag(ev)}{ev['jobid']}: tasks {format_pack_counts(ev['counts'])}", flush=True)
+            elif ev['type'] == 'disconnected':
+                print(f"Connection to {ev.get('cluster')} closed." if several else "Connection closed.")
+                if not client.status()['connected']: return False
+        return True
+    try:
+        while any(ours(j) for j in status['active_jobs']):
+            batch = client.events(since=since, timeout=10.0); since = batch['seq']
+            if not show(batch['events']): return 1
+            status = client.status()
+        show(client.events(since=since)['events'])          # transitions recorded just before the last status
+    except KeyboardInterrupt:
+        return 130
+    for jobid, _, _, _, st, cluster in client.jobs(limit=1000):
+        if jobid in jobids: print(f"{cluster + '/' if several else ''}{jobid}: {st}")
+    return 0
+
+def cmd_profiles(args, client):
+    if args.action == 'add':
+        if not args.name: raise EngineError("profiles add needs a NAME", 'bad_request')
+        fields = dict(host=args.host, user=args.user, key_path=args.key, port=args.port, remote_base_path=args.remote_base,
+                      shared_path=args.shared)
+        res = client.save_profile(name=args.name, **{k: v for k, v in fields.items() if v is not None})
+        _print(args, res, f"Saved profile {args.name}"); return 0
+    if args.action == 'remove':
+        if not args.name: raise EngineError("profiles remove needs a NAME", 'bad_request')
+        client.remove_profile(name=args.name); _print(args, {'removed': args.name}, f"Removed profile {args.name}"); return 0
+    profiles = client.profiles(); connected = client.status()['clusters']
+    if args.json: print(json.dumps([dict(p, connected=p['name'] in connected) for p in profiles], indent=2)); return 0
+    print(f"{'NAME':<14} {'HOST':<28} {'USER':<12} {'STATE':<10} SHARED")
+    for p in profiles:
+        state = (connected[p['name']]['monitor'] or 'connected') if p['name'] in connected else '-'
+        print(f"{p['name']:<14} {p['host']:<28} {p.get('user') or '':<12} {state:<10} {p.get('shared_path') or ''}")
+    return 0
+
+# ---------- arguments ----------
+def build_parser():
+    p = argparse.ArgumentParser(prog='hps_dashboard.py', description="MATLAB + Slurm dashboard, CLI and daemon.")
+    p.add_argument('--api', help="daemon address (unix:/path or host:port); default: the user's socket if a daemon runs")
+    p.add_argument('--host'); p.add_argument('--user'); p.add_argument('--key', help="private key (default: saved key or agent)")
+    p.add_argument('--port', type=int, help="SSH port (default: saved port or 22)")
+    p.add_argument('--cluster', help="cluster profile to use; for submit also `auto` (most idle CPUs)")
+    p.add_argument('--json', action='store_true', help="machine-readable output")
+    p.add_argument('--no-agent', action='store_true', help="monitor by polling instead of through the remote agent")
+    out = argparse.ArgumentParser(add_help=False)          # --json is also accepted after the command
+    out.add_argument('--json', action='store_true', default=argparse.SUPPRESS, help=argparse.SUPPRESS)
+    sub = p.add_subparsers(dest='command')
+    sub.add_parser('gui', help="Qt dashboard (default)")
+    d = sub.add_parser('daemon', help="headless engine with a local JSON API")
+    d.add_argument('--listen', help="unix:/path or host:port (default: ~/.hpc_dashboard.sock)")
+    d.add_argument('--no-connect', action='store_true', help="do not connect with the saved settings on start")
+    d.add_argument('--allow-remote', action='store_true', help="let --listen use a non-loopback address (the API has no authentication)")
+    s = sub.add_parser('submit', parents=[out], help="submit a MATLAB script")
+    s.add_argument('script'); s.add_argument('--args', help="MATLAB argument list, e.g. \"1, 'x'\"")
+    s.add_argument('--cpus', type=int, default=4); s.add_argument('--mem', default='8G'); s.add_argument('--gpu', action='store_true')
+    s.add_argument('--remote-base'); s.add_argument('--project-dir')
+    s.add_argument('--sweep', help="parameter grid, e.g. 'alpha=0.1,0.2; beta=1:3'"); s.add_argument('--sweep-csv')
+    s.add_argument('--max-parallel', type=int, default=0, help="array throttle (%%K), 0 = unlimited")
+    s.add_argument('--pack', type=int, metavar='N', help="run the sweep's tasks in one allocation of N single-core MATLAB workers "
+                                                           "(--mem per worker; needs the shared path)")
+    s.add_argument('--watch', action='store_true'); s.add_argument('--output', action='store_true', help="with --watch: stream job output")
+    st = sub.add_parser('status', parents=[out], help="job history")
+    st.add_argument('--limit', type=int, default=50); st.add_argument('--refresh', action='store_true', help="query Slurm first")
+    h = sub.add_parser('history', parents=[out], help="search the job history")
+    h.add_argument('--status', nargs='*', help="job states, e.g. FAILED TIMEOUT"); h.add_argument('--script', help="script name")
+    h.add_argument('--since', help="YYYY-MM-DD"); h.add_argument('--until', help="YYYY-MM-DD (inclusive)")
+    h.add_argument('--search', help="full-text search over job id, script, cluster and sbatch output")
+    h.add_argument('--sort', choices=sorted(HISTORY_SORTS), default='submitted'); h.add_argument('--ascending', action='store_true')
+    h.add_argument('--limit', type=int, default=50)
+    h.add_argument('--accounting', action='store_true', help="fetch elapsed/MaxRSS/CPU efficiency of finished jobs from sacct first")
+    pk = sub.add_parser('pack', parents=[out], help="task progress of a packed job")
+    pk.add_argument('jobid'); pk.add_argument('--status', nargs='*', choices=PACK_TASK_STATES, type=str.upper, help="list tasks in these states")
+    pk.add_argument('--limit', type=int, default=200)
+    m = sub.add_parser('metrics', parents=[out], help="engine latency metrics and profiling")
+    m.add_argument('--prometheus', action='store_true', help="Prometheus text format")
+    m.add_argument('--reset', action='store_true'); m.add_argument('--enable', action='store_true')
+    m.add_argument('--disable', action='store_true')
+    m.add_argument('--profile', choices=('start', 'stop', 'report'), help="cProfile the engine's work")
+    m.add_argument('--sort', default='cumulative', help="pstats sort key for --profile (cumulative, tottime, calls, ...)")
+    y = sub.add_parser('sync', parents=[out], help="download <shared>/outputs")
+    y.add_argument('shared', nargs='?'); y.add_argument('--dest', help="local folder outside the result cache (default: the cache)")
+    y.add_argument('--top-level', action='store_true', help="skip subfolders"); y.add_argument('--checksum', action='store_true')
+    y.add_argument('--include', nargs='*'); y.add_argument('--exclude', nargs='*')
+    y.add_argument('--method', choices=('auto', 'tar', 'sftp'), default='auto'); y.add_argument('--newer', action='store_true')
+    rs = sub.add_parser('results', parents=[out], help="files in the local result cache; pin results to keep them")
+    rs.add_argument('jobid', nargs='?'); rs.add_argument('--path', help="a cached file or folder (with --pin/--unpin)")
+    pin = rs.add_mutually_exclusive_group()
+    pin.add_argument('--pin', action='store_true', help="never evict these results"); pin.add_argument('--unpin', action='store_true')
+    rs.add_argument('--pinned', action='store_true', help="list pinned files only"); rs.add_argument('--limit', type=int, default=50)
+    w = sub.add_parser('watch', parents=[out], help="follow jobs until they finish")
+    w.add_argument('jobids', nargs='*'); w.add_argument('--output', action='store_true', help="stream job output")
+    pr = sub.add_parser('profiles', parents=[out], help="list or edit cluster profiles (add takes --host/--user/--key/--port)")
+    pr.add_argument('action', nargs='?', choices=('list', 'add', 'remove'), default='list'); pr.add_argument('name', nargs='?')
+    pr.add_argument('--remote-base'); pr.add_argument('--shared', help="shared remote path")
+    return p
+
+COMMANDS = {'submit': cmd_submit, 'status': cmd_status, 'history': cmd_history, 'pack': cmd_pack, 'results': cmd_results, 'metrics': cmd_metrics,
+            'sync': cmd_sync, 'watch': cmd_watch, 'profiles': cmd_profiles}
 
 # ---------- run ----------
-def main():
-    app = QApplication(sys.argv)
-    dash = HPCDashboard(); dash.show()
-    sys.exit(app.exec_())
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        if args.command in (None, 'gui'): return cmd_gui(args)
+        if args.command == 'daemon': return cmd_daemon(args)
+        client = open_client(args)
+        try: return COMMANDS[args.command](args, client)
+        finally: client.close()
+    except EngineError as e:
+        print(f"error: {e}", file=sys.stderr); return 2
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
 
 # ---------- NFS quick guide (use this for true shared FS) ----------
 # On controller:
@@ -0,0 +1,33 @@
+"""Tests of script bundle collection and its digest cache in hpc_engine (run: python -m pytest -q)."""
+import hashlib
+
+import pytest
+
+import hpc_engine as hpc
+from hpc_engine import bundle_digest, collect_bundle
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Paths hashed from disk; the digest cache starts empty."""
+    hpc._file_digest.cache_clear(); seen = []; real = hpc._sha256_file
+    monkeypatch.setattr(hpc, '_sha256_file', lambda p: seen.append(str(p)) or real(p))
+    yield seen
+    hpc._file_digest.cache_clear()
+
+def test_unchanged_files_are_hashed_once(tmp_path, reads):
+    (tmp_path / 'main.m').write_text('disp(1)\n'); (tmp_path / 'helper.m').write_text('x = 2;\n')
+    root, entries = collect_bundle(tmp_path / 'main.m')
+    assert [e.rel for e in entries] == ['helper.m', 'main.m']
+    assert entries[1].digest == hashlib.sha256(b'disp(1)\n').hexdigest()
+    assert bundle_digest(collect_bundle(tmp_path / 'main.m')[1]) == bundle_digest(entries)
+    assert len(reads) == 2
+
+def test_a_changed_file_is_hashed_again(tmp_path, reads):
+    (tmp_path / 'main.m').write_text('disp(1)\n')
+    before = collect_bundle(tmp_path / 'main.m')[1][0].digest
+    (tmp_path / 'main.m').write_text('disp(22)\n')
+    assert collect_bundle(tmp_path / 'main.m')[1][0].digest == hashlib.sha256(b'disp(22)\n').hexdigest() != before
+    assert len(reads) == 2
+
+def test_digest_cache_is_bounded():
+    assert hpc._file_digest.cache_info().maxsize == hpc.DIGEST_CACHE_SIZE
@@ -0,0 +1,87 @@
+"""Tests of the sinfo/squeue parsers and the diffing cluster snapshot in hpc_engine (run: python -m pytest -q)."""
+from hpc_engine import (CLUSTER_STATE_SEP, ClusterSnapshot, NodeRecord, PartitionRecord, is_empty_diff, parse_sinfo_nodes,
+                        parse_squeue_jobs)
+
+# `sinfo -h -N -o SINFO_FORMAT`: n03 is in two partitions (the default one marked *), n04 is
+# drained and not responding, n05 is down with unparseable load/memory
+SINFO = """n01|compute*|mixed|12/4/0/16|64000|20000|11.50|(null)
+n02|compute*|allocated|16/0/0/16|64000|1000|16.02|(null)
+n03|compute*|idle|0/16/0/16|64000|63000|0.01|(null)
+n03|gpu|idle|0/16/0/16|64000|63000|0.01|gpu:a100:2
+n04|compute*|drained*|0/0/16/16|64000|60000|0.00|(null)
+n05|debug|down~|0/0/8/8|N/A|N/A|N/A|(null)
+garbage line
+|compute|idle|0/1/0/1|1|1|0|(null)
+"""
+
+SQUEUE = """1001|alice|compute|sim|RUNNING|1:02:03|1|12|n01
+1002|bob|gpu|train|PENDING|0:00|1|4|(Resources)
+123_4|alice|compute|sweep|COMPLETING|5:00|1|1|n02
+"""
+
+def test_sinfo_rows_of_one_node_are_merged_across_partitions():
+    nodes = parse_sinfo_nodes(SINFO)
+    assert sorted(nodes) == ['n01', 'n02', 'n03', 'n04', 'n05']
+    assert nodes['n03'].partitions == ('compute', 'gpu')
+    assert nodes['n03'].gres == 'gpu:a100:2'
+
+def test_sinfo_states_and_cpu_counts():
+    nodes = parse_sinfo_nodes(SINFO)
+    assert nodes['n01'] == NodeRecord('n01', ('compute',), 'mixed', 12, 4, 16, 64000, 20000, 11.5, '')
+    assert nodes['n04'].state == 'drained' and (nodes['n04'].cpus_idle, nodes['n04'].cpus_total) == (0, 16)
+    assert nodes['n05'] == NodeRecord('n05', ('debug',), 'down', 0, 0, 8, 0, 0, 0.0, '')
+
+def test_sinfo_empty_output():
+    assert parse_sinfo_nodes('') == {} and parse_sinfo_nodes(None) == {}
+
+def test_squeue_records():
+    jobs = parse_squeue_jobs(SQUEUE)
+    assert jobs['1002'].reason == '(Resources)' and jobs['1002'].state == 'PENDING'
+    assert jobs['123_4'].state == 'COMPLETING' and jobs['123_4'].reason == 'n02'
+    assert jobs['1001'] == parse_squeue_jobs('1001|alice|compute|sim|RUNNING|1:02:03|1|12|n01')['1001']
+    assert (jobs['1001'].elapsed, jobs['1001'].nodes, jobs['1001'].cpus) == ('1:02:03', 1, 12)
+    assert parse_squeue_jobs('1004|x|compute|short\n') == {}
+
+def test_first_apply_reports_everything_with_partition_totals():
+    snap = ClusterSnapshot('c1')
+    diff = snap.apply(parse_sinfo_nodes(SINFO), parse_squeue_jobs(SQUEUE))
+    assert sorted(diff['nodes'][0]) == ['n01', 'n02', 'n03', 'n04', 'n05'] and diff['nodes'][1] == []
+    assert all(r.cluster == 'c1' for kind in ClusterSnapshot.KINDS for r in diff[kind][0].values())
+    assert snap.partitions['compute'] == PartitionRecord('compute', 4, 28, 20, 64, 'c1')
+    assert snap.partitions['gpu'] == PartitionRecord('gpu', 1, 0, 16, 16, 'c1')
+    assert snap.free_cpus() == 20
+
+def test_next_apply_reports_only_changes_and_removals():
+    snap = ClusterSnapshot('c1')
+    snap.apply(parse_sinfo_nodes(SINFO), parse_squeue_jobs(SQUEUE))
+    sinfo = SINFO.replace('n01|compute*|mixed|12/4/0/16', 'n01|compute*|allocated|16/0/0/16')
+    sinfo = '\n'.join(line for line in sinfo.splitlines() if not line.startswith('n05'))      # debug loses its only node
+    squeue = '\n'.join(line for line in SQUEUE.splitlines() if not line.startswith('1001'))
+    diff = snap.apply(parse_sinfo_nodes(sinfo), parse_squeue_jobs(squeue))
+    assert list(diff['nodes'][0]) == ['n01'] and diff['nodes'][0]['n01'].state == 'allocated'
+    assert diff['nodes'][1] == ['n05']
+    assert list(diff['partitions'][0]) == ['compute'] and diff['partitions'][1] == ['debug']
+    assert diff['jobs'] == ({}, ['1001'])
+    assert 'debug' not in snap.partitions
+
+def test_unchanged_apply_is_an_empty_diff():
+    snap = ClusterSnapshot('c1')
+    snap.apply(parse_sinfo_nodes(SINFO), parse_squeue_jobs(SQUEUE))
+    assert is_empty_diff(snap.apply(parse_sinfo_nodes(SINFO), parse_squeue_jobs(SQUEUE)))
+
+def test_an_empty_cluster_removes_everything():
+    snap = ClusterSnapshot('c1')
+    snap.apply(parse_sinfo_nodes(SINFO), parse_squeue_jobs(SQUEUE))
+    diff = snap.apply({}, {})
+    assert sorted(diff['partitions'][1]) == ['compute', 'debug', 'gpu'] and len(diff['jobs'][1]) == 3
+    assert snap.free_cpus() == 0
+
+class FakeSSH:
+    hostname = 'fake'
+    def __init__(self, out): self.out = out; self.commands = []
+    def exec(self, cmd, timeout=20, **kw): self.commands.append(cmd); return self.out, ''
+
+def test_refresh_splits_one_exec_into_both_queries():
+    ssh = FakeSSH(f"{SINFO}{CLUSTER_STATE_SEP}\n{SQUEUE}")
+    diff = ClusterSnapshot('c1').refresh(ssh)
+    assert len(ssh.commands) == 1 and len(diff['nodes'][0]) == 5 and len(diff['jobs'][0]) == 3
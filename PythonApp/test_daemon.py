@@ -0,0 +1,54 @@
+"""Tests of the daemon's HTTP rules in hpc_daemon against a stub engine (run: python -m pytest -q)."""
+import http.client, json
+
+import pytest
+
+from hpc_daemon import ApiClient, EngineServer, is_loopback
+from hpc_engine import EngineError
+
+class StubEngine:
+    def __init__(self): self.calls = []
+    def status(self): self.calls.append('status'); return {'connected': []}
+    def submit(self, **kw): self.calls.append('submit'); return {'jobid': '1'}
+
+@pytest.fixture
+def served():
+    engine = StubEngine(); server = EngineServer(engine, '127.0.0.1:0').start()
+    yield engine, server.httpd.server_address
+    server.stop()
+
+def _request(address, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*address, timeout=5)
+    conn.request(method, path, body, headers or {})
+    resp = conn.getresponse(); payload = json.loads(resp.read()); conn.close()
+    return resp.status, payload
+
+def test_get_serves_read_only_methods(served):
+    engine, address = served
+    assert _request(address, 'GET', '/api/status') == (200, {'ok': True, 'result': {'connected': []}})
+
+def test_get_never_reaches_a_mutating_method(served):
+    engine, address = served
+    status, payload = _request(address, 'GET', '/api/submit?script=x.m')
+    assert (status, payload['kind']) == (405, 'method_not_allowed') and engine.calls == []
+
+@pytest.mark.parametrize('content_type', [None, 'text/plain', 'application/x-www-form-urlencoded'])
+def test_post_needs_a_json_content_type(served, content_type):
+    engine, address = served
+    status, _ = _request(address, 'POST', '/api/submit', b'{"script": "x.m"}', {'Content-Type': content_type} if content_type else {})
+    assert status == 415 and engine.calls == []
+
+def test_json_post_calls_the_engine(served):
+    engine, address = served
+    assert ApiClient(f"127.0.0.1:{address[1]}").submit(script='x.m') == {'jobid': '1'}
+    assert engine.calls == ['submit']
+
+def test_non_loopback_addresses_are_refused_unless_allowed():
+    with pytest.raises(EngineError) as exc: EngineServer(StubEngine(), '0.0.0.0:0')
+    assert exc.value.kind == 'bad_request'
+    EngineServer(StubEngine(), '0.0.0.0:0', allow_remote=True).httpd.server_close()
+
+@pytest.mark.parametrize('host, loopback', [('127.0.0.1', True), ('::1', True), ('localhost', True), ('0.0.0.0', False),
+                                            ('192.168.1.10', False)])
+def test_is_loopback(host, loopback):
+    assert is_loopback(host) == loopback
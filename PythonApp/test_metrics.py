@@ -0,0 +1,77 @@
+"""Tests of the latency histograms and the Prometheus exposition in hpc_engine (run: python -m pytest -q)."""
+import re
+
+import pytest
+
+from hpc_engine import METRIC_BUCKETS, Histogram, Metrics
+
+def _histogram(*values):
+    h = Histogram()
+    for v in values: h.observe(v)
+    return h
+
+def test_empty_histogram_quantiles_are_zero():
+    h = Histogram()
+    assert (h.quantile(0.0), h.quantile(0.5), h.quantile(1.0)) == (0.0, 0.0, 0.0)
+
+def test_a_value_on_a_bucket_boundary_falls_into_that_bucket():
+    h = _histogram(0.01)
+    assert h.counts[METRIC_BUCKETS.index(0.01)] == 1
+    assert h.quantile(0.5) == pytest.approx(0.0075) and h.quantile(1.0) == 0.01
+
+def test_quantiles_interpolate_inside_a_bucket_and_never_exceed_the_max():
+    h = _histogram(0.02, 0.02, 0.02, 0.02)                 # all in (0.01, 0.025]
+    assert h.quantile(0.5) == pytest.approx(0.0175)
+    assert h.quantile(0.99) == 0.02 and h.quantile(1.0) == 0.02
+    assert _histogram(0.003).quantile(0.5) == 0.003        # the interpolated 0.00375 is clamped to the only value
+
+def test_quantiles_across_buckets():
+    h = _histogram(*([0.001] * 90 + [0.5] * 10))
+    assert h.quantile(0.5) == pytest.approx(0.0005 + 0.0005 * 50 / 90)
+    assert h.quantile(0.9) == pytest.approx(0.001)
+    assert 0.25 < h.quantile(0.95) <= 0.5
+    qs = [h.quantile(q / 100) for q in range(101)]
+    assert qs == sorted(qs)
+
+def test_values_beyond_the_last_bucket_interpolate_up_to_the_max():
+    h = _histogram(150.0, 300.0)
+    assert h.counts[-1] == 2
+    assert h.quantile(0.5) == pytest.approx(120.0 + (300.0 - 120.0) * 0.5) and h.quantile(1.0) == 300.0
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"(?:,|(?=\})))*\})? (\S+)$')
+
+def _parse_exposition(text):
+    """[(family, type, [(name, labels text, value)])] of a text exposition, checking the syntax."""
+    assert text.endswith('\n')
+    families = []
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in ('counter', 'histogram') and name not in [f[0] for f in families], line
+            families.append((name, kind, [])); continue
+        m = SAMPLE_RE.match(line)
+        assert m, f"bad sample line: {line!r}"
+        name, labels, value = m.group(1), m.group(2) or '', float(m.group(3))
+        family, kind, samples = families[-1]                  # samples follow their own TYPE line
+        assert name == family if kind == 'counter' else name in (family + '_bucket', family + '_sum', family + '_count')
+        samples.append((name, labels, value))
+    return families
+
+def test_prometheus_exposition_is_valid():
+    m = Metrics()
+    for seconds in (0.001, 0.02, 0.02, 3.0, 500.0): m.observe('remote_call', seconds, op='exec', host='login1')
+    m.observe('remote_call', 0.3, op='sftp', host='login1'); m.observe('api_call', 0.01)
+    m.add('bytes', 1024, op='exec', direction='in'); m.add('errors', 2, metric='remote_call', command='we"ird\\path\nx')
+    families = _parse_exposition(m.prometheus())
+    assert [(f, k) for f, k, _ in families] == [('hpc_api_call_seconds', 'histogram'), ('hpc_remote_call_seconds', 'histogram'),
+                                               ('hpc_bytes_total', 'counter'), ('hpc_errors_total', 'counter')]
+    remote = families[1][2]
+    exec_buckets = [(l, v) for n, l, v in remote if n.endswith('_bucket') and 'op="exec"' in l]
+    assert len(exec_buckets) == len(METRIC_BUCKETS) + 1 and exec_buckets[-1][0].endswith('le="+Inf"}')
+    assert [v for _, v in exec_buckets] == sorted(v for _, v in exec_buckets) and exec_buckets[-1][1] == 5
+    assert ('hpc_remote_call_seconds_count', '{host="login1",op="exec"}', 5.0) in remote
+    assert ('hpc_remote_call_seconds_sum', '{host="login1",op="exec"}', pytest.approx(503.041)) in remote
+    assert families[3][2] == [('hpc_errors_total', '{command="we\\"ird\\\\path\\nx",metric="remote_call"}', 2.0)]
+
+def test_prometheus_of_no_metrics_is_a_blank_document():
+    assert Metrics().prometheus() == '\n'
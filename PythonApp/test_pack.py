@@ -0,0 +1,46 @@
+"""Tests of the packed submission helpers in hpc_engine (run: python -m pytest -q)."""
+import shlex
+
+import pytest
+
+from hpc_engine import PACK_CHUNKS_PER_WORKER, build_pack_sbatch, matlab_string, pack_chunk_size, pack_paths, parse_pack_progress
+
+# Lines as hpc_pack_worker writes them: sprintf('%d\tRUNNING\t%d\t\t', ...) when a task starts and
+# sprintf('%d\t%s\t%d\t%.3f\t%s', task, status, worker, toc(t0), err) when it ends.
+PROGRESS_LOG = ("0\tRUNNING\t1\t\t\n"
+                "0\tCOMPLETED\t1\t12.345\t\n"
+                "1\tRUNNING\t1\t\t\n"
+                "1\tFAILED\t1\t0.020\tUndefined function 'f' for input arguments of type 'char'. \n"
+                "2\tRUNNING\t1\t\t")                     # the worker was killed mid-task
+
+def test_progress_lines_of_the_worker_are_parsed():
+    assert parse_pack_progress(PROGRESS_LOG) == [
+        (0, 'RUNNING', 1, None, ''), (0, 'COMPLETED', 1, 12.345, ''), (1, 'RUNNING', 1, None, ''),
+        (1, 'FAILED', 1, 0.02, "Undefined function 'f' for input arguments of type 'char'. "), (2, 'RUNNING', 1, None, '')]
+
+def test_an_error_keeps_its_tabs():
+    assert parse_pack_progress("3\tFAILED\t0\t1.500\tbad\tvalue\n") == [(3, 'FAILED', 0, 1.5, 'bad\tvalue')]
+
+@pytest.mark.parametrize('line', ['', 'garbage', '4\tCOMPLETED\t0', '4\tDONE\t0\t1.000\t', 'x\tCOMPLETED\t0\t1.000\t',
+                                  '4\tCOMPLETED\t0\tnan?\t', '4\tCOMPLETED\tw\t1.000\t'])
+def test_malformed_and_unknown_lines_are_skipped(line):
+    assert parse_pack_progress(f"{line}\n5\tCOMPLETED\t2\t0.500\t\n") == [(5, 'COMPLETED', 2, 0.5, '')]
+
+@pytest.mark.parametrize('ntasks, workers, chunk', [(0, 4, 1), (1, 4, 1), (32, 4, 1), (33, 4, 2), (1000, 4, 32), (1000, 1, 125)])
+def test_chunk_size(ntasks, workers, chunk):
+    assert pack_chunk_size(ntasks, workers) == chunk
+
+@pytest.mark.parametrize('ntasks', [128, 997, 5000, 100_003])
+def test_every_worker_gets_about_its_share_of_chunks(ntasks):
+    chunks = -(-ntasks // pack_chunk_size(ntasks, 16))
+    assert 16 * PACK_CHUNKS_PER_WORKER // 2 < chunks <= 16 * PACK_CHUNKS_PER_WORKER
+
+def test_paths_with_quotes_and_spaces_survive_shell_and_matlab_quoting():
+    shared = "/shared/it's a dir"; paths = pack_paths(shared, 'fit_1')
+    sbatch = build_pack_sbatch('fit', '/work', '/work/%j.out', 4, '4G', shared, 'fit', paths, 3)
+    argv = shlex.split(next(l for l in sbatch.splitlines() if l.startswith('srun ')))
+    command = argv[argv.index('-r') + 1]
+    assert len(argv) == argv.index('-r') + 2
+    assert command == (f"try, addpath({matlab_string(paths['inputs'])}); hpc_pack_worker('fit', "
+                       f"'/shared/it''s a dir/inputs/fit_1', '/shared/it''s a dir/locks/fit_1', '/shared/it''s a dir/outputs/fit_1', 3); "
+                       "catch e, disp(getReport(e)); exit(1); end; exit(0)")
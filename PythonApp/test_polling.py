@@ -0,0 +1,95 @@
+"""Tests of the adaptive poll schedule and the remote call budget in hpc_engine (run: python -m pytest -q)."""
+import pytest
+
+import hpc_engine as hpc
+from hpc_engine import (CLUSTER_POLL_IDLE, JOB_POLL_BACKOFF, JOB_POLL_FAST, JOB_POLL_MAX, POLL_COALESCE, POLL_INTERVAL, POLL_JITTER,
+                        CallBudget, ClusterConnection, PollPlan)
+
+@pytest.fixture
+def plan(monkeypatch):
+    monkeypatch.setattr(hpc, 'jittered', lambda interval: interval)
+    return PollPlan()
+
+def test_new_jobs_are_due_after_the_fast_interval(plan):
+    plan.sync({'1', '2'}, now=100.0)
+    assert plan.due_jobs(100.0) == []
+    assert sorted(plan.due_jobs(100.0 + JOB_POLL_FAST)) == ['1', '2']
+    plan.sync({'2'}, now=101.0)
+    assert list(plan.jobs) == ['2']
+
+def test_polls_due_soon_share_the_call(plan):
+    plan.sync({'1'}, now=0.0); plan.sync({'1', '2'}, now=POLL_COALESCE / 2); plan.sync({'1', '2', '3'}, now=POLL_COALESCE * 2)
+    assert sorted(plan.due_jobs(JOB_POLL_FAST)) == ['1', '2']
+
+def test_quiet_jobs_back_off_to_the_ceiling_of_their_state(plan):
+    plan.sync({'r', 'p'}, now=0.0); intervals = []
+    for i in range(12):
+        plan.job_polled('r', 'RUNNING', False, now=0.0); plan.job_polled('p', 'PENDING', False, now=0.0)
+        intervals.append(plan.jobs['r'][0])
+    assert intervals[:2] == [JOB_POLL_FAST * JOB_POLL_BACKOFF, JOB_POLL_FAST * JOB_POLL_BACKOFF ** 2]
+    assert intervals == sorted(intervals) and intervals[-1] == JOB_POLL_MAX['RUNNING']
+    assert plan.jobs['p'] == [JOB_POLL_MAX['PENDING'], JOB_POLL_MAX['PENDING']]
+
+def test_a_transition_resets_the_job_to_the_fast_interval(plan):
+    plan.sync({'1'}, now=0.0)
+    for _ in range(5): plan.job_polled('1', 'RUNNING', False, now=0.0)
+    plan.job_polled('1', 'COMPLETING', True, now=50.0)
+    assert plan.jobs['1'] == [JOB_POLL_FAST, 50.0 + JOB_POLL_FAST]
+
+def test_hurry_brings_every_poll_forward(plan):
+    plan.sync({'1', '2'}, now=0.0)
+    for _ in range(8): plan.job_polled('1', 'PENDING', False, now=0.0)
+    for _ in range(8): plan.cluster_polled(True, now=0.0)
+    assert plan.cluster_interval == CLUSTER_POLL_IDLE
+    plan.hurry(now=10.0)
+    assert plan.jobs['1'] == [JOB_POLL_FAST, 10.0 + JOB_POLL_FAST] and plan.jobs['2'] == [JOB_POLL_FAST, JOB_POLL_FAST]
+    assert (plan.cluster_interval, plan.cluster_due) == (POLL_INTERVAL, 10.0 + JOB_POLL_FAST)
+
+def test_cluster_polls_back_off_only_while_the_queue_is_empty(plan):
+    plan.cluster_polled(True, now=0.0)
+    assert plan.cluster_interval == POLL_INTERVAL * JOB_POLL_BACKOFF
+    plan.cluster_polled(False, now=5.0)
+    assert (plan.cluster_interval, plan.cluster_due) == (POLL_INTERVAL, 5.0 + POLL_INTERVAL)
+
+def test_refused_polls_are_deferred(plan):
+    plan.sync({'1'}, now=0.0)
+    plan.defer(['1'], True, until=20.0)
+    assert plan.due_jobs(JOB_POLL_FAST) == [] and plan.next_due(True, True) == 20.0
+    plan.defer(['1'], False, until=5.0)                    # never brings a poll forward
+    assert plan.jobs['1'][1] == 20.0
+    assert plan.next_due(False, False) is None
+
+def test_jitter_stays_within_bounds():
+    values = [hpc.jittered(10.0) for _ in range(200)]
+    assert all(10.0 * (1 - POLL_JITTER) <= v <= 10.0 * (1 + POLL_JITTER) for v in values) and len(set(values)) > 1
+
+class FakeClock:
+    def __init__(self): self.now = 1000.0
+    def __call__(self): return self.now
+
+def test_budget_grants_a_burst_then_makes_callers_wait():
+    clock = FakeClock(); budget = CallBudget(rate=60, burst=4, clock=clock)
+    assert [budget.take() for _ in range(4)] == [0.0] * 4
+    assert budget.take() == pytest.approx(1.0)
+    assert budget.take(3) == pytest.approx(3.0)
+
+def test_budget_refills_with_time_up_to_the_burst():
+    clock = FakeClock(); budget = CallBudget(rate=60, burst=4, clock=clock)
+    budget.take(4)
+    clock.now += 2.5
+    assert budget.take(2) == 0.0 and budget.take() == pytest.approx(0.5)
+    clock.now += 3600
+    assert budget.take(4) == 0.0 and budget.take() == pytest.approx(1.0)
+
+def test_a_refused_take_spends_nothing():
+    clock = FakeClock(); budget = CallBudget(rate=30, burst=2, clock=clock)
+    assert budget.take(3) == pytest.approx(2.0)
+    assert budget.take(2) == 0.0
+
+def test_monitor_kinds_are_claimed_and_released():
+    conn = ClusterConnection('c1', {'host': 'h'}, None)
+    assert not conn.is_busy()
+    conn.claim({'jobs', 'cluster'})
+    assert conn.is_busy() and conn.is_busy('jobs') and not conn.is_busy('packs')
+    conn.release({'jobs', 'cluster'})
+    assert not conn.is_busy()
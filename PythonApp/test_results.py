@@ -0,0 +1,45 @@
+"""Tests of the result cache quota in hpc_engine (run: python -m pytest -q)."""
+import pytest
+
+import hpc_engine as hpc
+from hpc_engine import SQL_TOUCH_RESULT, ResultCache, Storage
+
+SIZE = 300
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """A cache with a 1000 byte quota over a fresh catalog."""
+    storage = Storage(tmp_path / 'test.db'); monkeypatch.setattr(hpc, '_storage', storage)
+    yield ResultCache(tmp_path / 'results', quota_gb=1e-6)
+    storage.close()
+
+def _fetch(cache, jobid, name, last_access):
+    """Catalogue a SIZE byte file of a job as last used at `last_access`."""
+    path = cache.job_dir('c1', jobid) / name
+    path.parent.mkdir(parents=True, exist_ok=True); path.write_bytes(b'x' * SIZE)
+    cache.record_file('c1', jobid, f"/remote/{jobid}/{name}", path, 1700000000)
+    hpc._storage.transaction(lambda c: c.execute(SQL_TOUCH_RESULT, (float(last_access), str(path))))
+    return path
+
+def test_trim_evicts_the_least_recently_used_unpinned_files(cache):
+    hpc._storage.pin_results(True, cluster='c1', jobid='1')      # pins files of job 1 fetched later too
+    a = _fetch(cache, '1', 'a.mat', 1); b = _fetch(cache, '2', 'b.mat', 2); c = _fetch(cache, '2', 'c.mat', 3)
+    d = _fetch(cache, '3', 'd.mat', 4); e = _fetch(cache, '3', 'e.mat', 5); f = _fetch(cache, '3', 'f.mat', 6)
+    hpc._storage.pin_results(True, path=d)
+    assert cache.usage()['bytes'] == 6 * SIZE and cache.usage()['pinned_bytes'] == 2 * SIZE
+    assert cache.trim() == (3, 3 * SIZE)                       # 800 bytes over: b, c then e
+    assert [p.exists() for p in (a, b, c, d, e, f)] == [True, False, False, True, False, True]
+    assert not cache.job_dir('c1', '2').exists()                # emptied folders are pruned
+    assert sorted(r[0] for r in hpc._storage.results()) == sorted(str(p) for p in (a, d, f))
+    assert cache.trim() == (0, 0)
+
+def test_trim_never_evicts_pinned_files_even_over_quota(cache):
+    hpc._storage.pin_results(True, cluster='c1', jobid='1')
+    paths = [_fetch(cache, '1', f"{i}.mat", i) for i in range(5)]
+    assert cache.trim() == (0, 0)
+    assert all(p.exists() for p in paths) and cache.usage()['bytes'] == 5 * SIZE
+
+def test_a_stale_eviction_keeps_the_row_of_a_refetched_file(cache):
+    old = _fetch(cache, '1', 'a.mat', 1)
+    hpc._storage.forget_results([(str(old), SIZE, 0.5)])       # a stale eviction row: last_access has moved on
+    assert [r[0] for r in hpc._storage.results()] == [str(old)]
@@ -0,0 +1,37 @@
+"""Tests of the retry policy of the pooled SSH client in hpc_engine (run: python -m pytest -q)."""
+from types import SimpleNamespace
+
+import pytest
+
+from hpc_engine import EngineError, HPCEngine, SSHClientEnhanced
+
+class DroppingConn:
+    """A pooled connection whose transport dies during every command."""
+    def __init__(self): self.client = self; self.commands = []
+    def alive(self): return False
+    def close(self): pass
+    def exec_command(self, cmd, timeout=None):
+        self.commands.append(cmd); raise EOFError('transport dropped')
+
+@pytest.fixture
+def dropping():
+    ssh = SSHClientEnhanced('fake', 'me'); conn = DroppingConn()
+    ssh._closed = False; ssh._acquire = lambda timeout=None: conn; ssh._release = lambda c, broken=False: None
+    return ssh, conn
+
+def test_exec_retries_once_on_a_dead_transport(dropping):
+    ssh, conn = dropping
+    with pytest.raises(EOFError): ssh.exec('squeue')
+    assert conn.commands == ['squeue', 'squeue']
+
+def test_exec_without_retry_runs_the_command_once(dropping):
+    ssh, conn = dropping
+    with pytest.raises(EOFError): ssh.exec('sbatch job.sh', retry=False)
+    assert conn.commands == ['sbatch job.sh']
+
+def test_sbatch_on_a_dropped_transport_reports_unknown_state(dropping):
+    ssh, conn = dropping
+    with pytest.raises(EngineError) as exc:
+        HPCEngine._sbatch(None, SimpleNamespace(name='c1', ssh=ssh), '/home/me/job 1.sh')
+    assert exc.value.kind == 'submission_unknown'
+    assert conn.commands == ["sbatch '/home/me/job 1.sh'"]
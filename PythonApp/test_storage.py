@@ -0,0 +1,113 @@
+"""Tests of the SQLite storage layer in hpc_engine against a temporary database (run: python -m pytest -q)."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from hpc_engine import POWER_RAW_RETENTION_DAYS, POWER_ROLLUP_SECONDS, Storage
+
+@pytest.fixture
+def storage(tmp_path):
+    s = Storage(tmp_path / 'test.db')
+    yield s
+    s.close()
+
+# ---------- power rollups ----------
+BUCKET = datetime(2026, 1, 5, 12, 0, 0)          # on a rollup bucket boundary
+LATER = BUCKET + timedelta(days=POWER_RAW_RETENTION_DAYS + 1)
+
+def _roll_up(storage, samples):
+    for offset, power, util in samples:
+        storage.queue_power(BUCKET + timedelta(seconds=offset), power, util)
+    storage.flush(); storage.apply_retention(now=LATER)
+    return storage.execute('SELECT power, util, est_flops, samples, power_samples FROM power_history_rollup')
+
+def test_rollup_averages_ignore_missing_samples(storage):
+    assert _roll_up(storage, [(0, 100.0, 0.5), (10, None, 0.7), (20, 200.0, None)]) == [(150.0, 0.6, None, 3, 2)]
+    assert storage.execute('SELECT COUNT(*) FROM power_history') == [(0,)]
+
+def test_rollup_merge_is_weighted_by_non_null_samples(storage):
+    _roll_up(storage, [(0, 100.0, 0.5), (10, None, 0.5)])
+    # a late batch into the same bucket: one NULL must not erase the earlier average
+    power, util, flops, samples, power_samples = _roll_up(storage, [(20, None, 1.0), (30, 400.0, 1.0)])[0]
+    assert (power, power_samples, samples, flops) == (250.0, 2, 4, None)
+    assert util == pytest.approx(0.75)
+
+def test_rollup_merge_of_all_null_column_stays_null(storage):
+    _roll_up(storage, [(0, None, 0.5)])
+    assert _roll_up(storage, [(10, None, 0.5)])[0][:2] == (None, 0.5)
+
+def test_rollup_merges_into_rows_from_before_per_column_counts(storage):
+    storage.execute('INSERT INTO power_history_rollup (bucket_ts, power, util, est_flops, samples) VALUES (?, 100.0, 0.5, NULL, 2)',
+                    (BUCKET.isoformat(),))
+    power, _, _, samples, power_samples = _roll_up(storage, [(0, 400.0, 0.5)])[0]
+    assert (power, samples, power_samples) == (200.0, 3, 3)
+
+def test_rollup_buckets_by_width(storage):
+    rows = _roll_up(storage, [(0, 100.0, 0.5), (POWER_ROLLUP_SECONDS, 300.0, 0.5)])
+    assert [r[0] for r in rows] == [100.0, 300.0]
+
+# ---------- job history ----------
+SAME_TIME = '2026-01-05T12:00:00'
+
+def _fill(storage, n):
+    """n jobs submitted at the same instant, alternately of scripts alpha and beta, with
+    elapsed times 0..2 (many ties) and every fifth job unaccounted."""
+    for i in range(n):
+        storage.insert_job(str(1000 + i), f"/home/me/hpc_jobs/{'alpha' if i % 2 else 'beta'}_job_{i}.sh", f"/home/me/o_{i}.out",
+                           f"Submitted batch job {1000 + i}", cluster='c1')
+    storage.execute('UPDATE jobs SET submitted_at = ?, elapsed_s = CASE WHEN id % 5 = 0 THEN NULL ELSE id % 3 END', (SAME_TIME,))
+
+def _all_pages(storage, limit, **filters):
+    rows, after = [], None
+    for _ in range(100):
+        page = storage.job_history(after=after, limit=limit, **filters)
+        rows += page['rows']; after = page['next']
+        if after is None: return rows
+    raise AssertionError("paging did not end")
+
+@pytest.mark.parametrize('sort, descending', [('submitted', True), ('submitted', False), ('elapsed', True), ('elapsed', False)])
+def test_history_pages_cover_every_row_once_in_order(storage, sort, descending):
+    _fill(storage, 23)
+    rows = _all_pages(storage, 5, sort=sort, descending=descending)
+    assert [r[0] for r in rows] == [r[0] for r in storage.job_history(sort=sort, descending=descending, limit=100)['rows']]
+    key = (lambda r: r[0]) if sort == 'submitted' else (lambda r: (-1 if r[6] is None else r[6], r[0]))
+    assert rows == sorted(rows, key=key, reverse=descending) and len({r[0] for r in rows}) == 23
+
+def test_history_page_boundary_on_an_exact_multiple(storage):
+    _fill(storage, 10)
+    first = storage.job_history(limit=5); second = storage.job_history(after=first['next'], limit=5)
+    assert second['next'] is not None and storage.job_history(after=second['next'], limit=5) == {'rows': [], 'next': None}
+
+def test_history_cursor_is_stable_while_jobs_are_added(storage):
+    _fill(storage, 12)
+    first = storage.job_history(limit=5)
+    _fill(storage, 3)                                   # newer jobs land before the first page, not in the next one
+    second = storage.job_history(after=first['next'], limit=5)
+    assert [r[0] for r in second['rows']] == [r[0] - 5 for r in first['rows']]
+
+@pytest.fixture(params=['fts', 'like'])
+def searchable(request, storage):
+    if request.param == 'fts' and not storage.fts: pytest.skip("sqlite3 built without FTS5")
+    if request.param == 'like': storage.fts = False
+    return storage
+
+def test_history_text_search(searchable):
+    _fill(searchable, 12)
+    alpha = _all_pages(searchable, 4, text='alpha')
+    assert len(alpha) == 6 and all(r[3] == 'alpha' for r in alpha)
+    assert [r[1] for r in searchable.job_history(text='1007')['rows']] == ['1007']
+    assert [r[1] for r in searchable.job_history(text='alpha 1003')['rows']] == ['1003']
+    assert searchable.job_history(text='gamma')['rows'] == []
+
+def test_history_search_combines_with_filters(searchable):
+    _fill(searchable, 12)
+    searchable.update_statuses([('1001', 'FAILED'), ('1002', 'FAILED')], 'c1')
+    assert [r[1] for r in searchable.job_history(text='alpha', status='FAILED')['rows']] == ['1001']
+    assert searchable.job_history(text='alpha', cluster='other')['rows'] == []
+    assert len(searchable.job_history(text='alpha', until=SAME_TIME[:10])['rows']) == 6
+    assert searchable.job_history(text='alpha', since='2026-01-06')['rows'] == []
+
+def test_like_fallback_takes_wildcards_literally(storage):
+    _fill(storage, 12); storage.fts = False
+    assert storage.job_history(text='10_3')['rows'] == [] and storage.job_history(text='%')['rows'] == []
+    assert [r[1] for r in storage.job_history(text='c1 beta_job_4')['rows']] == ['1004']
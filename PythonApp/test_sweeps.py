@@ -0,0 +1,35 @@
+"""Tests of the parameter sweep parsers in hpc_engine (run: python -m pytest -q)."""
+import pytest
+
+from hpc_engine import expand_sweep_values, parse_param_grid
+
+def test_integer_range():
+    assert expand_sweep_values('1:3') == ['1', '2', '3']
+    assert expand_sweep_values('10:-3:1') == ['10', '7', '4', '1']
+
+def test_float_range_has_no_binary_rounding_noise():
+    assert expand_sweep_values('0:0.1:1') == ['0', '0.1', '0.2', '0.3', '0.4', '0.5', '0.6', '0.7', '0.8', '0.9', '1']
+    assert expand_sweep_values('-1:0.25:0') == ['-1', '-0.75', '-0.5', '-0.25', '0']
+    assert expand_sweep_values('1e-3:1e-3:3e-3') == ['0.001', '0.002', '0.003']
+
+def test_literal_lists():
+    assert expand_sweep_values('0.1, 0.2') == ['0.1', '0.2']
+    assert expand_sweep_values("'lin','log'") == ["'lin'", "'log'"]
+    assert expand_sweep_values("'a:b'") == ["'a:b'"]
+
+@pytest.mark.parametrize('spec', ['3:1', '1:0:3', '1:-1:3', 'inf:1', '1,,2'])
+def test_empty_or_invalid_axis(spec):
+    with pytest.raises(ValueError):
+        expand_sweep_values(spec)
+
+def test_grid_is_cartesian_product_in_axis_order():
+    assert parse_param_grid("alpha=0.1,0.2; mode='lin','log'") == ["0.1, 'lin'", "0.1, 'log'", "0.2, 'lin'", "0.2, 'log'"]
+    assert parse_param_grid('a=0:0.5:1') == ['0', '0.5', '1']
+
+def test_grid_empty_and_malformed():
+    assert parse_param_grid('') == []
+    assert parse_param_grid(' ; ') == []
+    with pytest.raises(ValueError):
+        parse_param_grid('alpha 1:3')
+    with pytest.raises(ValueError):
+        parse_param_grid('a=3:1')
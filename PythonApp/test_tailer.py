@@ -0,0 +1,56 @@
+"""Tests of job output tailing in hpc_engine against an in-memory SFTP server (run: python -m pytest -q)."""
+import io
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import hpc_engine as hpc
+from hpc_engine import OutputTailer, Storage
+
+class FakeFile(io.BytesIO):
+    def prefetch(self, size=None): pass
+
+class FakeSFTP:
+    def __init__(self, files): self.files = files
+    def stat(self, path):
+        if path not in self.files: raise IOError(path)
+        return SimpleNamespace(st_size=len(self.files[path]), st_mtime=1700000000)
+    def open(self, path, mode='rb'): return FakeFile(self.files[path])
+
+class FakeSSH:
+    hostname = 'fake'
+    def __init__(self): self.files = {}
+    @contextmanager
+    def sftp_session(self, timeout=None): yield FakeSFTP(self.files)
+
+@pytest.fixture
+def results(tmp_path, monkeypatch):
+    storage = Storage(tmp_path / 'test.db')
+    monkeypatch.setattr(hpc.RESULTS, 'root', tmp_path / 'results'); monkeypatch.setattr(hpc, '_storage', storage)
+    yield tmp_path / 'results'
+    storage.close()
+
+OUT = '/home/me/job_1001.out'
+TEXT = 'résumé → 完成 ✓\n'.encode('utf-8')
+
+def test_characters_split_across_chunks_are_decoded_whole(results):
+    ssh = FakeSSH(); ssh.files[OUT] = TEXT; tailer = OutputTailer(max_chunk=3)
+    text = ''.join(tailer.poll(ssh, [('1001', OUT)], 'c1').get('1001', '') for _ in range(len(TEXT)))
+    assert text == TEXT.decode('utf-8') and '�' not in text
+    assert (results / 'c1' / '1001' / 'job_1001.out').read_bytes() == TEXT
+
+def test_finalize_flushes_an_incomplete_trailing_character(results):
+    ssh = FakeSSH(); ssh.files[OUT] = TEXT[:2]; tailer = OutputTailer()
+    assert tailer.poll(ssh, [('1001', OUT)], 'c1') == {'1001': 'r'}
+    assert tailer.finalize(ssh, '1001', OUT, 'c1') == (True, '�')
+    assert tailer._decoders == {}
+
+def test_rewritten_file_starts_with_a_fresh_decoder(results):
+    ssh = FakeSSH(); ssh.files[OUT] = b'old output \xc3'; tailer = OutputTailer()
+    assert tailer.poll(ssh, [('1001', OUT)], 'c1') == {'1001': 'old output '}
+    ssh.files[OUT] = b'new'                    # requeued: shorter than what we hold
+    assert tailer.poll(ssh, [('1001', OUT)], 'c1') == {'1001': 'new'}
+
+def test_missing_output_is_not_found(results):
+    assert OutputTailer().finalize(FakeSSH(), '1001', OUT, 'c1') == (False, '')
@@ -0,0 +1,40 @@
+"""Tests of the bulk transfer method choice and the remote tar stream in hpc_engine (run: python -m pytest -q)."""
+import io, shlex, shutil, subprocess, tarfile
+
+import pytest
+
+from hpc_engine import TAR_GZIP_LEVEL, TAR_MIN_FILES, TAR_STREAM_CMD, Storage, TransferEngine
+
+@pytest.fixture
+def storage(tmp_path):
+    s = Storage(tmp_path / 'test.db')
+    yield s
+    s.close()
+
+def test_auto_uses_the_file_count_and_size_rule_without_measurements():
+    t = TransferEngine(None)
+    assert t.choose_method(TAR_MIN_FILES, TAR_MIN_FILES * 1000) == 'tar'
+    assert t.choose_method(TAR_MIN_FILES - 1, 1000) == 'sftp'
+    assert t.choose_method(100, 100 * (64 << 20)) == 'sftp'
+    assert TransferEngine(None, method='tar').choose_method(1, 1 << 30) == 'tar'
+
+def test_auto_prefers_the_faster_method_measured_on_similar_files(storage):
+    for _ in range(3):
+        storage.record_transfer('tar', 100, 100 * 10_000, 1.0)       # 1 MB/s on 10 kB files
+        storage.record_transfer('sftp', 100, 100 * 10_000, 0.5)      # 2 MB/s on 10 kB files
+        storage.record_transfer('tar', 4, 4 * 50_000_000, 1.0)       # 200 MB/s on 50 MB files
+    t = TransferEngine(None, rates=storage.transfer_rates)
+    assert t.choose_method(100, 100 * 12_000) == 'sftp'
+    assert t.choose_method(100, 100 * 200_000) == 'tar'             # nothing measured near 200 kB: the rule decides
+    assert storage.transfer_rates(mean_bytes=10_000) == {'tar': (1.0, 3), 'sftp': (2.0, 3)}
+    assert storage.transfer_rates()['tar'] == (pytest.approx(100.5), 6)
+
+@pytest.mark.skipif(not (shutil.which('tar') and shutil.which('gzip')), reason="needs tar and gzip")
+@pytest.mark.parametrize('names, status', [(['a.txt', 'b.txt'], 0), (['a.txt', 'missing.txt'], 2)])
+def test_tar_stream_exits_with_the_status_of_tar(tmp_path, names, status):
+    (tmp_path / 'a.txt').write_text('a\n'); (tmp_path / 'b.txt').write_text('b\n')
+    cmd = TAR_STREAM_CMD.format(dir=shlex.quote(str(tmp_path)), level=TAR_GZIP_LEVEL)
+    p = subprocess.run(['/bin/sh', '-c', cmd], input=''.join(n + '\0' for n in names).encode(), capture_output=True)
+    assert (p.returncode != 0) == bool(status)
+    with tarfile.open(fileobj=io.BytesIO(p.stdout), mode='r:gz') as tar:
+        assert tar.getnames() == [n for n in names if n != 'missing.txt']
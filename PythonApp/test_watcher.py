@@ -0,0 +1,73 @@
+"""Tests of the batched Slurm job-state watcher in hpc_engine (run: python -m pytest -q)."""
+import pytest
+
+from hpc_engine import JobStateWatcher, normalize_slurm_state, parse_sacct_states, parse_squeue_states
+
+@pytest.mark.parametrize('raw, state', [
+    ('RUNNING', 'RUNNING'), ('pending', 'PENDING'), ('CANCELLED by 501', 'CANCELLED'), ('COMPLETED+', 'COMPLETED'),
+    ('OOM', 'OUT_OF_MEMORY'), ('  ', ''), (None, ''),
+])
+def test_normalize_slurm_state(raw, state):
+    assert normalize_slurm_state(raw) == state
+
+@pytest.mark.parametrize('text, states', [
+    ('', {}),
+    ('1001 RUNNING\n1002 PENDING\n', {'1001': 'RUNNING', '1002': 'PENDING'}),
+    ('123_4 RUNNING\n123_5 COMPLETING\n', {'123_4': 'RUNNING', '123_5': 'COMPLETING'}),
+    ('1003\n\n1004 RUNNING extra\n', {'1004': 'RUNNING'}),
+])
+def test_parse_squeue_states(text, states):
+    assert parse_squeue_states(text) == states
+
+@pytest.mark.parametrize('text, states', [
+    ('', {}),
+    ('1001|COMPLETED\n1001.batch|COMPLETED\n1001.extern|COMPLETED\n', {'1001': 'COMPLETED'}),
+    ('1002|CANCELLED by 501\n', {'1002': 'CANCELLED'}),
+    ('123_4|FAILED\n123_4.batch|FAILED\n123_5|OUT_OF_MEMORY\n', {'123_4': 'FAILED', '123_5': 'OUT_OF_MEMORY'}),
+    ('|RUNNING\ngarbage\n', {}),
+])
+def test_parse_sacct_states(text, states):
+    assert parse_sacct_states(text) == states
+
+class FakeSSH:
+    """exec() answers squeue and sacct from canned outputs and records the commands."""
+    hostname = 'fake'
+    def __init__(self, squeue='', sacct=''):
+        self.squeue = squeue; self.sacct = sacct; self.commands = []
+
+    def exec(self, cmd, timeout=20, **kw):
+        self.commands.append(cmd)
+        return (self.squeue if cmd.startswith('squeue') else self.sacct), ''
+
+def test_one_squeue_call_for_all_jobs_and_sacct_only_for_the_rest():
+    ssh = FakeSSH(squeue='1001 RUNNING\n123_4 RUNNING\n', sacct='1002|CANCELLED by 7\n123_5|COMPLETED\n')
+    rows = [('1001', 'PENDING', 'o'), ('1002', 'RUNNING', 'o'), ('123_4', 'RUNNING', 'o'), ('123_5', 'RUNNING', 'o')]
+    transitions = JobStateWatcher().poll(ssh, rows)
+    assert sorted(transitions) == [('1001', 'PENDING', 'RUNNING', 'o'), ('1002', 'RUNNING', 'CANCELLED', 'o'),
+                                   ('123_5', 'RUNNING', 'COMPLETED', 'o')]
+    assert len(ssh.commands) == 2
+    assert '-j 1001,1002,123 ' in ssh.commands[0]          # array tasks are queried through their parent
+    assert '-j 1002,123 ' in ssh.commands[1]
+
+def test_known_states_spare_the_query():
+    ssh = FakeSSH()
+    assert JobStateWatcher().poll(ssh, [('1001', 'PENDING', 'o')], known={'1001': 'RUNNING'}) == [('1001', 'PENDING', 'RUNNING', 'o')]
+    assert ssh.commands == []
+
+def test_job_missing_everywhere_becomes_unknown_after_the_grace_period():
+    ssh = FakeSSH(); watcher = JobStateWatcher(grace_cycles=3); rows = [('1001', 'RUNNING', 'o')]
+    assert watcher.poll(ssh, rows) == []
+    assert watcher.poll(ssh, rows) == []
+    assert watcher.poll(ssh, rows) == [('1001', 'RUNNING', 'UNKNOWN', 'o')]
+
+def test_grace_period_restarts_when_the_job_reappears():
+    watcher = JobStateWatcher(grace_cycles=2); rows = [('1001', 'RUNNING', 'o')]
+    assert watcher.poll(FakeSSH(), rows) == []
+    assert watcher.poll(FakeSSH(squeue='1001 RUNNING\n'), rows) == []
+    assert watcher.poll(FakeSSH(), rows) == []
+    assert watcher.poll(FakeSSH(), rows) == [('1001', 'RUNNING', 'UNKNOWN', 'o')]
+
+def test_rows_without_job_id_are_ignored():
+    ssh = FakeSSH()
+    assert JobStateWatcher().poll(ssh, [('', 'SUBMITTED', 'o'), (None, 'SUBMITTED', 'o')]) == []
+    assert ssh.commands == []